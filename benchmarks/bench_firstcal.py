@@ -0,0 +1,46 @@
+'''Benchmarks of hera_cal.firstcal.'''
+
+import numpy as np
+from hera_cal import firstcal, omni
+from .common import NANTS_FIRSTCAL, make_sim, sim_aa
+
+
+class RedundantBlCalSimple(object):
+    params = [[1, 60], [256, 1024]]
+    param_names = ['ntimes', 'nfreqs']
+
+    def setup(self, ntimes, nfreqs):
+        self.fqs = np.linspace(.1, .2, nfreqs, endpoint=False)
+        sim = make_sim(7, ntimes=ntimes, nfreqs=nfreqs, delay_scatter=50.)
+        bl1, bl2 = sim.reds[0][:2]
+        d, f = next(sim.iter_chunks(pols=['xx']))
+        self.d1, self.d2 = d[bl1], d[bl2]
+        self.w1, self.w2 = np.logical_not(f[bl1]), np.logical_not(f[bl2])
+
+    def time_redundant_bl_cal_simple(self, ntimes, nfreqs):
+        firstcal.redundant_bl_cal_simple(self.d1, self.w1, self.d2, self.w2, self.fqs)
+
+    def time_redundant_bl_cal_simple_average(self, ntimes, nfreqs):
+        firstcal.redundant_bl_cal_simple(self.d1, self.w1, self.d2, self.w2, self.fqs, average=True)
+
+
+class FirstCal(object):
+    params = NANTS_FIRSTCAL
+    param_names = ['nants']
+    timeout = 600
+
+    def setup(self, nants):
+        sim = make_sim(nants, ntimes=4, nfreqs=256, delay_scatter=50.)
+        uvd, aa = sim_aa(sim)
+        self.info = omni.aa_to_info(aa, pols=['x'], fcal=True)
+        self.data, flags = firstcal.UVData_to_dict([uvd])
+        self.wgts = {k: {p: np.logical_not(flags[k][p]) for p in flags[k]} for k in flags}
+        self.fqs = uvd.freq_array[0, :] / 1e9
+
+    def time_run(self, nants):
+        fc = firstcal.FirstCal(self.data, self.wgts, self.fqs, self.info)
+        fc.run(finetune=True, average=False, window='none')
+
+    def peakmem_run(self, nants):
+        fc = firstcal.FirstCal(self.data, self.wgts, self.fqs, self.info)
+        fc.run(finetune=True, average=False, window='none')
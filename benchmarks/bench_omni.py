@@ -0,0 +1,76 @@
+'''Benchmarks of hera_cal.omni: omnical, gain application and calibration file I/O.'''
+
+import os
+import numpy as np
+from hera_cal import omni
+from .common import NANTS, make_sim, sim_data, nested, sim_aa, delay_gains, write_calfits
+
+
+class RunOmnical(object):
+    params = NANTS
+    param_names = ['nants']
+    timeout = 600
+
+    def setup(self, nants):
+        sim = make_sim(nants, ntimes=2, nfreqs=64)
+        uvd, aa = sim_aa(sim)
+        self.info = omni.aa_to_info(aa, pols=['x'])
+        data, flags = sim_data(sim)
+        self.data = nested(data)
+        self.gains0 = {'x': {ant: g for (ant, antpol), g in delay_gains(sim).items()}}
+
+    def time_run_omnical(self, nants):
+        omni.run_omnical(self.data, self.info, gains0=self.gains0)
+
+    def peakmem_run_omnical(self, nants):
+        omni.run_omnical(self.data, self.info, gains0=self.gains0)
+
+
+class OmniApply(object):
+    params = NANTS
+    param_names = ['nants']
+    timeout = 600
+
+    def setup_cache(self):
+        # runs once, in a scratch directory that the benchmarks also run in
+        files = {}
+        for nants in NANTS:
+            outdir = 'nants{0}'.format(nants)
+            os.mkdir(outdir)
+            sim = make_sim(nants, ntimes=10, nfreqs=256)
+            fn = sim.write(outdir)[0]
+            calfile, fcfile = fn + '.omni.calfits', fn + '.first.calfits'
+            write_calfits(sim, sim.true_gains(), calfile)
+            write_calfits(sim, delay_gains(sim), fcfile)
+            files[nants] = (fn, calfile, fcfile, outdir)
+        return files
+
+    def setup(self, files, nants):
+        fn, calfile, fcfile, outdir = files[nants]
+        o = omni.get_optionParser('omni_apply')
+        self.opts, self.files = o.parse_args(['-p', 'xx', '--omnipath', calfile, '--extension', 'O',
+                                              '--outpath', outdir, '--overwrite', fn])
+
+    def time_omni_apply(self, files, nants):
+        omni.omni_apply(self.files, self.opts)
+
+    def peakmem_omni_apply(self, files, nants):
+        omni.omni_apply(self.files, self.opts)
+
+    def time_from_fits(self, files, nants):
+        omni.from_fits(files[nants][2])
+
+
+class MakeUVDataVis(object):
+    params = NANTS
+    param_names = ['nants']
+
+    def setup(self, nants):
+        sim = make_sim(nants, ntimes=10, nfreqs=256)
+        uvd, self.aa = sim_aa(sim)
+        self.meta = {'times': sim.times, 'lsts': uvd.lst_array[::uvd.Nbls], 'freqs': sim.freqs,
+                     'inttime': 10.7, 'history': ''}
+        self.vis = {'xx': {bls[0][:2]: sim.true_vis(bls[0]) for bls in sim.reds}}
+
+    def time_make_uvdata_vis(self, nants):
+        omni.make_uvdata_vis(self.aa, self.meta, self.vis)
@@ -0,0 +1,91 @@
+'''Benchmarks of hera_cal.redcal.'''
+
+import numpy as np
+from hera_cal import redcal, simulate
+from .common import NANTS, make_sim, sim_data, delay_gains
+
+
+class GetPosReds(object):
+    params = [19, 37, 127, 350]
+    param_names = ['nants']
+
+    def setup(self, nants):
+        self.antpos = simulate.hex_array(nants)
+
+    def time_get_pos_reds(self, nants):
+        redcal.get_pos_reds(self.antpos)
+
+    def peakmem_get_pos_reds(self, nants):
+        redcal.get_pos_reds(self.antpos)
+
+
+class RedundantCalibrator(object):
+    params = [NANTS, ['linsolve', 'array']]
+    param_names = ['nants', 'backend']
+    timeout = 600
+
+    def setup(self, nants, backend):
+        if backend == 'linsolve' and nants > 37:
+            raise NotImplementedError('linsolve lincal takes too long at this size')
+        self.sim = make_sim(nants, ntimes=1, nfreqs=16)
+        self.data, flags = sim_data(self.sim)
+        self.sol0 = delay_gains(self.sim)
+        self.rc = redcal.RedundantCalibrator(self.sim.reds)
+        self.logcal_sol = self.rc.logcal(self.data, sol0=self.sol0, backend=backend)
+        meta, self.lincal_sol = self.rc.lincal(self.data, self.logcal_sol, backend=backend)
+
+    def time_logcal(self, nants, backend):
+        self.rc.logcal(self.data, sol0=self.sol0, backend=backend)
+
+    def peakmem_logcal(self, nants, backend):
+        self.rc.logcal(self.data, sol0=self.sol0, backend=backend)
+
+    def time_lincal(self, nants, backend):
+        self.rc.lincal(self.data, self.logcal_sol, backend=backend)
+
+    def peakmem_lincal(self, nants, backend):
+        self.rc.lincal(self.data, self.logcal_sol, backend=backend)
+
+    def time_remove_degen(self, nants, backend):
+        self.rc.remove_degen(self.sim.antpos, self.lincal_sol)
+
+    def track_lincal_chisq(self, nants, backend):
+        meta, sol = self.rc.lincal(self.data, self.logcal_sol, backend=backend)
+        return float(np.mean(meta['chisq']))
+    track_lincal_chisq.unit = 'chisq'
+
+
+class SinglePrecision(object):
+    '''Accuracy cost of calibrating complex64 instead of complex128 data.'''
+    params = NANTS
+    param_names = ['nants']
+    timeout = 600
+
+    def setup(self, nants):
+        sim = make_sim(nants, ntimes=1, nfreqs=16, dtype=np.complex128)
+        self.data128, flags = sim_data(sim)
+        self.data = {k: v.astype(np.complex64) for k, v in self.data128.items()}
+        self.sol0 = delay_gains(sim)
+        self.rc = redcal.RedundantCalibrator(sim.reds)
+        self.logcal_sol = self.rc.logcal(self.data128, sol0=self.sol0, backend='array')
+
+    def _max_rel_err(self, cal):
+        sol64 = cal(self.data)
+        sol128 = cal(self.data128)
+        return max([np.max(np.abs(sol64[k] - sol128[k]) / np.abs(sol128[k])) for k in sol128.keys()])
+
+    def track_logcal_rel_err(self, nants):
+        return self._max_rel_err(lambda d: self.rc.logcal(d, sol0=self.sol0, backend='array'))
+    track_logcal_rel_err.unit = 'relative error'
+
+    def track_lincal_rel_err(self, nants):
+        def cal(d):
+            return self.rc.lincal(d, self.rc.logcal(d, sol0=self.sol0, backend='array'), backend='array')[1]
+        return self._max_rel_err(cal)
+    track_lincal_rel_err.unit = 'relative error'
+
+    def time_lincal_complex64(self, nants):
+        self.rc.lincal(self.data, self.logcal_sol, backend='array')
+
+    def time_lincal_complex128(self, nants):
+        self.rc.lincal(self.data128, self.logcal_sol, backend='array')
@@ -0,0 +1,56 @@
+'''Synthetic inputs shared by the benchmarks.'''
+
+import numpy as np
+from hera_cal import simulate, utils, cal_formats
+
+# array sizes benchmarked, and the (smaller) ones used for the slow, pair-based firstcal
+NANTS = [19, 37, 127]
+NANTS_FIRSTCAL = [19, 37]
+
+
+def make_sim(nants, ntimes=4, nfreqs=256, pols=['xx'], **kwargs):
+    '''RedundantSimulator of a nants hex array with a little noise.'''
+    kwargs.setdefault('noise_amp', .01)
+    return simulate.RedundantSimulator(simulate.hex_array(nants), pols=pols, ntimes=ntimes, nfreqs=nfreqs, **kwargs)
+
+
+def sim_data(sim):
+    '''Return the visibilities and flags of sim as {(i,j,pol): np.array} dictionaries.'''
+    data, flags = {}, {}
+    for d, f in sim.iter_chunks():
+        for bl in d.keys():
+            data[bl], flags[bl] = d[bl], f[bl]
+    return data, flags
+
+
+def nested(data):
+    '''Convert {(i,j,pol): np.array} to the {(i,j): {pol: np.array}} format of omni and firstcal.'''
+    d = {}
+    for (i, j, pol), v in data.items():
+        d.setdefault((i, j), {})[pol] = v
+    return d
+
+
+def sim_aa(sim):
+    '''Return a UVData object of the first polarization of sim and the AntennaArray
+    that omni_run and firstcal_run would build from it.'''
+    uvd = sim.to_uvdata(sim.pols[0])
+    return uvd, utils.get_aa_from_uv(uvd)
+
+
+def delay_gains(sim):
+    '''The delay-only part of the true gains, i.e. an ideal firstcal solution, keyed by (ant, antpol).'''
+    gains = {}
+    for ant in sim.ants:
+        gains[ant] = np.exp(-2j * np.pi * sim.freqs / 1e9 * sim.delay(ant)) * np.ones(sim.shape)
+    return gains
+
+
+def write_calfits(sim, gains, filename):
+    '''Write {(ant, antpol): np.array} gains of sim to a calfits file.'''
+    meta = {'times': sim.times, 'freqs': sim.freqs, 'inttime': 10.7}
+    g = {}
+    for (ant, antpol), v in gains.items():
+        g.setdefault(antpol, {})[ant] = np.asarray(v)
+    hc = cal_formats.HERACal(meta, g)
+    hc.write_calfits(filename, clobber=True)
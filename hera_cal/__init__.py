@@ -2,6 +2,8 @@ import utils
 import omni
 import firstcal
 import redcal
+import simulate
+import profiling
 import cal_formats
 import version
 
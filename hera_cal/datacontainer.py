@@ -1,8 +1,17 @@
+import os
+import glob
 import numpy as np
+from collections import OrderedDict
+from copy import copy
 
 
-class DataContainer:
-    """Object that abstracts away the pol/ant pair ordering of data dict's."""
+class DataContainer(object):
+    """Object that abstracts away the pol/ant pair ordering of data dict's.
+
+    Per-pol and per-bl indexes of the stored keys, and a map from conjugated keys to the stored
+    keys they refer to, are kept up to date as keys are set or deleted, so that lookups do not
+    have to scan all keys. bls() and pols() may return these index sets themselves, so copy them
+    before modifying them."""
 
     def __init__(self, data):
         """
@@ -11,7 +20,9 @@ class DataContainer:
                 in any order.
         """
         self._data = {}
-        if type(data.keys()[0]) is str:  # Nested POL:{bls}
+        if len(data) == 0:
+            pass
+        elif type(data.keys()[0]) is str:  # Nested POL:{bls}
             for pol in data.keys():
                 for bl in data[pol]:
                     self._data[self.mk_key(bl, pol)] = data[pol][bl]
@@ -21,9 +32,116 @@ class DataContainer:
                     self._data[self.mk_key(bl, pol)] = data[bl][pol]
         else:
             assert(len(data.keys()[0]) == 3)
-            self._data = data
-        self._bls = set([k[:2] for k in self._data.keys()])
-        self._pols = set([k[-1] for k in self._data.keys()])
+            self._data = dict(data)
+        self._build_index()
+
+    @classmethod
+    def from_uvdata(cls, uvd, bls=None, pols=None):
+        """Build containers of the data, flags and nsamples of a UVData object.
+
+        When the baseline-times are time-major, i.e. every integration repeats the baselines of
+        the first one in the same order (as in miriad files), every key of a DataContainer is a
+        (Ntimes, Nfreqs) view into the data_array, flag_array and nsample_array of uvd (of the
+        first spectral window), so nothing is copied. Otherwise the rows of each baseline are
+        copied out in time order.
+
+        Args:
+            uvd: UVData object
+            bls: only keep these (ant1,ant2) baselines, in either orientation. Default is all.
+            pols: only keep these polarizations, as strings, e.g. ['xx']. Default is all.
+
+        Returns:
+            data, flags, nsamples: containers keyed by (ant1,ant2,pol), with the baselines in
+                the orientation of uvd
+        """
+        from aipy.miriad import pol2str
+        arrays = (uvd.data_array, uvd.flag_array, uvd.nsample_array)
+        baselines = np.asarray(uvd.baseline_array)
+        if uvd.Ntimes * uvd.Nbls == uvd.Nblts and \
+                np.all(baselines.reshape(uvd.Ntimes, uvd.Nbls) == baselines[:uvd.Nbls]):
+            shape = (uvd.Ntimes, uvd.Nbls, uvd.Nspws, uvd.Nfreqs, uvd.Npols)
+            arrays = [a.reshape(shape) for a in arrays]
+            rows = range(uvd.Nbls)
+            ant_pairs = zip(uvd.ant_1_array[:uvd.Nbls].tolist(), uvd.ant_2_array[:uvd.Nbls].tolist())
+            select = lambda a, n, ip: a[:, n, 0, :, ip]
+        else:
+            order = np.lexsort((uvd.time_array, baselines))
+            first = np.unique(baselines[order], return_index=True)[1]
+            rows = np.split(order, first[1:])
+            ant_pairs = [(int(uvd.ant_1_array[r[0]]), int(uvd.ant_2_array[r[0]])) for r in rows]
+            select = lambda a, r, ip: a[r, 0, :, ip]
+        if bls is not None:
+            bls = set(bls) | set([bl[::-1] for bl in bls])
+        pol_index = [(ip, pol2str[p]) for ip, p in enumerate(uvd.polarization_array)
+                     if pols is None or pol2str[p] in pols]
+        out = [{}, {}, {}]
+        for r, bl in zip(rows, ant_pairs):
+            if bls is not None and bl not in bls:
+                continue
+            for ip, pol in pol_index:
+                for o, a in zip(out, arrays):
+                    o[bl + (pol,)] = select(a, r, ip)
+        return tuple([cls(o) for o in out])
+
+    def _build_index(self):
+        self._pol_bls = {}  # pol: set of stored bls
+        self._bl_pols = {}  # bl: set of stored pols
+        self._conj = {}  # conjugated key: stored key, for keys whose conjugate is not stored
+        self._bl_set, self._pol_set = set(), set()  # returned by bls() and pols()
+        # pol: bls(pol), i.e. the stored bls of pol and the reverse of those that are stored with any pol
+        self._pol_bls_conj = {}
+        for key in self._data.keys():
+            self._index_key(key)
+
+    def _index_key(self, key):
+        bl, pol = key[:2], key[-1]
+        if not self._bl_pols.has_key(bl):
+            # a newly stored bl counts for the pols that store its reverse
+            for p in self._bl_pols.get(bl[::-1], ()):
+                self._pol_bls_conj[p].add(bl)
+            self._bl_set.add(bl)
+        self._pol_bls.setdefault(pol, set()).add(bl)
+        self._bl_pols.setdefault(bl, set()).add(pol)
+        self._pol_set.add(pol)
+        bls = self._pol_bls_conj.setdefault(pol, set())
+        bls.add(bl)
+        if self._bl_pols.has_key(bl[::-1]):
+            bls.add(bl[::-1])
+        self._conj.pop(key, None)
+        if not self._data.has_key(self._switch_bl(key)):
+            self._conj[self._switch_bl(key)] = key
+
+    def _unindex_key(self, key):
+        bl, pol = key[:2], key[-1]
+        self._pol_bls[pol].discard(bl)
+        self._bl_pols[bl].discard(pol)
+        if len(self._bl_pols[bl]) == 0:
+            del self._bl_pols[bl]
+            self._bl_set.discard(bl)
+            for p in self._bl_pols.get(bl[::-1], ()):
+                self._pol_bls_conj[p].discard(bl)
+        if len(self._pol_bls[pol]) == 0:
+            del self._pol_bls[pol], self._pol_bls_conj[pol]
+            self._pol_set.discard(pol)
+        else:
+            bls = self._pol_bls_conj[pol]
+            if not (bl[::-1] in self._pol_bls[pol] and self._bl_pols.has_key(bl)):
+                bls.discard(bl)
+            if bl[::-1] not in self._pol_bls[pol]:
+                bls.discard(bl[::-1])
+        switched = self._switch_bl(key)
+        if self._conj.get(switched) == key:
+            del self._conj[switched]
+        if self._data.has_key(switched):
+            self._conj[key] = switched
+
+    @property
+    def _bls(self):
+        return self._bl_set
+
+    @property
+    def _pols(self):
+        return self._pol_set
 
     def mk_key(self, bl, pol):
         return bl + (pol,)
@@ -36,29 +154,56 @@ class DataContainer:
 
     def bls(self, pol=None):
         if pol is None:
-            return self._bls.copy()
+            return self._bl_set
         else:
-            return set([bl for bl in self._bls if self.has_key(bl, pol)])
+            # conjugates of stored bls count if they are stored with another pol
+            return self._pol_bls_conj.get(pol, set())
 
     def pols(self, bl=None):
         if bl is None:
-            return self._pols.copy()
+            return self._pol_set
         else:
-            return set([pol for pol in self._pols if self.has_key(bl, pol)])
+            return self._bl_pols.get(bl, set()) | self._bl_pols.get(self._switch_bl(bl), set())
 
     def keys(self):
         return self._data.keys()
 
     def __getitem__(self, key):
         if type(key) is str:  # asking for a pol
-            return dict(zip(self._bls, [self[self.mk_key(bl, key)] for bl in self._bls]))
+            return dict([(bl, self[self.mk_key(bl, key)]) for bl in self.bls(key)])
         elif len(key) == 2:  # asking for a bl
-            return dict(zip(self._pols, [self[self.mk_key(key, pol)] for pol in self._pols]))
+            return dict([(pol, self[self.mk_key(key, pol)]) for pol in self.pols(key)])
+        elif self._data.has_key(key):
+            return self._data[key]
+        elif self._conj.has_key(key):
+            return np.conj(self._data[self._conj[key]])
         else:
-            try:
-                return self._data[key]
-            except(KeyError):
-                return np.conj(self._data[self._switch_bl(key)])
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        """Set the data of a (ant1,ant2,pol) key. If only the conjugate of key is stored, the
+        conjugate of value is stored under it instead."""
+        if len(key) != 3:
+            raise ValueError('DataContainer keys must be (ant1,ant2,pol) tuples.')
+        if self._conj.has_key(key):
+            self._data[self._conj[key]] = np.conj(value)
+        else:
+            new = not self._data.has_key(key)
+            self._data[key] = value
+            if new:
+                self._index_key(key)
+
+    def __delitem__(self, key):
+        """Delete a (ant1,ant2,pol) key, or the stored key it is the conjugate of."""
+        if not self._data.has_key(key):
+            if not self._conj.has_key(key):
+                raise KeyError(key)
+            key = self._conj[key]
+        del self._data[key]
+        self._unindex_key(key)
+
+    def __len__(self):
+        return len(self._data)
 
     def get_data(self, *args):
         if len(args) > 1:
@@ -68,15 +213,616 @@ class DataContainer:
 
     def has_key(self, *args):
         if len(args) == 1:
-            return self._data.has_key(args[0]) or self._data.has_key(self._switch_bl(args[0]))
+            return self._data.has_key(args[0]) or self._conj.has_key(args[0])
         else:
             return self.has_key(self.mk_key(args[0], args[1]))
 
     def has_bl(self, bl):
-        return bl in self._bls
+        return self._bl_pols.has_key(bl)
 
     def has_pol(self, pol):
-        return pol in self._pols
+        return self._pol_bls.has_key(pol)
 
     def get(self, bl, pol):
         return self[self.mk_key(bl, pol)]
+
+    def stack(self, keys):
+        """Stack the data of a list of (ant1,ant2,pol) keys into a single (Nkeys, ...) array."""
+        return np.array([self[key] for key in keys])
+
+    def write(self, filename, chunks=None, compression=None, meta=None):
+        """Write the container to an HDF5 file (.h5/.hdf5), npz archive (.npz) or directory of
+        npy arrays. See write_blocks for the layout and the chunks and compression options."""
+        write_blocks(self, filename, chunks=chunks, compression=compression, meta=meta)
+
+    @staticmethod
+    def read(filename, keys=None, pols=None, ants=None, times=None, freqs=None):
+        """Read (part of) a file written by write into an ArrayDataContainer. See read_blocks."""
+        return read_blocks(filename, keys=keys, pols=pols, ants=ants, times=times, freqs=freqs)
+
+    @staticmethod
+    def read_meta(filename):
+        """Return the metadata arrays stored with a file written by write."""
+        return read_meta(filename)
+
+    # numpy defers binary operations with a DataContainer to the methods below
+    __array_ufunc__ = None
+
+    def _ufunc_blocks(self, ufunc, other, out, reverse):
+        """Hook for containers that can apply ufunc to whole blocks. Returns None if they can't."""
+        return None
+
+    def _ufunc(self, ufunc, other=None, out=None, reverse=False):
+        """Apply ufunc to the data of every key, and to the same key of other if other is a
+        DataContainer (or dict), or to other itself otherwise, e.g. a scalar or an array that
+        broadcasts against the data. The results are written into the arrays of the container
+        out (which may be self), if given, or returned in a new container."""
+        if isinstance(other, dict):
+            other = DataContainer(other)
+        if out is not None and not isinstance(out, DataContainer):
+            raise ValueError('out must be a DataContainer.')
+        result = self._ufunc_blocks(ufunc, other, out, reverse)
+        if result is not None:
+            return result
+        results = {}
+        for key in self.keys():
+            args = [self[key]]
+            if other is not None:
+                args.append(other[key] if isinstance(other, DataContainer) else other)
+            if reverse:
+                args = args[::-1]
+            if out is None:
+                results[key] = ufunc(*args)
+                continue
+            if not out._data.has_key(key):
+                raise ValueError('out has no key %s.' % str(key))
+            buf = out._data[key]
+            if isinstance(buf, np.ndarray):
+                ufunc(*args, out=buf)
+            else:
+                out[key] = ufunc(*args)
+        return out if out is not None else DataContainer(results)
+
+    def add(self, other, out=None):
+        return self._ufunc(np.add, other, out=out)
+
+    def subtract(self, other, out=None):
+        return self._ufunc(np.subtract, other, out=out)
+
+    def multiply(self, other, out=None):
+        return self._ufunc(np.multiply, other, out=out)
+
+    def divide(self, other, out=None):
+        return self._ufunc(np.true_divide, other, out=out)
+
+    def conj(self, out=None):
+        return self._ufunc(np.conj, out=out)
+
+    def abs(self, out=None):
+        return self._ufunc(np.abs, out=out)
+
+    def __add__(self, other):
+        return self.add(other)
+
+    def __sub__(self, other):
+        return self.subtract(other)
+
+    def __mul__(self, other):
+        return self.multiply(other)
+
+    def __div__(self, other):
+        return self.divide(other)
+
+    __truediv__ = __div__
+    __radd__ = __add__
+    __rmul__ = __mul__
+
+    def __rsub__(self, other):
+        return self._ufunc(np.subtract, other, reverse=True)
+
+    def __rdiv__(self, other):
+        return self._ufunc(np.true_divide, other, reverse=True)
+
+    __rtruediv__ = __rdiv__
+
+    def __neg__(self):
+        return self._ufunc(np.negative)
+
+    def __abs__(self):
+        return self.abs()
+
+    def _grouped(self, reds, reduce, out):
+        keys = [key for grp in reds for key in grp]
+        d = self.stack(keys)
+        counts = np.array([len(grp) for grp in reds])
+        starts = np.cumsum(counts) - counts
+        results = reduce(d, starts, counts)
+        if out is None:
+            out = {}
+        for grp, result in zip(reds, results):
+            if isinstance(out.get(grp[0]), np.ndarray):
+                out[grp[0]][...] = result
+            else:
+                out[grp[0]] = result
+        return out
+
+    def mean(self, reds, out=None):
+        """Average the data over each group of keys in reds, e.g. redundant baseline groups, with
+        a single stack of the data and one reduction over all groups.
+
+        Args:
+            reds: list of lists of (ant1,ant2,pol) keys
+            out: optional dictionary to write the results into. Arrays already in out are reused.
+
+        Returns:
+            dictionary of {grp[0]: average over grp}
+        """
+        def reduce(d, starts, counts):
+            dtype = d.dtype if np.issubdtype(d.dtype, np.inexact) else np.float64
+            sums = np.add.reduceat(d, starts, axis=0, dtype=dtype)
+            sums /= counts.reshape((-1,) + (1,) * (d.ndim - 1))
+            return sums
+        return self._grouped(reds, reduce, out)
+
+    def median(self, reds, out=None):
+        """Median of the data over each group of keys in reds (see mean). Complex data take the
+        median of the real and imaginary parts separately, as np.median does."""
+        def reduce(d, starts, counts):
+            return [np.median(d[s:s + n], axis=0) for s, n in zip(starts, counts)]
+        return self._grouped(reds, reduce, out)
+
+class ArrayDataContainer(DataContainer):
+    """DataContainer that stores the data of each polarization in a single contiguous
+    (Nbls, ...) array, e.g. (Nbls, Ntimes, Nfreqs), with a (ant1,ant2) -> row index.
+
+    Indexing works as for DataContainer, but dc[(i,j,pol)] returns a view into the block of pol
+    (except for conjugated baselines, which are necessarily copies), so writing into it updates
+    the block. The blocks can be used directly for vectorized operations, see block() and stack().
+    """
+
+    def __init__(self, data, dtype=None):
+        """
+        Args:
+            data (dict): dictionary of visibilities with keywords of pol/ant pair
+                in any order. All arrays of a polarization must have the same shape.
+            dtype: data type of the blocks. Default is the common type of the input arrays.
+        """
+        DataContainer.__init__(self, data)
+        blocks, bl_order = {}, {}
+        for pol in self._pols:
+            bl_order[pol] = sorted([k[:2] for k in self._data.keys() if k[2] == pol])
+            rows = [np.asarray(self._data[bl + (pol,)]) for bl in bl_order[pol]]
+            if len(set([r.shape for r in rows])) > 1:
+                raise ValueError('All arrays of polarization %s must have the same shape.' % pol)
+            blocks[pol] = np.array(rows, dtype=dtype)
+        self._set_blocks(blocks, bl_order)
+
+    @classmethod
+    def from_blocks(cls, blocks, bls):
+        """Build an ArrayDataContainer around existing arrays, without copying them.
+
+        Args:
+            blocks (dict): {pol: np.array} of (Nbls, ...) arrays, one per polarization
+            bls (dict): {pol: [(ant1,ant2), ...]} baselines in the order of the rows of blocks[pol]
+
+        Returns:
+            ArrayDataContainer whose blocks are the arrays in blocks
+        """
+        dc = cls.__new__(cls)
+        dc._set_blocks(dict([(pol, np.asarray(b)) for pol, b in blocks.items()]),
+                       dict([(pol, list(bls[pol])) for pol in blocks]))
+        return dc
+
+    def _set_blocks(self, blocks, bl_order):
+        self._blocks = blocks
+        self._bl_order = bl_order
+        self._bl_index = {}
+        self._data = {}
+        for pol, block in blocks.items():
+            if len(bl_order[pol]) != block.shape[0]:
+                raise ValueError('Polarization %s has %d baselines but %d rows.' %
+                                 (pol, len(bl_order[pol]), block.shape[0]))
+            self._bl_index[pol] = dict([(bl, n) for n, bl in enumerate(bl_order[pol])])
+            for n, bl in enumerate(bl_order[pol]):
+                self._data[self.mk_key(bl, pol)] = block[n]
+        self._build_index()
+
+    def __setitem__(self, key, value):
+        """Write value into the row of key (conjugated if needed). A new key is appended to the
+        block of its polarization, which reallocates the block, so existing views no longer
+        refer to the data of the container."""
+        if len(key) != 3:
+            raise ValueError('DataContainer keys must be (ant1,ant2,pol) tuples.')
+        if self.has_key(key):
+            row, conj = self.index(key)
+            self._blocks[key[2]][row] = np.conj(value) if conj else value
+            return
+        blocks, bl_order = dict(self._blocks), dict(self._bl_order)
+        pol = key[2]
+        if blocks.has_key(pol):
+            row = np.asarray(value, dtype=blocks[pol].dtype)[None]
+            blocks[pol] = np.concatenate([blocks[pol], row])
+            bl_order[pol] = bl_order[pol] + [key[:2]]
+        else:
+            blocks[pol] = np.array([value])
+            bl_order[pol] = [key[:2]]
+        self._set_blocks(blocks, bl_order)
+
+    def __delitem__(self, key):
+        """Delete a (ant1,ant2,pol) key, or the stored key it is the conjugate of. This
+        reallocates the block of its polarization."""
+        if not self.has_key(key):
+            raise KeyError(key)
+        row, conj = self.index(key)
+        blocks, bl_order = dict(self._blocks), dict(self._bl_order)
+        pol = key[2]
+        bl_order[pol] = bl_order[pol][:row] + bl_order[pol][row + 1:]
+        if len(bl_order[pol]) == 0:
+            del blocks[pol], bl_order[pol]
+        else:
+            blocks[pol] = np.delete(blocks[pol], row, axis=0)
+        self._set_blocks(blocks, bl_order)
+
+    def _same_layout(self, other):
+        return isinstance(other, ArrayDataContainer) and other._bl_order == self._bl_order
+
+    def _ufunc_blocks(self, ufunc, other, out, reverse):
+        """Apply ufunc to whole blocks if other is not a DataContainer or has the same blocks
+        layout as self, and out (if given) also has the same layout."""
+        if isinstance(other, DataContainer) and not self._same_layout(other):
+            return None
+        if out is not None and not self._same_layout(out):
+            return None
+        blocks = {}
+        for pol, block in self._blocks.items():
+            args = [block]
+            if other is not None:
+                args.append(other._blocks[pol] if isinstance(other, ArrayDataContainer) else other)
+            if reverse:
+                args = args[::-1]
+            if out is None:
+                blocks[pol] = ufunc(*args)
+            else:
+                ufunc(*args, out=out._blocks[pol])
+        return out if out is not None else ArrayDataContainer.from_blocks(blocks, self._bl_order)
+
+    def block(self, pol):
+        """Return the (Nbls, ...) array holding all data of pol, in the order of bl_order(pol)."""
+        return self._blocks[pol]
+
+    def bl_order(self, pol):
+        """Return the list of (ant1,ant2) baselines of pol in the order of the rows of block(pol)."""
+        return list(self._bl_order[pol])
+
+    def index(self, key):
+        """Return (row, conj) for a (ant1,ant2,pol) key, where row is the row of the key's
+        baseline in block(pol) and conj is True if the key is the conjugate of that baseline."""
+        index = self._bl_index[key[2]]
+        if index.has_key(key[:2]):
+            return index[key[:2]], False
+        return index[self._switch_bl(key)[:2]], True
+
+    def stack(self, keys):
+        """Stack the data of a list of (ant1,ant2,pol) keys into a single (Nkeys, ...) array
+        with one fancy-indexed copy per polarization, conjugating where needed."""
+        keys = list(keys)
+        pols = [k[2] for k in keys]
+        shape = self._blocks[pols[0]].shape[1:]
+        dtype = np.result_type(*[self._blocks[pol] for pol in set(pols)])
+        out = np.empty((len(keys),) + shape, dtype=dtype)
+        for pol in set(pols):
+            pos = np.array([n for n, p in enumerate(pols) if p == pol])
+            rows, conj = np.array([self.index(keys[n]) for n in pos]).T
+            out[pos] = self._blocks[pol][rows]
+            conj = pos[conj.astype(bool)]
+            if len(conj) > 0:
+                out[conj] = np.conj(out[conj])
+        return out
+
+
+def _is_hdf5(filename):
+    return os.path.splitext(filename)[1] in ('.h5', '.hdf5')
+
+
+def _import_h5py():
+    try:
+        import h5py
+    except(ImportError):
+        raise ImportError('h5py is required to read and write HDF5 files.')
+    return h5py
+
+
+def _is_npz(filename):
+    return os.path.splitext(filename)[1] == '.npz'
+
+
+def write_blocks(dc, filename, chunks=None, compression=None, meta=None):
+    """Write a DataContainer to disk as one (Nbls, ...) array per polarization. The arrays are
+    written one baseline (or one chunk of baselines) at a time, so dc can itself be a
+    LazyDataContainer.
+
+    Args:
+        dc: DataContainer to write. All arrays of a polarization must have the same shape and
+            are stored with the dtype of the first one.
+        filename: the format follows the extension:
+            .h5 or .hdf5: HDF5 file with a group per polarization holding 'data' and 'bls'
+                datasets (requires h5py).
+            .npz: npz archive with a '<pol>.bls' array, and the data of each chunk of baselines
+                in a separate '<pol>.data.<n>' member, so that reads only decompress the
+                chunks they need.
+            otherwise: directory with a <pol>.npy array and a <pol>.bls.npy array of
+                (ant1,ant2) pairs per polarization, which can be memory-mapped.
+        chunks: HDF5 chunk shape, e.g. (Nbls, Ntimes, Nfreqs) per chunk. For npz, only the
+            number of baselines per chunk (chunks[0]) is used. Ignored for npy directories.
+        compression: HDF5 compression filter (e.g. 'gzip' or 'lzf'). For npz, any true value
+            compresses the archive. Ignored for npy directories.
+        meta: optional dictionary of metadata arrays (e.g. times, lsts, freqs) to store
+            with the data, see read_meta.
+    """
+    meta = {} if meta is None else meta
+    if _is_npz(filename):
+        members = dict([('meta.' + k, np.asarray(v)) for k, v in meta.items()])
+        for pol in sorted(dc.pols()):
+            bls = sorted(dc._pol_bls[pol])
+            nchunk = len(bls) if chunks is None else chunks[0]
+            members[pol + '.bls'] = np.array(bls)
+            members[pol + '.chunks'] = np.arange(0, len(bls), nchunk)
+            for n, start in enumerate(members[pol + '.chunks']):
+                members['%s.data.%d' % (pol, n)] = dc.stack([bl + (pol,) for bl in bls[start:start + nchunk]])
+        (np.savez_compressed if compression else np.savez)(filename, **members)
+        return
+    hdf5 = _is_hdf5(filename)
+    if hdf5:
+        h5 = _import_h5py().File(filename, 'w')
+        for k, v in meta.items():
+            h5.attrs[k] = np.asarray(v)
+    else:
+        if not os.path.isdir(filename):
+            os.makedirs(filename)
+        np.savez(os.path.join(filename, 'meta.npz'), **meta)
+    for pol in sorted(dc.pols()):
+        bls = sorted(dc._pol_bls[pol])
+        first = np.asarray(dc[bls[0] + (pol,)])
+        shape = (len(bls),) + first.shape
+        if hdf5:
+            grp = h5.create_group(pol)
+            grp['bls'] = np.array(bls)
+            if chunks is not None:
+                pol_chunks = tuple([min(c, n) for c, n in zip(chunks, shape)])
+            else:
+                pol_chunks = True if compression else None
+            out = grp.create_dataset('data', shape, dtype=first.dtype, compression=compression,
+                                     chunks=pol_chunks)
+        else:
+            np.save(os.path.join(filename, pol + '.bls.npy'), np.array(bls))
+            out = np.lib.format.open_memmap(os.path.join(filename, pol + '.npy'), mode='w+',
+                                            dtype=first.dtype, shape=shape)
+        for n, bl in enumerate(bls):
+            out[n] = dc[bl + (pol,)]
+        if not hdf5:
+            out.flush()
+            del out
+    if hdf5:
+        h5.close()
+
+
+def _selected_rows(bls, pol, keys, ants):
+    """Rows of the stored bls of pol requested by keys (in either orientation) and with both
+    antennas in ants."""
+    rows = range(len(bls))
+    if keys is not None:
+        wanted = set([k[:2] for k in keys if k[2] == pol])
+        wanted |= set([bl[::-1] for bl in wanted])
+        rows = [n for n in rows if bls[n] in wanted]
+    if ants is not None:
+        ants = set(ants)
+        rows = [n for n in rows if bls[n][0] in ants and bls[n][1] in ants]
+    return rows
+
+
+def _read_rows(data, rows, index):
+    """Read rows (a slice or increasing list) and the time and frequency index of an on-disk
+    array. Slices are passed on to the array, so only they are read from disk; index arrays are
+    applied afterwards, one axis at a time (outer rather than numpy's broadcast indexing)."""
+    index = index[:data.ndim - 1]
+    out = np.asarray(data[(rows,) + tuple([idx if isinstance(idx, slice) else slice(None) for idx in index])])
+    for axis, idx in enumerate(index):
+        if not isinstance(idx, slice):
+            out = np.take(out, idx, axis=axis + 1)
+    return out
+
+
+def read_blocks(filename, keys=None, pols=None, ants=None, times=None, freqs=None):
+    """Read (part of) a file written by write_blocks into an ArrayDataContainer. Only the
+    selected baselines, times and frequencies are read from HDF5 files and npy directories, and
+    only the chunks holding selected baselines are read from npz archives.
+
+    Args:
+        filename: file or directory written by write_blocks (or DataContainer.write)
+        keys: only read these (ant1,ant2,pol) keys, in either orientation. Default is all.
+        pols: only read these polarizations. Default is all.
+        ants: only read baselines between these antennas. Default is all.
+        times: slice (or index array) of the time axis, i.e. axis 1 of the stored arrays
+        freqs: slice (or index array) of the frequency axis, i.e. axis 2 of the stored arrays
+
+    Returns:
+        ArrayDataContainer with the baselines in the orientation they were stored in
+    """
+    index = (slice(None) if times is None else times, slice(None) if freqs is None else freqs)
+    blocks, bl_order = {}, {}
+
+    def select(pol, bls):
+        bls = [tuple(bl) for bl in bls.tolist()]
+        rows = _selected_rows(bls, pol, keys, ants)
+        if len(rows) > 0:
+            bl_order[pol] = [bls[n] for n in rows]
+        return rows, len(rows) == len(bls)
+
+    if _is_npz(filename):
+        npz = np.load(filename)
+        for pol in set([name[:-len('.bls')] for name in npz.files if name.endswith('.bls')]):
+            if pols is not None and pol not in pols:
+                continue
+            rows, _ = select(pol, npz[pol + '.bls'])
+            starts = list(npz[pol + '.chunks']) + [np.inf]
+            parts = []
+            for n in xrange(len(starts) - 1):
+                in_chunk = [r - starts[n] for r in rows if starts[n] <= r < starts[n + 1]]
+                if len(in_chunk) > 0:
+                    chunk = npz['%s.data.%d' % (pol, n)]
+                    parts.append(_read_rows(chunk, np.array(in_chunk), index))
+            if len(parts) > 0:
+                blocks[pol] = np.concatenate(parts)
+        npz.close()
+    elif _is_hdf5(filename):
+        h5 = _import_h5py().File(filename, 'r')
+        for pol, grp in h5.items():
+            pol = str(pol)
+            if pols is not None and pol not in pols:
+                continue
+            rows, all_rows = select(pol, grp['bls'][()])
+            if len(rows) > 0:
+                data = grp['data']
+                blocks[pol] = _read_rows(data, slice(None) if all_rows else rows, index)
+        h5.close()
+    else:
+        for fn in glob.glob(os.path.join(filename, '*.bls.npy')):
+            pol = os.path.basename(fn)[:-len('.bls.npy')]
+            if pols is not None and pol not in pols:
+                continue
+            rows, all_rows = select(pol, np.load(fn))
+            if len(rows) > 0:
+                data = np.load(os.path.join(filename, pol + '.npy'), mmap_mode='r')
+                blocks[pol] = np.array(_read_rows(data, slice(None) if all_rows else np.array(rows), index))
+    return ArrayDataContainer.from_blocks(blocks, bl_order)
+
+
+def read_meta(filename):
+    """Return the dictionary of metadata arrays stored by write_blocks in filename."""
+    if _is_npz(filename):
+        npz = np.load(filename)
+        meta = dict([(name[len('meta.'):], npz[name]) for name in npz.files if name.startswith('meta.')])
+        npz.close()
+    elif _is_hdf5(filename):
+        h5 = _import_h5py().File(filename, 'r')
+        meta = dict([(str(k), np.asarray(v)) for k, v in h5.attrs.items()])
+        h5.close()
+    else:
+        npz = np.load(os.path.join(filename, 'meta.npz'))
+        meta = dict([(name, npz[name]) for name in npz.files])
+        npz.close()
+    return meta
+
+
+class LazyDataContainer(DataContainer):
+    """Read-only DataContainer backed by the HDF5 files or npy directories written by
+    write_blocks. (npz archives can't be memory-mapped; use DataContainer.read for those.)
+
+    Only the baseline index is held in memory. The data of a key is read from disk (through a
+    memory map for npy directories) when it is accessed, and kept in a least-recently-used
+    cache of at most cache_bytes bytes. Returned arrays are read-only copies of the data on disk.
+    select_freqs gives containers that only read a range of channels, which is how
+    RedundantCalibrator (with chunk_size set) streams a LazyDataContainer by frequency.
+    """
+
+    def __init__(self, filename, cache_bytes=2**30):
+        """
+        Args:
+            filename: directory of npy arrays or HDF5 file written by write_blocks
+            cache_bytes: byte budget of the cache of recently accessed keys. Keys larger than
+                the budget are never cached.
+        """
+        self.filename = filename
+        self.cache_bytes = cache_bytes
+        self._file = None
+        self._sources = {}
+        self._freqs = slice(None)
+        self._data = {}  # (ant1,ant2,pol): row in the source array of pol
+        if _is_hdf5(filename):
+            self._file = _import_h5py().File(filename, 'r')
+            sources = [(str(pol), grp['data'], grp['bls'][()]) for pol, grp in self._file.items()]
+        elif os.path.isdir(filename):
+            sources = []
+            for fn in sorted(glob.glob(os.path.join(filename, '*.bls.npy'))):
+                pol = os.path.basename(fn)[:-len('.bls.npy')]
+                sources.append((pol, np.load(os.path.join(filename, pol + '.npy'), mmap_mode='r'), np.load(fn)))
+        else:
+            raise IOError('%s is neither an HDF5 file nor a directory of npy arrays.' % filename)
+        for pol, source, bls in sources:
+            self._sources[pol] = source
+            for n, (i, j) in enumerate(bls.tolist()):
+                self._data[(i, j, pol)] = n
+        self._build_index()
+        self._cache = OrderedDict()
+        self._cache_nbytes = 0
+        self.cache_hits, self.cache_misses = 0, 0
+
+    def _load(self, key):
+        if self._cache.has_key(key):
+            self.cache_hits += 1
+            value = self._cache.pop(key)
+            self._cache[key] = value  # most recently used keys are last
+            return value
+        self.cache_misses += 1
+        value = np.array(self._sources[key[2]][self._data[key], ..., self._freqs])
+        value.flags.writeable = False
+        if value.nbytes <= self.cache_bytes:
+            self._cache[key] = value
+            self._cache_nbytes += value.nbytes
+            while self._cache_nbytes > self.cache_bytes:
+                _, old = self._cache.popitem(last=False)
+                self._cache_nbytes -= old.nbytes
+        return value
+
+    def __getitem__(self, key):
+        if type(key) is str or len(key) == 2:
+            return DataContainer.__getitem__(self, key)
+        elif self._data.has_key(key):
+            return self._load(key)
+        elif self._conj.has_key(key):
+            return np.conj(self._load(self._conj[key]))
+        else:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        raise TypeError('LazyDataContainer is read-only.')
+
+    def __delitem__(self, key):
+        raise TypeError('LazyDataContainer is read-only.')
+
+    def select_freqs(self, f0, f1):
+        """Returns a LazyDataContainer of channels f0:f1 (relative to this container) that shares
+        this container's files, but has its own cache. Only those channels are read from disk."""
+        start, stop, step = self._freqs.indices(self._nfreqs())
+        out = copy(self)
+        out._freqs = slice(start + f0 * step, min(start + f1 * step, stop), step)
+        out._cache = OrderedDict()
+        out._cache_nbytes = 0
+        out.cache_hits, out.cache_misses = 0, 0
+        return out
+
+    def _nfreqs(self):
+        return self._sources.values()[0].shape[-1]
+
+    def nbytes(self, keys=None):
+        """Number of bytes that the data of keys (default all keys) take up once loaded."""
+        if keys is None:
+            keys = self.keys()
+        nfreqs = len(range(*self._freqs.indices(self._nfreqs())))
+        nbytes = 0
+        for key in keys:
+            source = self._sources[key[2] if self._data.has_key(key) else self._conj[key][2]]
+            nbytes += int(np.prod(source.shape[1:-1])) * nfreqs * source.dtype.itemsize
+        return nbytes
+
+    def clear_cache(self):
+        """Drop all cached arrays."""
+        self._cache = OrderedDict()
+        self._cache_nbytes = 0
+
+    def close(self):
+        """Close the underlying HDF5 file, if any (also for containers from select_freqs)."""
+        self.clear_cache()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
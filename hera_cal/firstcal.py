@@ -9,9 +9,9 @@ import numpy as np
 import scipy.sparse as sps
 
 import aipy
-from aipy.miriad import pol2str
 from hera_cal.omni import Antpol
-from hera_cal import omni, utils, cal_formats
+from hera_cal import omni, utils, cal_formats, profiling
+from hera_cal.datacontainer import DataContainer
 import omnical
 from pyuvdata import UVData
 
@@ -397,26 +397,21 @@ def UVData_to_dict(uvdata_list, filetype='miriad'):
             uv_in = UVData()
             # read in file without multiple if statements
             getattr(uv_in, 'read_' + filetype)(fname)
-        # reshape data and flag arrays to make slicing time and baselines easy
-        data = uv_in.data_array.reshape(
-            uv_in.Ntimes, uv_in.Nbls, uv_in.Nspws, uv_in.Nfreqs, uv_in.Npols)
-        flags = uv_in.flag_array.reshape(
-            uv_in.Ntimes, uv_in.Nbls, uv_in.Nspws, uv_in.Nfreqs, uv_in.Npols)
+        # views into the data and flag arrays of each baseline and pol
+        data, flags, _ = DataContainer.from_uvdata(uv_in)
 
-        for nbl, (i, j) in enumerate(map(uv_in.baseline_to_antnums, uv_in.baseline_array[:uv_in.Nbls])):
+        for (i, j, pol) in data.keys():
             if (i, j) not in d:
                 d[i, j] = {}
                 f[i, j] = {}
-            for ip, pol in enumerate(uv_in.polarization_array):
-                pol = pol2str[pol]
-                if pol not in d[(i, j)]:
-                    d[(i, j)][pol] = data[:, nbl, 0, :, ip]
-                    f[(i, j)][pol] = flags[:, nbl, 0, :, ip]
-                else:
-                    d[(i, j)][pol] = np.concatenate(
-                        [d[(i, j)][pol], data[:, nbl, 0, :, ip]])
-                    f[(i, j)][pol] = np.concatenate(
-                        [f[(i, j)][pol], flags[:, nbl, 0, :, ip]])
+            if pol not in d[(i, j)]:
+                d[(i, j)][pol] = data[(i, j, pol)]
+                f[(i, j)][pol] = flags[(i, j, pol)]
+            else:
+                d[(i, j)][pol] = np.concatenate(
+                    [d[(i, j)][pol], data[(i, j, pol)]])
+                f[(i, j)][pol] = np.concatenate(
+                    [f[(i, j)][pol], flags[(i, j, pol)]])
     return d, f
 
 
@@ -558,21 +553,25 @@ def firstcal_run(files, opts, history):
     if len(files) == 0:
         raise AssertionError('Please provide visibility files.')
 
-    # get frequencies and redundancy information from miriad file
-    # N.B: assumes redundancy is the same for all files in the list
-    uvd = UVData()
-    uvd.read_miriad(files[0])
-    # convert frequencies from Hz -> GHz
-    fqs = uvd.freq_array[0, :] / 1e9
-    if opts.cal is not None:
-        # generate aa from calfile
-        aa = utils.get_aa_from_calfile(fqs, opts.cal)
-    else:
-        # generate aa from file
-        # N.B.: this requires correct antenna postitions and telescope location,
-        #   and in general is not applicable to data files taken before H1C (~JD 2458000)
-        aa = utils.get_aa_from_uv(uvd)
-    del(uvd)
+    def _get_info(uvd):
+        '''Build the redundancy info of the job from the metadata of uvd.'''
+        # convert frequencies from Hz -> GHz
+        fqs = uvd.freq_array[0, :] / 1e9
+        with profiling.stage('aa'):
+            if opts.cal is not None:
+                # generate aa from calfile
+                aa = utils.get_aa_from_calfile(fqs, opts.cal)
+            else:
+                # generate aa from file
+                # N.B.: this requires correct antenna postitions and telescope location,
+                #   and in general is not applicable to data files taken before H1C (~JD 2458000)
+                aa = utils.get_aa_from_uv(uvd)
+        with profiling.stage('info'):
+            info = omni.aa_to_info(aa, pols=[opts.pol[0]],
+                                   fcal=True, ubls=ubls, ex_ants=ex_ants, tol=opts.reds_tolerance)
+        bls = [bl for bls in info.get_reds() for bl in bls]
+        print('Number of redundant baselines:', len(bls))
+        return info
 
     # Parse command line arguments
     ex_ants = omni.process_ex_ants(opts.ex_ants, opts.metrics_json)
@@ -581,13 +580,12 @@ def firstcal_run(files, opts, history):
     print('Excluding Antennas:', ex_ants)
     if len(ubls) != None:
         print('Using Unique Baselines:', ubls)
-    info = omni.aa_to_info(aa, pols=[opts.pol[0]],
-                           fcal=True, ubls=ubls, ex_ants=ex_ants, tol=opts.reds_tolerance)
-    bls = [bl for bls in info.get_reds() for bl in bls]
-    print('Number of redundant baselines:', len(bls))
 
-    # append reds to history
-    history += '\nredundant_baselines = {0}\n'.format(info.get_reds)
+    # the frequencies and redundancy information are taken from the first file that is read,
+    # and reused for all others, so that every file is read only once.
+    # N.B: assumes redundancy is the same for all files in the list
+    profiling.start(opts.profile)
+    info = None
 
     # Firstcal loop per file.
     for filename in files:
@@ -602,13 +600,19 @@ def firstcal_run(files, opts, history):
 
         # read in data and run firstcal
         print("Reading {0}".format(filename))
-        uv_in = UVData()
-        uv_in.read_miriad(filename)
-        if uv_in.phase_type != 'drift':
-            print("Setting phase type to drift")
-            uv_in.unphase_to_drift()
-        
-        sols, rotated_antennas = _search_and_iterate_firstcal(uv_in, info, opts)
+        with profiling.stage('read'):
+            uv_in = UVData()
+            uv_in.read_miriad(filename)
+            if uv_in.phase_type != 'drift':
+                print("Setting phase type to drift")
+                uv_in.unphase_to_drift()
+        if info is None:
+            info = _get_info(uv_in)
+            # append reds to history
+            history += '\nredundant_baselines = {0}\n'.format(info.get_reds)
+
+        with profiling.stage('firstcal'):
+            sols, rotated_antennas = _search_and_iterate_firstcal(uv_in, info, opts)
         rotated_antennas = [str(ai) for (ai, pol) in rotated_antennas]
         # convert delays to a gain solution
         gain_solutions = {ai: omni.get_phase(uv_in.freq_array[0, :], sols[ai]) for ai in sols.keys()}
@@ -647,7 +651,11 @@ def firstcal_run(files, opts, history):
         hc = cal_formats.HERACal(meta, gains, flags=antflags, ex_ants=ex_ants,
                                  appendhist=history, optional=optional)
         print('     Saving {0}'.format(outname))
-        hc.write_calfits(outname, clobber=opts.overwrite)
+        with profiling.stage('write_calfits'):
+            hc.write_calfits(outname, clobber=opts.overwrite)
+        profiling.write(outname.replace('.calfits', '.profile.json'), script='firstcal_run', files=[filename])
+
+    profiling.stop()
 
     return
 
@@ -685,4 +693,7 @@ def firstcal_option_parser():
                  help='metrics from hera_qm about array qualities')
     o.add_option('--reds_tolerance', type='float', default=1.0,
                  help='Tolerance level for calculating reds. Default is 1.0ns')
+    o.add_option('--profile', action='store_true', default=False,
+                 help='Record wall time, CPU time and memory use of each stage in a .profile.json file next to '
+                 'each output. Also enabled by setting the {0} environment variable.'.format(profiling.ENV_VAR))
     return o
@@ -12,6 +12,8 @@ import optparse
 from hera_cal import redcal
 from hera_cal import utils
 from hera_cal import cal_formats
+from hera_cal import profiling
+from hera_cal.datacontainer import DataContainer
 with warnings.catch_warnings():
     warnings.filterwarnings("ignore", category=DeprecationWarning)
     import scipy.sparse as sps
@@ -129,11 +131,13 @@ class RedundantInfo(omnical.calib.RedundantInfo):
         '''
         return [(Antpol(self.subsetant[i], self.nant), Antpol(self.subsetant[j], self.nant)) for (i, j) in self.bl2d]
 
-    def order_data(self, dd):
+    def order_data(self, dd, dtype=None):
         """Create a data array ordered for use in _omnical.redcal.
         Args:
             dd (dict): dictionary whose keys are (i,j) antenna tuples; antennas i,j should be ordered to reflect
                        the conjugation convention of the provided data.  'dd' values are 2D arrays of (time,freq) data.
+            dtype: dtype of the returned array. Default None keeps the dtype of the data (e.g. complex64
+                   for single precision data).
         Return:
             array: array whose ordering reflects the internal ordering of omnical. Used to pass into pack_calpar
         """
@@ -145,7 +149,19 @@ class RedundantInfo(omnical.calib.RedundantInfo):
                 d.append(dd[bl][pol])
             except(KeyError):
                 d.append(dd[bl[::-1]][pol[::-1]].conj())
-        return np.array(d).transpose((1, 2, 0))
+        return np.array(d, dtype=dtype).transpose((1, 2, 0))
+
+    def get_redcal(self):
+        '''Return a hera_cal.redcal.RedundantCalibrator for the reds in this info.
+        It is built on first use and reused afterwards, so that its cached degeneracy
+        projectors carry over between calls (e.g. remove_degen on every file).
+        Return:
+            RedundantCalibrator: calibrator for info.get_reds()
+        '''
+        if getattr(self, '_redcal', None) is None:
+            self._redcal = redcal.RedundantCalibrator(info_reds_to_redcal_reds(self.get_reds(), self.nant,
+                                                                                pol_to_factor=POLNUM))
+        return self._redcal
 
     def pack_calpar(self, calpar, gains=None, vis=None, **kwargs):
         ''' Pack a calpar array for use in omnical.
@@ -385,8 +401,7 @@ def remove_degen(info, g, v, g0, minV=False):
     sol = {(i,antpol): g[antpol][i] for (i,antpol) in ants}
     sol.update({(i,j,pol): v[pol][(i,j)] for (i,j,pol) in bl_pairs})
     sol0 = {(i,antpol): g0[antpol][i] for (i,antpol) in ants}
-    rc = redcal.RedundantCalibrator(info_reds_to_redcal_reds(info.get_reds(), info.nant, pol_to_factor=POLNUM))
-    newSol = rc.remove_degen(antpos, sol, degen_sol=sol0)
+    newSol = info.get_redcal().remove_degen(antpos, sol, degen_sol=sol0)
 
     # Put back into omnical format dictionaires
     g3 = {antpol: {} for antpol in antpols}
@@ -420,15 +435,18 @@ def run_omnical(data, info, gains0=None, xtalk=None, maxiter=50,
         g3 (dict): dictionary of gain solutions.
         v3 (dict): dictionary of model visibilites.
     '''
-    m1, g1, v1 = omnical.calib.logcal(data, info, xtalk=xtalk, gains=gains0,
-                                      maxiter=maxiter, conv=conv, stepsize=stepsize,
-                                      trust_period=trust_period)
+    with profiling.stage('logcal'):
+        m1, g1, v1 = omnical.calib.logcal(data, info, xtalk=xtalk, gains=gains0,
+                                          maxiter=maxiter, conv=conv, stepsize=stepsize,
+                                          trust_period=trust_period)
 
-    m2, g2, v2 = omnical.calib.lincal(data, info, gains=g1, vis=v1, xtalk=xtalk,
-                                      conv=conv, stepsize=stepsize,
-                                      trust_period=trust_period, maxiter=maxiter)
+    with profiling.stage('lincal'):
+        m2, g2, v2 = omnical.calib.lincal(data, info, gains=g1, vis=v1, xtalk=xtalk,
+                                          conv=conv, stepsize=stepsize,
+                                          trust_period=trust_period, maxiter=maxiter)
 
-    g3, v3 = remove_degen(info, g2, v2, gains0, minV=minV)
+    with profiling.stage('remove_degen'):
+        g3, v3 = remove_degen(info, g2, v2, gains0, minV=minV)
 
     return m2, g3, v3
 
@@ -559,10 +577,12 @@ def from_fits(filename, keep_delay=False, **kwargs):
     Args:
         filename: Name of calfits file storing omnical solutions.
             There should also be corresponding files for the visibilities
-            and crosstalk. These filenames should have be *vis{xtalk}.fits.
+            and crosstalk. These filenames should have be *vis{xtalk}.uvfits,
+            or *.vis{xtalk}.h5 or .npz if omni_run wrote them with --vis_format.
         **kwargs : extra keywords that are passed into the select function
             for the UVCal object and UVData object. Refer to pyuvdata.UVCal.select
-            and pyuvdata.UVData.select for use.
+            and pyuvdata.UVData.select for use. For h5/npz visibilities, only
+            antenna_nums is applied, as a partial read.
     Returns:
         meta (dict): dictionary of meta information
         gains (dict): dictionary of gains
@@ -684,15 +704,32 @@ def from_fits(filename, keep_delay=False, **kwargs):
     # if these are omnical solutions, there vis.fits and xtalk.fits were
     # created.
     if not firstcal:
-        visfile = ['.'.join(fitsname.split('.')[:-2]) +
-                   '.vis.uvfits' for fitsname in filename]
-        xtalkfile = ['.'.join(fitsname.split('.')[:-2]) +
-                     '.xtalk.uvfits' for fitsname in filename]
+        basenames = ['.'.join(fitsname.split('.')[:-2]) for fitsname in filename]
 
         vis = UVData()
         xtalk = UVData()
-        for f1, f2 in zip(visfile, xtalkfile):
-            if os.path.exists(f1) and os.path.exists(f2):
+        for basename in basenames:
+            f1, f2 = basename + '.vis.uvfits', basename + '.xtalk.uvfits'
+            native = [ext for ext in ['h5', 'npz'] if os.path.exists('%s.vis.%s' % (basename, ext))
+                      and os.path.exists('%s.xtalk.%s' % (basename, ext))]
+            if len(native) > 0:
+                # model visibilities and xtalk written natively by omni_run: no phasing round trip
+                for fn, out in [('%s.vis.%s' % (basename, native[0]), v), ('%s.xtalk.%s' % (basename, native[0]), x)]:
+                    dc = DataContainer.read(fn, ants=kwargs.get('antenna_nums'))
+                    vmeta = DataContainer.read_meta(fn)
+                    # xtalk is stored time-averaged
+                    shape = (len(vmeta['times']), len(vmeta['freqs']))
+                    for (i, j, pol) in dc.keys():
+                        d = np.resize(dc[(i, j, pol)], shape)
+                        if not out.setdefault(pol, {}).has_key((i, j)):
+                            out[pol][(i, j)] = d
+                        else:
+                            out[pol][(i, j)] = np.concatenate([out[pol][(i, j)], d])
+                if not 'lsts' in meta.keys():
+                    meta['lsts'] = vmeta['lsts']
+                else:
+                    meta['lsts'] = np.concatenate([meta['lsts'], vmeta['lsts']])
+            elif os.path.exists(f1) and os.path.exists(f2):
                 vis.read_uvfits(f1)
                 # need to do this since all uvfits files are phased! PAPER/HERA
                 # miriad files are drift.
@@ -730,7 +767,9 @@ def from_fits(filename, keep_delay=False, **kwargs):
                             x[pol][xtalk.baseline_to_antnums(bl)] = np.concatenate([x[pol][xtalk.baseline_to_antnums(
                                 bl)], np.resize(xtalk.data_array[k:k + xtalk.Ntimes, 0, :, p], DATA_SHAPE)])
         # use vis to get lst array
-        if not 'lsts' in meta.keys():
+        if vis.Ntimes is None:
+            pass
+        elif not 'lsts' in meta.keys():
             meta['lsts'] = vis.lst_array[:vis.Ntimes]
         else:
             meta['lsts'] = np.concatenate(
@@ -941,6 +980,12 @@ def get_optionParser(methodName):
     o.add_option('--omnipath', dest='omnipath', default='.',
                  type='string', help='Path to/for omnical solutions. Note that solutions are handled via glob, so for multiple files, make `omnipath` glob-parselable.')
     o.add_option('--median', action='store_true', help=median_help_string)
+    o.add_option('--dtype', dest='dtype', default=None, type='choice', choices=['complex64', 'complex128'],
+                 help='Precision in which to hold visibilities and gains. complex64 halves the memory and '
+                 'bandwidth at the cost of ~1e-7 relative accuracy. Default keeps the precision of the data files.')
+    o.add_option('--profile', action='store_true', default=False,
+                 help='Record wall time, CPU time and memory use of each stage in a .profile.json file next to '
+                 'each output. Also enabled by setting the {0} environment variable.'.format(profiling.ENV_VAR))
 
     if methodName == 'omni_run':
         o.add_option('--ex_ants', dest='ex_ants', default='',
@@ -953,6 +998,11 @@ def get_optionParser(methodName):
                      help='metrics from hera_qm about array qualities')
         o.add_option('--overwrite', action='store_true', default=False,
                      help="Overwrite output files even if they already exist.")
+        o.add_option('--vis_format', dest='vis_format', default='uvfits', type='choice', choices=['uvfits', 'h5', 'npz'],
+                     help='Format of the model visibility and xtalk files. h5 (requires h5py) and npz are read back '
+                     'by from_fits without the phasing round trip of uvfits. Default is uvfits.')
+        o.add_option('--vis_compression', dest='vis_compression', default=None, type='string',
+                     help='Compression of h5 (e.g. gzip or lzf) or npz (any value) model visibility and xtalk files.')
         o.add_option('--reds_tolerance', type='float', default=1.0,
                      help="Tolerance level for calculating reds. Default is 1.0ns")
 
@@ -999,36 +1049,37 @@ def omni_run(files, opts, history):
         if isLinPol(pp):
             linear_pol_keys.append(pp)
 
-    # get frequencies and redundancy information from miriad file
-    # N.B: assumes redundancy is the same for all files in the list
-    uvd = UVData()
-    uvd.read_miriad(files[0])
-    if opts.cal is not None:
-        # generate from calfile
-        # get frequencies, and convert from Hz -> GHz
-        fqs = uvd.freq_array[0, :] / 1e9
-        aa = utils.get_aa_from_calfile(fqs[0], opts.cal)
-    else:
-        # generate aa from file
-        # N.B.: this requires correct antenna postitions and telescope location,
-        #   and in general is not applicable to data files taken before H1C (~JD 2458000)
-        aa = utils.get_aa_from_uv(uvd)
-    del (uvd)
+    def _get_aa_info(uvd):
+        '''Build the AntennaArray and RedundantInfo of the job from the metadata of uvd.'''
+        with profiling.stage('aa'):
+            if opts.cal is not None:
+                # generate from calfile
+                # get frequencies, and convert from Hz -> GHz
+                fqs = uvd.freq_array[0, :] / 1e9
+                aa = utils.get_aa_from_calfile(fqs[0], opts.cal)
+            else:
+                # generate aa from file
+                # N.B.: this requires correct antenna postitions and telescope location,
+                #   and in general is not applicable to data files taken before H1C (~JD 2458000)
+                aa = utils.get_aa_from_uv(uvd)
+        print('Getting reds from file')
+        with profiling.stage('info'):
+            info = aa_to_info(aa, pols=list(set(''.join(pols))),
+                              ex_ants=ex_ants, crosspols=pols, minV=opts.minV, tol=opts.reds_tolerance)
+        return aa, info
 
     # get HERA info
-    print('Getting reds from file')
     if opts.ex_ants or opts.metrics_json:
         ex_ants = process_ex_ants(opts.ex_ants, opts.metrics_json)
         print('   Excluding antennas:', sorted(ex_ants))
     else:
         ex_ants = []
-    info = aa_to_info(aa, pols=list(set(''.join(pols))),
-                      ex_ants=ex_ants, crosspols=pols, minV=opts.minV, tol=opts.reds_tolerance)
-    reds = info.get_reds()
-    bls = [bl for red in reds for bl in red]
+    # the frequencies and redundancy information are taken from the first file group that is
+    # read, and reused for all others, so that every file is read only once.
+    # N.B: assumes redundancy is the same for all files in the list
+    profiling.start(opts.profile)
+    aa, info = None, None
 
-    # append reds to history
-    history += '\nredundant_baslines = {0}'.format(reds)
     ### Collect all firstcal files ###
     firstcal_files = {}
     if not opts.firstcal:
@@ -1099,33 +1150,37 @@ def omni_run(files, opts, history):
             fcalfile = [file2firstcal[file_group[pp]][0]
                         for pp in linear_pol_keys]
 
-        _, g0, _, _ = from_fits(fcalfile)
+        with profiling.stage('firstcal_load'):
+            _, g0, _, _ = from_fits(fcalfile)
 
         #uvd = pyuvdata.UVData()
         #uvd.read_miriad([file_group[pp] for pp in pols])
         # XXX This will become much simpler when pyuvdata can read multiple MIRIAD
         # files at once.
 
+        with profiling.stage('read'):
+            uvd_dict = {}
+            for pp in pols:
+                uvd = UVData()
+                uvd.read_miriad(file_group[pp])
+                if uvd.phase_type != 'drift':
+                    uvd.unphase_to_drift()
+                uvd_dict[pp] = uvd
+
         # collect metadata -- should be the same for each file
-        f0 = file_group[pols[0]]
-        uvd = UVData()
-        uvd.read_miriad(f0)
-        if uvd.phase_type != 'drift':
-            uvd.phase_to_drift()
+        uvd = uvd_dict[pols[0]]
         t_jd = uvd.time_array.reshape(uvd.Ntimes, uvd.Nbls)[:, 0]
         t_lst = uvd.lst_array.reshape(uvd.Ntimes, uvd.Nbls)[:, 0]
         t_int = uvd.integration_time
         freqs = uvd.freq_array[0]
         # shape of file data (ex: (19,203))
         SH = (uvd.Ntimes, uvd.Nfreqs)
-
-        uvd_dict = {}
-        for pp in pols:
-            uvd = UVData()
-            uvd.read_miriad(file_group[pp])
-            if uvd.phase_type != 'drift':
-                uvd.unphase_to_drift()
-            uvd_dict[pp] = uvd
+        if info is None:
+            aa, info = _get_aa_info(uvd)
+            reds = info.get_reds()
+            bls = [bl for red in reds for bl in red]
+            # append reds to history
+            history += '\nredundant_baslines = {0}'.format(reds)
 
         # format g0 for application to data
         if opts.median:
@@ -1136,43 +1191,31 @@ def omni_run(files, opts, history):
 
         # read data into dictionaries
         d, f = {}, {}
-        for ip, pp in enumerate(pols):
-            uvdp = uvd_dict[pp]
-
-            if ip == 0:
-                for nbl, (i, j) in enumerate(map(uvdp.baseline_to_antnums, uvdp.baseline_array[:uvdp.Nbls])):
-                    if not (i, j) in bls and not (j, i) in bls:
-                        continue
-                    d[(i, j)] = {}
-                    f[(i, j)] = {}
-
-            # XXX I *really* don't like looping again, but I'm not sure how better
-            # to do it
-            for nbl, (i, j) in enumerate(map(uvdp.baseline_to_antnums, uvdp.baseline_array[:uvdp.Nbls])):
-                if not (i, j) in bls and not (j, i) in bls:
-                    continue
-                d[(i, j)][pp] = uvdp.data_array.reshape(uvdp.Ntimes, uvdp.Nbls,
-                                                        uvdp.Nspws, uvdp.Nfreqs, uvdp.Npols)[:, nbl, 0, :, 0]
-                f[(i, j)][pp] = np.logical_not(uvdp.flag_array.reshape(
-                    uvdp.Ntimes, uvdp.Nbls, uvdp.Nspws, uvdp.Nfreqs, uvdp.Npols)[:, nbl, 0, :, 0])
+        for pp in pols:
+            dp, fp, _ = DataContainer.from_uvdata(uvd_dict[pp], bls=bls, pols=[pp])
+            for key in dp.keys():
+                v = dp[key] if opts.dtype is None else dp[key].astype(opts.dtype, copy=False)
+                d.setdefault(key[:2], {})[pp] = v
+                f.setdefault(key[:2], {})[pp] = np.logical_not(fp[key])
 
         # Finally prepared to run omnical
         print('   Running Omnical')
         m2, g3, v3 = run_omnical(d, info, gains0=g0, minV=opts.minV)
 
-        # Collect weights for xtalk
-        wgts, xtalk = {}, {}
-        for pp in pols:
-            wgts[pp] = {}  # weights dictionary by pol
-            for i, j in f:
-                if (i, j) in bls:
-                    wgts[pp][(i, j)] = np.logical_not(
-                        f[i, j][pp]).astype(np.int)
-                else:  # conjugate
-                    wgts[pp][(j, i)] = np.logical_not(
-                        f[i, j][pp]).astype(np.int)
-        # xtalk is time-average of residual: data - omnical model
-        xtalk = compute_xtalk(m2['res'], wgts)
+        with profiling.stage('xtalk'):
+            # Collect weights for xtalk
+            wgts, xtalk = {}, {}
+            for pp in pols:
+                wgts[pp] = {}  # weights dictionary by pol
+                for i, j in f:
+                    if (i, j) in bls:
+                        wgts[pp][(i, j)] = np.logical_not(
+                            f[i, j][pp]).astype(np.int)
+                    else:  # conjugate
+                        wgts[pp][(j, i)] = np.logical_not(
+                            f[i, j][pp]).astype(np.int)
+            # xtalk is time-average of residual: data - omnical model
+            xtalk = compute_xtalk(m2['res'], wgts)
 
         # Append metadata parameters
         m2['history'] = 'OMNI_RUN: ' + history + '\n'
@@ -1191,19 +1234,34 @@ def omni_run(files, opts, history):
             elif 'yx' in v3.keys() and not 'xy' in v3.keys():
                 v3['xy'] = v3['yx']
 
-        hc.write_calfits(fitsname, clobber=opts.overwrite)
+        with profiling.stage('write_calfits'):
+            hc.write_calfits(fitsname, clobber=opts.overwrite)
         fsj = '.'.join(fitsname.split('.')[:-2])
 
-        uv_vis = make_uvdata_vis(aa, m2, v3)
-
-        uv_vis.reorder_pols()
-        uv_vis.write_uvfits('%s.vis.uvfits' %
-                            fsj, force_phase=True, spoof_nonessential=True)
-        uv_xtalk = make_uvdata_vis(aa, m2, xtalk, xtalk=True)
-        uv_xtalk.reorder_pols()
-        uv_xtalk.write_uvfits('%s.xtalk.uvfits' %
-                              fsj, force_phase=True, spoof_nonessential=True)
-
+        if opts.vis_format != 'uvfits':
+            # native files, read back by from_fits without phasing and unphasing
+            vis_meta = {'times': t_jd, 'lsts': t_lst, 'freqs': freqs}
+            with profiling.stage('write_vis'):
+                DataContainer(v3).write('%s.vis.%s' % (fsj, opts.vis_format), meta=vis_meta,
+                                        chunks=(1, SH[0], SH[1]), compression=opts.vis_compression)
+            with profiling.stage('write_xtalk'):
+                DataContainer(xtalk).write('%s.xtalk.%s' % (fsj, opts.vis_format), meta=vis_meta,
+                                           compression=opts.vis_compression)
+        else:
+            with profiling.stage('write_vis'):
+                uv_vis = make_uvdata_vis(aa, m2, v3)
+                uv_vis.reorder_pols()
+                uv_vis.write_uvfits('%s.vis.uvfits' %
+                                    fsj, force_phase=True, spoof_nonessential=True)
+            with profiling.stage('write_xtalk'):
+                uv_xtalk = make_uvdata_vis(aa, m2, xtalk, xtalk=True)
+                uv_xtalk.reorder_pols()
+                uv_xtalk.write_uvfits('%s.xtalk.uvfits' %
+                                      fsj, force_phase=True, spoof_nonessential=True)
+        profiling.write('%s.omni.profile.json' % fsj, script='omni_run',
+                        files=[file_group[pp] for pp in pols])
+
+    profiling.stop()
     return
 
 
@@ -1269,30 +1327,40 @@ def omni_apply(files, opts):
                     filedict[f] = [firstcal_files[lpk][0]
                                    for lpk in linear_pol_keys]
 
+    profiling.start(opts.profile)
     for f in files:
-        mir = UVData()
-        print("  Reading {0}".format(f))
-        mir.read_miriad(f)
-        if mir.phase_type != 'drift':
-            mir.unphase_to_drift()
+        with profiling.stage('read'):
+            mir = UVData()
+            print("  Reading {0}".format(f))
+            mir.read_miriad(f)
+            if mir.phase_type != 'drift':
+                mir.unphase_to_drift()
         cal = UVCal()
-        print("  Reading calibration : {0}".format(filedict[f]))
-        if len(pols) == 1 or not opts.firstcal:
-            cal.read_calfits(filedict[f])
-        else:
-            if isLinPol(getPol(f)):
-                cal.read_calfits(filedict[f][0])
+        with profiling.stage('firstcal_load' if opts.firstcal else 'cal_load'):
+            print("  Reading calibration : {0}".format(filedict[f]))
+            if len(pols) == 1 or not opts.firstcal:
+                cal.read_calfits(filedict[f])
             else:
-                # read each file in and add to base file
-                for i,fn in enumerate(filedict[f]):
-                    if i == 0:
-                        cal = UVCal()
-                        cal.read_calfits(fn)
-                    else:
-                        cal0 = UVCal()
-                        cal0.read_calfits(fn)
-                        cal += cal0
+                if isLinPol(getPol(f)):
+                    cal.read_calfits(filedict[f][0])
+                else:
+                    # read each file in and add to base file
+                    for i,fn in enumerate(filedict[f]):
+                        if i == 0:
+                            cal = UVCal()
+                            cal.read_calfits(fn)
+                        else:
+                            cal0 = UVCal()
+                            cal0.read_calfits(fn)
+                            cal += cal0
+
+        if opts.dtype is not None:
+            mir.data_array = mir.data_array.astype(opts.dtype, copy=False)
+            if cal.cal_type == 'gain':
+                # apply gains in the requested precision instead of promoting the data to complex128
+                cal.gain_array = cal.gain_array.astype(opts.dtype, copy=False)
 
+        profiling.start_stage('apply')
         print("  Calibrating...")
         antenna_index = dict(zip(*(cal.ant_array, range(cal.Nants_data))))
         for p, pol in enumerate(mir.polarization_array):
@@ -1353,6 +1421,7 @@ def omni_apply(files, opts):
                         mir.flag_array[blmask, nsp, :, p],
                         np.logical_or(cal.flag_array[antenna_index[ai], nsp, :, :, p1].T,
                                       cal.flag_array[antenna_index[aj], nsp, :, :, p2].T))
+        profiling.stop_stage('apply')
 
         # Define output path and filename
         inp_filename = os.path.basename(f)
@@ -1366,10 +1435,13 @@ def omni_apply(files, opts):
 
         # Write to file
         if opts.firstcal:
-            print(" Writing {0}".format(out_filename + 'F'))
-            mir.write_miriad(out_filename + 'F', clobber=opts.overwrite)
+            out_filename += 'F'
         else:
-            print(" Writing {0}".format(out_filename + opts.extension))
-            mir.write_miriad(out_filename + opts.extension, clobber=opts.overwrite)
+            out_filename += opts.extension
+        print(" Writing {0}".format(out_filename))
+        with profiling.stage('write'):
+            mir.write_miriad(out_filename, clobber=opts.overwrite)
+        profiling.write(out_filename + '.profile.json', script='omni_apply', files=[f])
 
+    profiling.stop()
     return
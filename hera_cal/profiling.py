@@ -0,0 +1,187 @@
+'''Lightweight stage-level instrumentation of the calibration scripts.
+
+Profiling is enabled with the --profile option of omni_run.py, firstcal_run.py and omni_apply.py,
+or by setting the HERA_CAL_PROFILE environment variable (to anything but '' or '0'). Library code
+marks stages with
+
+    with profiling.stage('lincal'):
+        ...
+
+or, around long blocks of code, with profiling.start_stage('apply') ... profiling.stop_stage('apply').
+Both cost nothing unless a Profile has been started. For every stage, the wall time, CPU time,
+peak resident set size during the stage, the resident set size at its end and its change over
+the stage are recorded. The memory numbers need Linux' /proc and are None elsewhere; the stage
+peaks are measured by resetting the kernel's high-water mark (VmHWM) at every stage boundary.
+write() dumps the records collected since the previous write as one JSON file per processed
+file, together with the peak resident set size over the lifetime of the process.
+'''
+
+from __future__ import print_function, division, absolute_import
+import os
+import sys
+import json
+import time
+import resource
+from contextlib import contextmanager
+
+ENV_VAR = 'HERA_CAL_PROFILE'
+_profile = None
+
+
+def enabled(flag=False):
+    '''Return True if profiling is requested by flag (e.g. opts.profile) or the environment.'''
+    return bool(flag) or os.environ.get(ENV_VAR, '') not in ('', '0')
+
+
+def _rss_mb():
+    '''Current resident set size of this process in MB, or None without /proc/self/statm.'''
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / 2.**20
+
+
+def _hwm_mb():
+    '''Peak resident set size (VmHWM) of this process in MB since the last _reset_hwm, or None
+    without /proc/self/status.'''
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 2.**10
+    except (IOError, OSError, IndexError, ValueError):
+        pass
+    return None
+
+
+def _reset_hwm():
+    '''Reset the peak resident set size of this process (VmHWM, and with it ru_maxrss) to the
+    current resident set size. Returns False where that is not supported.'''
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except (IOError, OSError):
+        return False
+    return True
+
+
+def _process_peak_rss_mb():
+    '''Peak resident set size over the lifetime of this process in MB (ru_maxrss is in bytes
+    on macOS, kB elsewhere).'''
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 2.**20 if sys.platform == 'darwin' else maxrss / 2.**10
+
+
+def _cpu_time():
+    ru = resource.getrusage(resource.RUSAGE_SELF)
+    return ru.ru_utime + ru.ru_stime
+
+
+class Profile(object):
+
+    def __init__(self):
+        '''Collects one record per completed stage, in the order the stages finished.'''
+        self.records = []
+        self._open = []
+        # resetting VmHWM also resets ru_maxrss, so the process peak is tracked here from then on
+        self._peak_rss_mb = _process_peak_rss_mb()
+        self._track_hwm = _hwm_mb() is not None and _reset_hwm()
+
+    def _checkpoint(self):
+        '''Fold the peak resident set size since the last checkpoint into the open stages and the
+        process peak, and reset it, so that every stage only sees the peaks while it was open.'''
+        if not self._track_hwm:
+            return
+        hwm = _hwm_mb()
+        self._peak_rss_mb = max(self._peak_rss_mb, hwm)
+        for stage in self._open:
+            stage['peak_rss_mb'] = max(stage['peak_rss_mb'], hwm)
+        self._track_hwm = _reset_hwm()
+
+    def start(self, name):
+        '''Start timing stage name. Stages may be nested, and are stopped in reverse order.'''
+        self._checkpoint()
+        rss = _rss_mb()
+        self._open.append({'stage': name, 'wall_time': time.time(), 'cpu_time': _cpu_time(), 'rss_mb': rss,
+                           'peak_rss_mb': rss if self._track_hwm else None})
+
+    def stop(self, name):
+        '''Stop the most recently started stage, which must be name, and record it.'''
+        if len(self._open) == 0 or self._open[-1]['stage'] != name:
+            raise ValueError('Stage %s is not the most recently started stage.' % name)
+        self._checkpoint()
+        stage = self._open.pop()
+        rss = _rss_mb()
+        self.records.append({'stage': name,
+                             'wall_time': time.time() - stage['wall_time'],
+                             'cpu_time': _cpu_time() - stage['cpu_time'],
+                             'peak_rss_mb': stage['peak_rss_mb'] if self._track_hwm else None,
+                             'rss_mb': rss,
+                             'rss_delta_mb': None if rss is None or stage['rss_mb'] is None else rss - stage['rss_mb']})
+
+    @contextmanager
+    def stage(self, name):
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(name)
+
+    def write(self, filename, **meta):
+        '''Write the records collected since the last write to filename as a JSON object,
+        together with the keyword arguments in meta (e.g. the input files), and clear them.'''
+        out = dict(meta)
+        out['stages'] = self.records
+        out['wall_time'] = sum([r['wall_time'] for r in self.records])
+        out['cpu_time'] = sum([r['cpu_time'] for r in self.records])
+        self._checkpoint()
+        out['process_peak_rss_mb'] = self._peak_rss_mb if self._track_hwm else _process_peak_rss_mb()
+        with open(filename, 'w') as f:
+            json.dump(out, f, indent=1, sort_keys=True)
+        self.records = []
+
+
+def start(flag=False):
+    '''Start collecting stage records if profiling is enabled (see enabled()).
+    Returns the active Profile, or None if profiling is off.'''
+    global _profile
+    _profile = Profile() if enabled(flag) else None
+    return _profile
+
+
+def stop():
+    '''Stop collecting stage records. Records that were not written are discarded.'''
+    global _profile
+    _profile = None
+
+
+@contextmanager
+def stage(name):
+    '''Record the enclosed block as stage name of the active Profile, if any.'''
+    if _profile is None:
+        yield
+    else:
+        with _profile.stage(name):
+            yield
+
+
+def start_stage(name):
+    '''Start stage name of the active Profile, if any (see Profile.start).'''
+    if _profile is not None:
+        _profile.start(name)
+
+
+def stop_stage(name):
+    '''Stop stage name of the active Profile, if any (see Profile.stop).'''
+    if _profile is not None:
+        _profile.stop(name)
+
+
+def write(filename, **meta):
+    '''Write the records of the active Profile to filename (see Profile.write). No-op if
+    profiling is off.'''
+    if _profile is not None:
+        print('   Writing profile %s' % filename)
+        _profile.write(filename, **meta)
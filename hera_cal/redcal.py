@@ -1,6 +1,17 @@
 import numpy as np
-from copy import deepcopy
-from hera_cal.datacontainer import DataContainer
+import scipy.sparse as sps
+from scipy.sparse.csgraph import connected_components
+import scipy.sparse.linalg as spla
+from scipy.spatial import cKDTree
+import multiprocessing
+import warnings
+from copy import copy, deepcopy
+from collections import OrderedDict
+from hera_cal.datacontainer import DataContainer, ArrayDataContainer, LazyDataContainer
+
+# Approximate memory budget (in bytes) for the dense per-pixel normal matrices that
+# RedcalSystem.lincal builds and inverts together in one batch.
+LINCAL_BATCH_BYTES = 2**26
 
 
 def noise(size):
@@ -10,7 +21,7 @@ def noise(size):
     return np.random.normal(scale=sig, size=size) + 1j*np.random.normal(scale=sig, size=size)
 
 
-def sim_red_data(reds, gains=None, shape=(10,10), gain_scatter=.1):
+def sim_red_data(reds, gains=None, shape=(10,10), gain_scatter=.1, dtype=np.complex128):
     """ Simulate noise-free random but redundant (up to differing gains) visibilities.
 
         Args:
@@ -20,6 +31,7 @@ def sim_red_data(reds, gains=None, shape=(10,10), gain_scatter=.1):
                 {(index,antpol): np.array} format. Default gives all ones.
             shape: tuple of (Ntimes, Nfreqs). Default is (10,10).
             gain_scatter: Relative amplitude of per-antenna complex gain scatter. Default is 0.1.
+            dtype: complex dtype of the simulated gains and visibilities. Default is np.complex128.
 
         Returns:
             gains: true gains used in the simulation in the {(index,antpol): np.array} format
@@ -32,14 +44,41 @@ def sim_red_data(reds, gains=None, shape=(10,10), gain_scatter=.1):
     if gains is None: gains = {}
     else: gains = deepcopy(gains)
     for ant in ants:
-        gains[ant] = gains.get(ant, 1+gain_scatter*noise((1,))) * np.ones(shape,dtype=np.complex)
+        gains[ant] = (gains.get(ant, 1+gain_scatter*noise((1,))) * np.ones(shape)).astype(dtype)
     for bls in reds:
-        true_vis[bls[0]] = noise(shape)
+        true_vis[bls[0]] = noise(shape).astype(dtype)
         for (i,j,pol) in bls:
             data[(i,j,pol)] = true_vis[bls[0]] * gains[(i,pol[0])] * gains[(j,pol[1])].conj()
     return gains, true_vis, data
 
 
+def _match_deltas(deltas, epsilons):
+    """Assigns integer baseline vectors, in order, to the first existing group whose key lies
+    within one of the epsilon offsets, starting a new group keyed by the vector otherwise.
+
+    Args:
+        deltas: (N,3) integer array of baseline vectors
+        epsilons: list of (3,) offsets to try, in order
+
+    Returns:
+        keys: list of group keys (tuples) in order of creation
+        groups: (N,) integer array of the index in keys of each delta's group
+    """
+
+    index, keys = {}, []
+    groups = np.empty(len(deltas), dtype=int)
+    for n,delta in enumerate(map(tuple, deltas)):
+        for epsilon in epsilons:
+            newKey = (delta[0]+epsilon[0], delta[1]+epsilon[1], delta[2]+epsilon[2])
+            if index.has_key(newKey):
+                groups[n] = index[newKey]
+                break
+        else:
+            index[delta] = groups[n] = len(keys)
+            keys.append(delta)
+    return keys, groups
+
+
 def get_pos_reds(antpos, precisionFactor=1e6):
     """ Figure out and return list of lists of redundant baseline pairs. Ordered by length.
         All baselines have the same orientation with a preference for positive b_y and,
@@ -55,32 +94,41 @@ def get_pos_reds(antpos, precisionFactor=1e6):
     """
 
     keys = antpos.keys()
-    reds = {}
-    array_is_2D = np.all(np.all(np.array(antpos.values())[:,2]==0))
-    for i,ant1 in enumerate(keys):
-        for ant2 in keys[i+1:]:
-            delta = tuple((precisionFactor*2.0 * (np.array(antpos[ant1]) - np.array(antpos[ant2]))).astype(int))
-            # Multiply by 2.0 because rounding errors can mimic changes below the grid spacing
-            if delta[0] > 0 or (delta[0]==0 and delta[1] > 0) or (delta[0]==0 and delta[1]==0 and delta[2] > 0):
-                bl_pair = (ant1,ant2)
-            else:
-                delta = tuple([-d for d in delta])
-                bl_pair = (ant2,ant1)
-            # Check to make sure reds doesn't have the key plus or minus rounding error
-            p_or_m = (0,-1,1)
-            if array_is_2D:
-                epsilons = [[dx,dy,0] for dx in p_or_m for dy in p_or_m]
-            else:
-                epsilons = [[dx,dy,dz] for dx in p_or_m for dy in p_or_m for dz in p_or_m]
-            for epsilon in epsilons:
-                newKey = (delta[0]+epsilon[0], delta[1]+epsilon[1], delta[2]+epsilon[2])
-                if reds.has_key(newKey):
-                    reds[newKey].append(bl_pair)
-                    break
-            if not reds.has_key(newKey):
-                reds[delta] = [bl_pair]
-    orderedDeltas = [delta for (length,delta) in sorted(zip([np.linalg.norm(delta) for delta in reds.keys()],reds.keys()))]
-    return [reds[delta] for delta in orderedDeltas]
+    if len(keys) < 2:
+        return []
+    pos = np.array([np.array(antpos[ant]) for ant in keys])
+    i,j = np.triu_indices(len(keys), 1)
+    # Multiply by 2.0 because rounding errors can mimic changes below the grid spacing
+    deltas = (precisionFactor*2.0 * (pos[i] - pos[j])).astype(int)
+    forward = (deltas[:,0] > 0) | ((deltas[:,0] == 0) & (deltas[:,1] > 0)) | \
+              ((deltas[:,0] == 0) & (deltas[:,1] == 0) & (deltas[:,2] > 0))
+    deltas[~forward] *= -1
+    ant1, ant2 = np.where(forward, i, j), np.where(forward, j, i)
+
+    # Check to make sure reds doesn't have the key plus or minus rounding error
+    p_or_m = (0,-1,1)
+    if np.all(pos[:,2]==0):
+        epsilons = [[dx,dy,0] for dx in p_or_m for dy in p_or_m]
+    else:
+        epsilons = [[dx,dy,dz] for dx in p_or_m for dy in p_or_m for dz in p_or_m]
+    # Only distinct vectors need matching, taken in order of first appearance
+    uniq, first, inverse = np.unique(deltas, axis=0, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    uniq_keys, uniq_groups = _match_deltas(uniq[order], epsilons)
+    groups = np.empty(len(uniq), dtype=int)
+    groups[order] = uniq_groups
+    groups = groups[inverse]
+    # When two group keys lie within two grid cells of each other, which group a repeated vector
+    # joins can depend on when it appears, so match every baseline in order instead.
+    if len(cKDTree(np.array(uniq_keys)).query_pairs(2, p=np.inf)) > 0:
+        uniq_keys, groups = _match_deltas(deltas, epsilons)
+
+    red_keys = np.array(uniq_keys)
+    norms = np.linalg.norm(red_keys.astype(float), axis=1)
+    members = np.argsort(groups, kind='mergesort')
+    members = np.split(members, np.cumsum(np.bincount(groups, minlength=len(uniq_keys)))[:-1])
+    reds = [[(keys[a1],keys[a2]) for a1,a2 in zip(ant1[m], ant2[m])] for m in members]
+    return [reds[n] for n in np.lexsort((red_keys[:,2], red_keys[:,1], red_keys[:,0], norms))]
 
 
 def add_pol_reds(reds, pols=['xx'], pol_mode='1pol'):
@@ -193,82 +241,824 @@ def get_gains_and_vis_from_sol(sol):
     return g, v
 
 
-def _apply_gains(target, gains, operation, target_type):
-    """Helper function designed to be used with divide_by_gains and multiply_by_gains."""
+def _as_container(data):
+    """Wrap data in a DataContainer, unless it already is one. This avoids copying the arrays
+    of e.g. a LazyDataContainer into memory just to look up its keys."""
+
+    return data if isinstance(data, DataContainer) else DataContainer(data)
+
+
+def _warn_if_loading_lazy(data, bls):
+    """Warns when stacking bls loads more of a LazyDataContainer than fits in its cache."""
+
+    if isinstance(data, LazyDataContainer) and data.nbytes(bls) > data.cache_bytes:
+        warnings.warn('Stacking %d bytes of a LazyDataContainer into memory. Set chunk_size on the '
+                      'RedundantCalibrator to stream it by frequency instead.' % data.nbytes(bls))
+
+
+def _apply_gains(target, gains, operation, target_type, inplace=False, out=None, bls=None):
+    """Helper function designed to be used with divide_by_gains and multiply_by_gains. operation
+    is a binary ufunc (np.divide or np.multiply), so results can be written into existing arrays."""
 
     assert(target_type in ['vis','gain'])
-    output = deepcopy(target)
-    if target_type is 'vis':
-        #loop over len=3 keys in target
-        for (ant1,ant2,pol) in [key for key in output.keys() if len(key)==3]:
-            try:
-                output[(ant1,ant2,pol)] = operation(output[(ant1,ant2,pol)], gains[(ant1,pol[0])])
-            except KeyError:
-                pass
-            try:
-                output[(ant1,ant2,pol)] = operation(output[(ant1,ant2,pol)], np.conj(gains[(ant2,pol[1])]))
-            except KeyError:
-                pass
-    elif target_type is 'gain':
-        #loop over len=2 keys in target
-        for ant in [key for key in output.keys() if len(key)==2]:
-            try:
-                output[ant] = operation(output[ant], gains[ant])
-            except KeyError:
-                pass
+    if isinstance(target, np.ndarray):
+        assert(target_type is 'vis' and bls is not None)
+        return _apply_gains_to_block(target, gains, operation, bls, out=(target if inplace else out))
+    if isinstance(target, ArrayDataContainer) and (out is None or isinstance(out, ArrayDataContainer)):
+        assert(target_type is 'vis')
+        blocks, bl_order = {}, {}
+        for pol in target.pols():
+            bl_order[pol] = target.bl_order(pol)
+            buf = target.block(pol) if inplace else (out.block(pol) if out is not None else None)
+            blocks[pol] = _apply_gains_to_block(target.block(pol), gains, operation,
+                                                [bl + (pol,) for bl in bl_order[pol]], out=buf)
+        if inplace:
+            return target
+        return out if out is not None else ArrayDataContainer.from_blocks(blocks, bl_order)
+    if inplace:
+        output = target
+    elif out is not None:
+        output = out
+    else:
+        # return the same kind of container as target
+        output = DataContainer({}) if isinstance(target, DataContainer) else {}
+    keylen = {'vis': 3, 'gain': 2}[target_type]
+    for key in target.keys():
+        if len(key) != keylen:
+            if output is not target and out is None:
+                output[key] = deepcopy(target[key])
+            continue
+        factors = []
+        if target_type is 'vis':
+            (ant1,ant2,pol) = key
+            if gains.has_key((ant1,pol[0])):
+                factors.append(gains[(ant1,pol[0])])
+            if gains.has_key((ant2,pol[1])):
+                factors.append(np.conj(gains[(ant2,pol[1])]))
+        elif gains.has_key(key):
+            factors.append(gains[key])
+        # write into the target (inplace) or into a buffer already in out, otherwise allocate
+        buf = target[key] if output is target else (output[key] if output.has_key(key) else None)
+        if not isinstance(buf, np.ndarray):
+            buf = None
+        result = target[key]
+        for factor in factors:
+            result = operation(result, factor, out=buf)
+            if isinstance(result, np.ndarray):
+                buf = result
+        if len(factors) == 0 and output is not target:
+            if buf is None:
+                result = deepcopy(result)
+            else:
+                buf[...] = result
+                result = buf
+        if result is not target[key]:
+            output[key] = result
     return output
 
 
-def divide_by_gains(target, gains, target_type='vis'):
+def _apply_gains_to_block(block, gains, operation, bls, out=None):
+    """Applies gains to a (Nbls, ...) block of visibilities stacked in the order of bls. The gain
+    products g_i g_j^* for all baselines are formed with a single fancy-indexed multiply and
+    applied in one ufunc call. Antennas without gains are left alone."""
+
+    gain_keys = sorted(set([(bl[0],bl[2][0]) for bl in bls] + [(bl[1],bl[2][1]) for bl in bls]))
+    ant_index = {ant: n for n,ant in enumerate(gain_keys)}
+    gain_stack = np.array(np.broadcast_arrays(*[np.asarray(gains[ant]) if gains.has_key(ant) else np.asarray(1.)
+                                                for ant in gain_keys]))
+    i1 = np.array([ant_index[(bl[0],bl[2][0])] for bl in bls])
+    i2 = np.array([ant_index[(bl[1],bl[2][1])] for bl in bls])
+    gain_prod = gain_stack[i1] * np.conj(gain_stack[i2])
+    gain_prod.shape += (1,) * (block.ndim - gain_prod.ndim)
+    return operation(block, gain_prod, out=out)
+
+
+def divide_by_gains(target, gains, target_type='vis', inplace=False, out=None, bls=None):
     """Helper function for applying gains to visibilities or other gains, e.g. for firstcal.
 
     Args:
         target: dictionary of gains in the {(ant,antpol): np.array} or visibilities in the
-            {(ant1,ant2,pol): np.array} format. Target is copied and the original is untouched.
+            {(ant1,ant2,pol): np.array} format. Target is copied and the original is untouched,
+            unless inplace or out is set. For target_type 'vis', target may also be a
+            (Nbls, ...) array of visibilities stacked in the order of bls, or an
+            ArrayDataContainer, in which case the gains are applied block by block.
         gains: dictionary of gains in the {(ant,antpol): np.array} to apply . It can be a full 
             'sol' dictionary with both gains and visibilities, but only the gains are used.
         target_type: either 'vis' (default) or 'gain'. For 'vis', only len=3 keys in the target 
             are modified. For 'gain', only len=2 keys are modified.
+        inplace: if True, overwrite the arrays in target with the result and return target
+        out: optional dictionary (or array, for array targets) to write the results into. Arrays
+            already in out are reused as buffers. Only modified keys are written.
+        bls: list of (ant1,ant2,pol) baselines in the order of the rows of an array target
 
     Returns:
-        output: copy of target with gains divided out.
+        output: copy of target (or target/out) with gains divided out.
     """
 
-    return _apply_gains(target, gains, (lambda x,y: x/y), target_type)
+    return _apply_gains(target, gains, np.divide, target_type, inplace=inplace, out=out, bls=bls)
 
 
-def multiply_by_gains(target, gains, target_type='vis'):
+def multiply_by_gains(target, gains, target_type='vis', inplace=False, out=None, bls=None):
     """Helper function for removing gains from visibilities or other gains, e.g. for firstcal.
 
     Args:
         target: dictionary of gains in the {(ant,antpol): np.array} or visibilities in the
-            {(ant1,ant2,pol): np.array} format. Target is copied and the original is untouched.
+            {(ant1,ant2,pol): np.array} format. Target is copied and the original is untouched,
+            unless inplace or out is set. For target_type 'vis', target may also be a
+            (Nbls, ...) array of visibilities stacked in the order of bls, or an
+            ArrayDataContainer, in which case the gains are applied block by block.
         gains: dictionary of gains in the {(ant,antpol): np.array} to remove. It can be a full 
             'sol' dictionary with both gains and visibilities, but only the gains are used.
         target_type: either 'vis' (default) or 'gain'. For 'vis', only len=3 keys in the target 
             are modified. For 'gain', only len=2 keys are modified.
+        inplace: if True, overwrite the arrays in target with the result and return target
+        out: optional dictionary (or array, for array targets) to write the results into. Arrays
+            already in out are reused as buffers. Only modified keys are written.
+        bls: list of (ant1,ant2,pol) baselines in the order of the rows of an array target
+
+    Returns:
+        output: copy of target (or target/out) with gains multiplied back in.
+    """
+
+    return _apply_gains(target, gains, np.multiply, target_type, inplace=inplace, out=out, bls=bls)
+
+
+
+def _iterative_lstsq(A, y, w, x0, method, tol, maxiter):
+    """Weighted least-squares solution of A x = y for a single pixel with a Jacobi-preconditioned
+    iterative sparse solver, started from x0.
+
+    Args:
+        A: sparse matrix of shape (Neqs, Nprms)
+        y: array of shape (Neqs,)
+        w: array of weights of shape (Neqs,), or None for equal weights
+        x0: starting guess of shape (Nprms,)
+        method: 'lsqr' (LSQR on W^1/2 A) or 'cg' (conjugate gradients on A^T W A)
+        tol: relative tolerance at which the solver stops
+        maxiter: maximum number of solver iterations, or None for the solver's default
+
+    Returns:
+        x: solution of shape (Nprms,)
+        niter: number of solver iterations
+        resnorm: norm of the weighted residual W^1/2 (A x - y)
+    """
+
+    if w is not None:
+        sw = np.sqrt(w)
+        A, y = sps.diags(sw).dot(A), sw * y
+    # diagonal of A^T W A, inverted for the Jacobi preconditioner
+    diag = np.asarray(A.multiply(A).sum(axis=0)).ravel()
+    D = 1. / np.where(diag > 0, diag, 1.)
+    if method == 'lsqr':
+        # preconditioning LSQR amounts to scaling the columns of A to unit norm
+        Dh = np.sqrt(D)
+        z, istop, niter = spla.lsqr(A.dot(sps.diags(Dh)), y, atol=tol, btol=tol, iter_lim=maxiter, x0=x0 / Dh)[:3]
+        x = Dh * z
+    elif method == 'cg':
+        niter = [0]
+        def count(xk):
+            niter[0] += 1
+        AtA = A.T.dot(A)
+        # the residual can't drop much below the size of the terms in A^T A x0, so include them in the
+        # tolerance to stop warm starts from iterating on roundoff
+        x, info = spla.cg(AtA, A.T.dot(y), x0=x0, tol=tol, atol=tol * np.linalg.norm(AtA.dot(x0)),
+                          maxiter=maxiter, M=sps.diags(D), callback=count)
+        niter = niter[0]
+    else:
+        raise ValueError, 'method must be "lsqr" or "cg"'
+    return x, niter, np.linalg.norm(A.dot(x) - y)
+
+
+def group_pixels_by_wgts(wgts):
+    """Groups the pixels (last axis) of a (Nbls, Npix) weights array that have identical weights
+    for every baseline, e.g. pixels that share the same flagging pattern.
+
+    Args:
+        wgts: array of weights of shape (Nbls, Npix)
+
+    Returns:
+        pixels: list of arrays of pixel indices, one array per group
+        wgts: list of the (Nbls,) weights shared by each group
+    """
+
+    wgts_by_pix = np.ascontiguousarray(wgts.T)
+    # view each pixel's weights as a single opaque value so identical patterns can be found by sorting
+    patterns = wgts_by_pix.view(np.dtype((np.void, wgts_by_pix.dtype.itemsize * wgts_by_pix.shape[1]))).ravel()
+    _, first, inverse = np.unique(patterns, return_index=True, return_inverse=True)
+    order = np.argsort(inverse, kind='mergesort')
+    pixels = np.split(order, np.cumsum(np.bincount(inverse))[:-1])
+    return pixels, [wgts[:, p] for p in first]
+
+
+def param_blocks(reds, bls_in_data):
+    """Splits the redcal parameters into blocks that never appear in the same equation (e.g. the
+    two polarizations in 2pol or disconnected sub-arrays), which can be solved independently.
+    Only the antenna/unique baseline incidence is used, so no design matrices are built.
+
+    Args:
+        reds: list of lists of redundant baseline tuples, e.g. (ind1,ind2,pol). The first
+            item in each list will be treated as the key for the unique baseline
+        bls_in_data: list of baselines in the (ant1,ant2,pol) format that occur in the data
 
     Returns:
-        output: copy of target with gains multiplied back in.
+        blocks: list of (bls, prms) tuples for each block, where bls are the baselines in the
+            data and prms the (ant,antpol) and unique baseline keys of the parameters in the block
     """
 
-    return _apply_gains(target, gains, (lambda x,y: x*y), target_type)
+    bls_in_data = set(bls_in_data)
+    prm_index, ant_rows, ubl_cols, grps = {}, [], [], []
+    for blgrp in reds:
+        grp_bls = [bl for bl in blgrp if bl in bls_in_data]
+        if len(grp_bls) == 0:
+            continue
+        u = prm_index.setdefault(blgrp[0], len(prm_index))
+        for (i,j,pol) in grp_bls:
+            for ant in [(i,pol[0]), (j,pol[1])]:
+                ant_rows.append(prm_index.setdefault(ant, len(prm_index)))
+                ubl_cols.append(u)
+        grps.append((u, grp_bls))
+    nprms = len(prm_index)
+    links = sps.csr_matrix((np.ones(len(ant_rows)), (ant_rows, ubl_cols)), shape=(nprms, nprms))
+    nblocks, prm_block = connected_components(links, directed=False)
+    blocks = [([], []) for n in range(nblocks)]
+    for u, grp_bls in grps:
+        blocks[prm_block[u]][0].extend(grp_bls)
+    for prm in sorted(prm_index.keys(), key=prm_index.get):
+        blocks[prm_block[prm_index[prm]]][1].append(prm)
+    return blocks
+
+
+class RedcalSystem:
+
+    def __init__(self, reds, bls_in_data):
+        """Array representation of the redcal system of equations for a fixed set of reds and
+        baselines in the data. Instead of one linsolve equation string per baseline (see
+        RedundantCalibrator.build_eqs), each visibility is described by integer indices into
+        a parameter vector of gains followed by unique baseline visibilities, from which the
+        logcal and lincal design matrices are built directly.
+
+        Args:
+            reds: list of lists of redundant baseline tuples, e.g. (ind1,ind2,pol). The first
+                item in each list will be treated as the key for the unique baseline
+            bls_in_data: list of baselines in the (ant1,ant2,pol) format that occur in the data
+        """
+
+        bls_in_data = set(bls_in_data)
+        self.bls, self.ants, self.ubls = [], [], []
+        ant_indices, ant1, ant2, ubl = {}, [], [], []
+        for blgrp in reds:
+            grp_bls = [bl for bl in blgrp if bl in bls_in_data]
+            if len(grp_bls) == 0:
+                continue
+            for (i,j,pol) in grp_bls:
+                for ant in [(i,pol[0]), (j,pol[1])]:
+                    if not ant_indices.has_key(ant):
+                        ant_indices[ant] = len(self.ants)
+                        self.ants.append(ant)
+                ant1.append(ant_indices[(i,pol[0])])
+                ant2.append(ant_indices[(j,pol[1])])
+                ubl.append(len(self.ubls))
+                self.bls.append((i,j,pol))
+            self.ubls.append(blgrp[0])
+        self.ant1, self.ant2, self.ubl = np.array(ant1, dtype=int), np.array(ant2, dtype=int), np.array(ubl, dtype=int)
+        self.nants, self.nubls, self.nbls = len(self.ants), len(self.ubls), len(self.bls)
+        self.nprms = self.nants + self.nubls
+        # column of each visibility's unique baseline in the parameter vector
+        self.ubl_col = self.nants + self.ubl
+        # rows of each redundant group, bucketed by group size for grouped reductions over self.bls
+        sizes = np.bincount(self.ubl, minlength=self.nubls)
+        self.grp_start = np.cumsum(sizes) - sizes
+        self._grp_rows = [(np.where(sizes == size)[0], self.grp_start[sizes == size][:,None] + np.arange(size))
+                          for size in np.unique(sizes)]
+
+        # logcal design matrices: log|V_ij| = eta_i + eta_j + eta_ubl, arg(V_ij) = phi_i - phi_j + phi_ubl
+        rows = np.repeat(np.arange(self.nbls), 3)
+        cols = np.array([self.ant1, self.ant2, self.ubl_col]).T.flatten()
+        self.A_amp = sps.csr_matrix((np.tile([1., 1., 1.], self.nbls), (rows, cols)), shape=(self.nbls, self.nprms))
+        self.A_phs = sps.csr_matrix((np.tile([1., -1., 1.], self.nbls), (rows, cols)), shape=(self.nbls, self.nprms))
+
+        # lincal: each visibility touches the real and imaginary parts of 3 parameters. These sparse
+        # matrices scatter per-visibility outer products into A^T W A and A^T W y, where the real
+        # parameter vector is the real parts of all parameters followed by the imaginary parts.
+        cols6 = np.array([self.ant1, self.nprms + self.ant1, self.ant2, self.nprms + self.ant2,
+                          self.ubl_col, self.nprms + self.ubl_col]).T
+        self._cols6 = cols6
+        n = 2 * self.nprms
+        AtA_rows = (cols6[:,:,None] * n + cols6[:,None,:]).flatten()
+        self._AtA_scatter = sps.csr_matrix((np.ones(AtA_rows.size), (AtA_rows, np.arange(AtA_rows.size))),
+                                           shape=(n*n, AtA_rows.size))
+        self._Aty_scatter = sps.csr_matrix((np.ones(cols6.size), (cols6.flatten(), np.arange(cols6.size))),
+                                           shape=(n, cols6.size))
+        self._AtAi = {}
+        # incidence of antennas in baselines, for summing per-baseline quantities per antenna
+        self._ant_incidence = sps.csr_matrix((np.ones(2*self.nbls), (np.concatenate([self.ant1, self.ant2]),
+                                              np.tile(np.arange(self.nbls), 2))), shape=(self.nants, self.nbls))
+
+
+    def stack_data(self, data):
+        """Stacks visibilities (or weights) in the dictionary format {(ant1,ant2,pol): np.array} into
+        a single array of shape (Nbls, ...) in the order of self.bls."""
+
+        if isinstance(data, ArrayDataContainer):
+            return data.stack(self.bls)
+        dc = _as_container(data)
+        _warn_if_loading_lazy(dc, self.bls)
+        return np.array([dc[bl] for bl in self.bls])
+
+
+    def phs_avg(self, d):
+        """Median phase of each redundant group in a (Nbls, ...) array stacked in the order of
+        self.bls, unwrapped across the group as np.unwrap would. Returns the conjugate phasors
+        as an array of shape (Nubls, ...), used to detrend phases for logcal."""
+
+        phs = np.angle(d)
+        dd = np.diff(phs, axis=0)
+        ph_correct = np.mod(dd + np.pi, 2*np.pi)
+        ph_correct -= np.pi
+        np.copyto(ph_correct, np.pi, where=(ph_correct == -np.pi) & (dd > 0))
+        ph_correct -= dd
+        np.copyto(ph_correct, 0, where=np.abs(dd) < np.pi)
+        ph_correct[self.grp_start[1:] - 1] = 0 # no unwrapping from one group into the next
+        cum_correct = np.zeros_like(phs)
+        np.cumsum(ph_correct, axis=0, out=cum_correct[1:])
+        phs += cum_correct
+        phs -= cum_correct[self.grp_start[self.ubl]]
+        med = np.empty((self.nubls,) + phs.shape[1:])
+        for grps, rows in self._grp_rows:
+            med[grps] = np.median(phs[rows], axis=1)
+        return np.exp(-1j * med)
+
+
+    def stack_wgts(self, wgts, shape):
+        """Stacks weights into an array of shape (Nbls,) + shape, broadcasting scalar weights.
+        Returns None for empty wgts, which signifies equal weights."""
+
+        if len(wgts) == 0:
+            return None
+        if isinstance(wgts, ArrayDataContainer):
+            w = wgts.stack(self.bls)
+            if w.shape[1:] == shape:
+                return w.astype(float)
+        wc = _as_container(wgts)
+        _warn_if_loading_lazy(wc, self.bls)
+        return np.array([np.broadcast_to(wc[bl], shape) for bl in self.bls], dtype=float)
+
+
+    def stack_sol(self, sol):
+        """Stacks a solution dictionary into an array of shape (Nprms, ...) of gains followed by
+        unique baseline visibilities."""
+
+        return np.array([sol[ant] for ant in self.ants] + [sol[ubl] for ubl in self.ubls])
+
+
+    def unstack_sol(self, prms):
+        """Turns an array of shape (Nprms, ...) back into a solution dictionary in the
+        {(index,antpol): np.array} and {(ind1,ind2,pol): np.array} formats."""
+
+        sol = dict(zip(self.ants, prms[:self.nants]))
+        sol.update(dict(zip(self.ubls, prms[self.nants:])))
+        return sol
+
+
+    def model(self, prms):
+        """Computes model visibilities g_i * conj(g_j) * V_ubl for every baseline in self.bls."""
+
+        return prms[self.ant1] * prms[self.ant2].conj() * prms[self.ubl_col]
+
+
+    def chisq(self, data, prms, wgts=None):
+        """Computes chi^2 = sum over baselines of wgts * |data - model|^2 for every pixel."""
+
+        res2 = np.abs(data - self.model(prms))**2
+        if wgts is not None:
+            res2 *= wgts
+        return np.sum(res2, axis=0)
+
+
+    def chisq_terms(self, data, prms, wgts=None):
+        """Computes wgts * |data - model|^2 for every baseline in one pass and sums it per pixel,
+        per antenna (over all baselines that include it) and per unique baseline.
+
+        Args:
+            data: array of shape (Nbls, ...) stacked in the order of self.bls
+            prms: array of shape (Nprms, ...) of gains followed by unique baseline visibilities
+            wgts: optional array of weights broadcastable to data
+
+        Returns:
+            chisq: array of the pixel shape of data
+            chisq_per_ant: array of shape (Nants, ...) in the order of self.ants
+            chisq_per_ubl: array of shape (Nubls, ...) in the order of self.ubls
+        """
+
+        res = data - self.model(prms)
+        res2 = res.real**2 + res.imag**2
+        if wgts is not None:
+            res2 *= wgts
+        chisq_per_ubl = np.add.reduceat(res2, self.grp_start, axis=0)
+        chisq_per_ant = self._ant_incidence.dot(res2.reshape(self.nbls, -1)).reshape((self.nants,) + res2.shape[1:])
+        return np.sum(chisq_per_ubl, axis=0), chisq_per_ant, chisq_per_ubl
+
+
+    def _get_AtAi(self, mode, rcond):
+        """Pseudo-inverse of the data-independent normal matrix A^T A for mode 'amp' or 'phs'. It is
+        computed once per mode and rcond and then kept on this object for later calls."""
+
+        if not self._AtAi.has_key((mode, rcond)):
+            A = {'amp': self.A_amp, 'phs': self.A_phs}[mode]
+            self._AtAi[(mode, rcond)] = np.linalg.pinv(A.T.dot(A).toarray(), rcond=rcond)
+        return self._AtAi[(mode, rcond)]
+
+
+    def _solve_linear(self, mode, y, wgts, rcond):
+        """Least-squares solution of A x = y for every pixel (last axis of y) using a pseudo-inverse
+        of A^T W A. Pixels are grouped by their weights (e.g. by flagging pattern) so that A^T W A
+        is factored once per group and each group is solved with a single matrix product. Equal
+        weights reuse the cached factorization of A^T A."""
+
+        A = {'amp': self.A_amp, 'phs': self.A_phs}[mode]
+        if wgts is None:
+            return self._get_AtAi(mode, rcond).dot(A.T.dot(y))
+        x = np.empty((A.shape[1], y.shape[1]), dtype=y.dtype)
+        for pix, w in zip(*group_pixels_by_wgts(wgts)):
+            if w[0] != 0 and np.all(w == w[0]):
+                x[:, pix] = self._get_AtAi(mode, rcond).dot(A.T.dot(y[:, pix]))
+            else:
+                AtW = A.T.multiply(w).tocsr()
+                AtAi = np.linalg.pinv(AtW.dot(A).toarray(), rcond=rcond)
+                x[:, pix] = AtAi.dot(AtW.dot(y[:, pix]))
+        return x
+
+
+    def _solve_iterative(self, mode, y, wgts, method, tol, maxiter):
+        """Least-squares solution of A x = y for every pixel (last axis of y) with an iterative
+        sparse solver (see _iterative_lstsq), warm-started from the previous pixel's solution.
+        Returns the solutions and the per-pixel solver iterations and residual norms."""
 
+        A = {'amp': self.A_amp, 'phs': self.A_phs}[mode]
+        x = np.zeros((A.shape[1], y.shape[1]))
+        niter, resnorm = np.zeros(y.shape[1], dtype=int), np.zeros(y.shape[1])
+        for p in range(y.shape[1]):
+            x[:, p], niter[p], resnorm[p] = _iterative_lstsq(A, y[:, p], None if wgts is None else wgts[:, p],
+                                                             x[:, p-1] if p > 0 else x[:, p], method, tol, maxiter)
+        return x, niter, resnorm
+
+
+    def logcal(self, data, wgts=None, rcond=1e-15, method='pinv', tol=1e-10, solver_maxiter=None):
+        """Solves the log-linearized redcal equations.
+
+        Args:
+            data: stacked visibility data of shape (Nbls, ...)
+            wgts: stacked linear weights of the same shape as data. Default None means equal weights.
+            rcond: cutoff ratio for small singular values in the pseudo-inverse
+            method: 'pinv' (default) factors the normal matrix. 'lsqr' or 'cg' solve each pixel with
+                a preconditioned iterative sparse solver, warm-started from the previous pixel,
+                and record their per-pixel iterations and residual norms in self.solver_meta.
+            tol: relative tolerance of the iterative solvers
+            solver_maxiter: maximum iterations of the iterative solvers. None uses scipy's default.
+
+        Returns:
+            prms: array of shape (Nprms, ...) of gains followed by unique baseline visibilities
+        """
+
+        shape = data.shape[1:]
+        # single precision data is solved in double precision
+        logd = np.log(data.reshape(self.nbls, -1), dtype=np.complex128)
+        w = None if wgts is None else wgts.reshape(self.nbls, -1)
+        self.solver_meta = {}
+        if method == 'pinv':
+            amp = self._solve_linear('amp', logd.real, w, rcond)
+            phs = self._solve_linear('phs', logd.imag, w, rcond)
+        else:
+            amp, amp_iter, amp_res = self._solve_iterative('amp', logd.real, w, method, tol, solver_maxiter)
+            phs, phs_iter, phs_res = self._solve_iterative('phs', logd.imag, w, method, tol, solver_maxiter)
+            self.solver_meta = {'solver_iter': (amp_iter + phs_iter).reshape(shape),
+                                'solver_resnorm': np.sqrt(amp_res**2 + phs_res**2).reshape(shape)}
+        return np.exp(amp + 1j * phs).reshape((self.nprms,) + shape)
+
+
+    def _lincal_step(self, data, prms, wgts, rcond, pix_batch=None):
+        """Solves the Taylor-expanded redcal equations about prms (Nprms, Npix) for a correction.
+        The dense (2 Nprms)^2 normal matrices are built and inverted for at most pix_batch pixels
+        at a time. Default None picks the batch so that they take up about LINCAL_BATCH_BYTES."""
+
+        npix, n = data.shape[1], 2 * self.nprms
+        if pix_batch is None:
+            pix_batch = max(1, LINCAL_BATCH_BYTES // (3 * 8 * n * n))
+        dx = np.empty((n, npix))
+        for p0 in range(0, npix, pix_batch):
+            p = slice(p0, min(p0 + pix_batch, npix))
+            gi, gj_conj, ubl = prms[self.ant1, p], prms[self.ant2, p].conj(), prms[self.ubl_col, p]
+            c1, c2, c3 = gj_conj * ubl, gi * ubl, gi * gj_conj
+            res = data[:, p] - gi * c1
+            # d(model) = c1 dg_i + c2 conj(dg_j) + c3 dV_ubl, split into real and imaginary equations
+            re_row = np.array([c1.real, -c1.imag, c2.real, c2.imag, c3.real, -c3.imag]).swapaxes(0, 1)
+            im_row = np.array([c1.imag, c1.real, c2.imag, -c2.real, c3.imag, c3.real]).swapaxes(0, 1)
+            if wgts is not None:
+                re_w, im_w = re_row * wgts[:, None, p], im_row * wgts[:, None, p]
+            else:
+                re_w, im_w = re_row, im_row
+            nb = c1.shape[1]
+            AtA = self._AtA_scatter.dot((re_w[:,:,None] * re_row[:,None,:] + im_w[:,:,None] * im_row[:,None,:]).reshape(-1, nb))
+            Aty = self._Aty_scatter.dot((re_w * res.real[:,None] + im_w * res.imag[:,None]).reshape(-1, nb))
+            AtAi = np.linalg.pinv(AtA.reshape(n, n, nb).transpose((2, 0, 1)), rcond=rcond)
+            dx[:, p] = np.einsum('pij,jp->ip', AtAi, Aty)
+        return dx[:self.nprms] + 1j * dx[self.nprms:]
+
+
+    def _lincal_step_iterative(self, data, prms, wgts, method, tol, maxiter):
+        """Like _lincal_step, but solves each pixel with an iterative sparse solver (see
+        _iterative_lstsq), warm-started from the previous pixel's correction. Also returns the
+        per-pixel solver iterations and residual norms."""
+
+        gi, gj_conj, ubl = prms[self.ant1], prms[self.ant2].conj(), prms[self.ubl_col]
+        c1, c2, c3 = gj_conj * ubl, gi * ubl, gi * gj_conj
+        res = data - gi * c1
+        rows = np.concatenate([np.array([c1.real, -c1.imag, c2.real, c2.imag, c3.real, -c3.imag]).swapaxes(0, 1),
+                               np.array([c1.imag, c1.real, c2.imag, -c2.real, c3.imag, c3.real]).swapaxes(0, 1)])
+        y = np.concatenate([res.real, res.imag])
+        w = None if wgts is None else np.concatenate([wgts, wgts])
+        indices, indptr = np.tile(self._cols6.flatten(), 2), np.arange(0, 12 * self.nbls + 1, 6)
+        npix, n = data.shape[1], 2 * self.nprms
+        dx = np.zeros((n, npix))
+        niter, resnorm = np.zeros(npix, dtype=int), np.zeros(npix)
+        for p in range(npix):
+            J = sps.csr_matrix((rows[:, :, p].flatten(), indices, indptr), shape=(2 * self.nbls, n))
+            dx[:, p], niter[p], resnorm[p] = _iterative_lstsq(J, y[:, p], None if w is None else w[:, p],
+                                                              dx[:, p-1] if p > 0 else dx[:, p], method, tol, maxiter)
+        return dx[:self.nprms] + 1j * dx[self.nprms:], niter, resnorm
+
+
+    def lincal(self, data, prms0, wgts=None, conv_crit=1e-10, maxiter=50, method='pinv', tol=1e-10,
+               solver_maxiter=None, rcond=1e-15, pix_batch=None):
+        """Iteratively solves the Taylor-expanded redcal equations with Gauss-Newton steps. Each
+        pixel stops iterating as soon as it has converged, so only the pixels that are still
+        changing are solved for in later iterations.
+
+        Args:
+            data: stacked visibility data of shape (Nbls, ...)
+            prms0: starting guess of shape (Nprms, ...) of gains followed by unique baseline visibilities
+            wgts: stacked linear weights of the same shape as data. Default None means equal weights.
+            conv_crit: maximum allowed relative change in solutions to be considered converged
+            maxiter: maximum number of lincal iterations allowed before it gives up
+            method: 'pinv' (default) or 'lsqr'/'cg', which solve each step per pixel with a
+                preconditioned iterative sparse solver, warm-started from the previous pixel
+            tol: relative tolerance of the iterative solvers
+            solver_maxiter: maximum iterations of the iterative solvers. None uses scipy's default.
+            rcond: cutoff ratio for small singular values in the 'pinv' pseudo-inverse
+            pix_batch: maximum number of pixels whose normal matrices are solved together by 'pinv'.
+                Default None bounds their memory to about LINCAL_BATCH_BYTES.
+
+        Returns:
+            meta: dictionary with the per-pixel number of iterations, chi^2 and convergence criterion.
+                Iterative methods add the total solver iterations ('solver_iter') and the residual
+                norm of the last step's linear system ('solver_resnorm') for each pixel.
+            prms: array of shape (Nprms, ...) of gains followed by unique baseline visibilities
+        """
+
+        shape = data.shape[1:]
+        d = data.reshape(self.nbls, -1)
+        w = None if wgts is None else wgts.reshape(self.nbls, -1)
+        prms = np.array(prms0, dtype=np.complex128).reshape(self.nprms, -1)
+        iters, conv = np.zeros(prms.shape[1], dtype=int), np.zeros(prms.shape[1])
+        solver_iter, solver_resnorm = np.zeros(prms.shape[1], dtype=int), np.zeros(prms.shape[1])
+        active = np.arange(prms.shape[1])
+        for i in range(1, maxiter + 1):
+            w_active = None if w is None else w[:, active]
+            if method == 'pinv':
+                step = self._lincal_step(d[:, active], prms[:, active], w_active, rcond, pix_batch)
+            else:
+                step, niter, solver_resnorm[active] = self._lincal_step_iterative(d[:, active], prms[:, active],
+                                                                                   w_active, method, tol, solver_maxiter)
+                solver_iter[active] += niter
+            new_prms = prms[:, active] + step
+            conv[active] = np.linalg.norm(new_prms - prms[:, active], axis=0) / np.linalg.norm(new_prms, axis=0)
+            prms[:, active] = new_prms
+            iters[active] = i
+            active = active[conv[active] >= conv_crit]
+            if len(active) == 0:
+                break
+        meta = {'iter': iters.reshape(shape), 'chisq': self.chisq(d, prms, w).reshape(shape),
+                'conv_crit': conv.reshape(shape)}
+        if method != 'pinv':
+            meta.update({'solver_iter': solver_iter.reshape(shape), 'solver_resnorm': solver_resnorm.reshape(shape)})
+        return meta, prms.reshape((self.nprms,) + shape)
+
+
+def _slice_freqs(dic, f0, f1, nfreqs):
+    """Slices the frequency (last) axis of every array in a dictionary that spans all nfreqs
+    frequencies. Scalars and arrays without a full frequency axis are passed through. A
+    LazyDataContainer is sliced without reading it, so that only the chunk is loaded."""
+
+    if isinstance(dic, LazyDataContainer):
+        return dic.select_freqs(f0, f1)
+    return {k: (v[..., f0:f1] if np.ndim(v) > 0 and np.shape(v)[-1] == nfreqs else v) for k,v in dic.items()}
+
+
+def _slice_times(dic, t0, t1, ntimes):
+    """Slices the time (first) axis of every 2D array in a dictionary that spans all ntimes
+    integrations. Scalars and arrays without a full time axis are passed through."""
+
+    return {k: (v[t0:t1] if np.ndim(v) > 1 and np.shape(v)[0] == ntimes else v) for k,v in dic.items()}
+
+
+def _concatenate_freqs(chunks):
+    """Merges a list of per-chunk dictionaries back together along the frequency (last) axis.
+    Scalars (e.g. linsolve's iteration count) are combined by taking their maximum."""
+
+    merged = {}
+    for k in chunks[0].keys():
+        if np.ndim(chunks[0][k]) == 0:
+            merged[k] = np.max([chunk[k] for chunk in chunks])
+        else:
+            merged[k] = np.concatenate([chunk[k] for chunk in chunks], axis=-1)
+    return merged
+
+
+# Work shared with forked worker processes by _redcal_freq_chunk. Workers inherit it when the
+# pool is created, so the data is shared through (copy-on-write) memory rather than pickled.
+_FREQ_CHUNK_JOB = {}
+
+
+def _redcal_freq_chunk(bounds):
+    """Runs a RedundantCalibrator method on one frequency chunk of the current _FREQ_CHUNK_JOB."""
+
+    rc, cal, data, sol0, wgts, kwargs = [_FREQ_CHUNK_JOB[k] for k in
+        ['rc', 'cal', 'data', 'sol0', 'wgts', 'kwargs']]
+    f0, f1 = bounds
+    nfreqs = _FREQ_CHUNK_JOB['nfreqs']
+    out = getattr(rc, cal)(_slice_freqs(data, f0, f1, nfreqs), _slice_freqs(sol0, f0, f1, nfreqs),
+                              wgts=_slice_freqs(wgts, f0, f1, nfreqs), **kwargs)
+    return (rc.solver_meta, out) if cal == 'logcal' else out
+
+
+_BLOCK_JOB = {}
+
+
+def _redcal_block(block):
+    """Runs a RedundantCalibrator method on one independent parameter block of the current _BLOCK_JOB."""
+
+    rc, cal, data, sol0, wgts, kwargs = [_BLOCK_JOB[k] for k in
+        ['rc', 'cal', 'data', 'sol0', 'wgts', 'kwargs']]
+    bls, prms = block
+    out = getattr(rc, cal)({bl: data[bl] for bl in bls}, {k: sol0[k] for k in prms if sol0.has_key(k)},
+                              wgts={bl: wgts[bl] for bl in bls if wgts.has_key(bl)}, **kwargs)
+    return (rc.solver_meta, out) if cal == 'logcal' else out
+
+
+def _merge_block_metas(metas):
+    """Combines logcal/lincal metas of independent blocks: chi^2 and solver iterations add up and
+    residual norms add in quadrature, while iterations and convergence take the worst block."""
+
+    meta = {}
+    for k in metas[0].keys():
+        if k in ['chisq', 'solver_iter']:
+            meta[k] = np.sum([m[k] for m in metas], axis=0)
+        elif k == 'solver_resnorm':
+            meta[k] = np.sqrt(np.sum([np.abs(m[k])**2 for m in metas], axis=0))
+        else:
+            meta[k] = np.max([m[k] for m in metas], axis=0)
+    return meta
 
 
 class RedundantCalibrator:
 
-    def __init__(self, reds):
+    def __init__(self, reds, cache_size=8, nprocs=1, chunk_size=None, split_blocks=False, dtype=None):
         """Initialization of a class object for performing redundant calibration with logcal
-        and lincal, both utilizing linsolve, and also degeneracy removal.
+        and lincal, utilizing either linsolve or the array-based RedcalSystem, and also degeneracy removal.
 
         Args:
             reds: list of lists of redundant baseline tuples, e.g. (ind1,ind2,pol). The first
                 item in each list will be treated as the key for the unique baseline
+            cache_size: maximum number of compiled RedcalSystems (index arrays, sparse matrix
+                templates and factorizations) kept for reuse by the array backend. Default 8.
+            nprocs: number of processes over which logcal and lincal split the data along the
+                frequency axis. Default 1 runs in the calling process.
+            chunk_size: number of frequency channels per chunk. Default None uses one chunk per
+                process. Setting it with nprocs=1 solves the chunks one after another. For a
+                LazyDataContainer, only one chunk of each baseline is read into memory at a time.
+            split_blocks: if True, logcal and lincal solve groups of parameters that share no
+                baselines (e.g. the two polarizations in 2pol or disconnected sub-arrays) as
+                separate, smaller systems (see param_blocks), and lincal's meta combines the
+                blocks' metas. With nprocs > 1 the blocks are solved in parallel instead of
+                splitting the frequency axis. Default False solves everything jointly.
+            dtype: complex dtype of the returned gains and visibilities. Default None returns
+                np.complex64 for single precision data and np.complex128 otherwise. The solves
+                themselves always run in double precision.
         """
 
         self.reds = reds
         self.pol_mode = parse_pol_mode(self.reds)
+        self.cache_size = cache_size
+        self._system_cache = OrderedDict()
+        self._degen_cache = OrderedDict()
+        self.nprocs = nprocs
+        self.chunk_size = chunk_size
+        self.split_blocks = split_blocks
+        self.dtype = dtype
+        self.warm_sol = None
+        self._cold_chisq, self._cold_iter = None, None  # median chi^2 and iterations of the last cold start
+        self.solver_meta = {}
+
+
+    def _get_system(self, bls_in_data):
+        """Returns a RedcalSystem for the baselines in the data. Compiled systems are cached on
+        (reds, bls_in_data, pol_mode), keeping the cache_size most recently used ones, so that
+        repeated calls on new data with the same layout only pay for the numerical work."""
+
+        key = (tuple(tuple(blgrp) for blgrp in self.reds), frozenset(bls_in_data), self.pol_mode)
+        try:
+            rs = self._system_cache.pop(key)
+        except(KeyError):
+            rs = RedcalSystem(self.reds, key[1])
+        self._system_cache[key] = rs
+        while len(self._system_cache) > self.cache_size:
+            self._system_cache.popitem(last=False)
+        return rs
+
+
+    def clear_cache(self):
+        """Empties the caches of compiled RedcalSystems and degeneracy projectors."""
+
+        self._system_cache.clear()
+        self._degen_cache.clear()
+
+
+    def _run_freq_chunks(self, cal, data, sol0, wgts, **kwargs):
+        """Splits data, sol0 and wgts along the frequency axis into chunks of self.chunk_size
+        channels, runs cal ('logcal' or 'lincal') on each chunk in a pool of self.nprocs
+        processes and stitches the chunks back together. self.phs_avg is reset to None, since
+        each chunk detrends its own phases."""
+
+        global _FREQ_CHUNK_JOB
+        nfreqs = np.shape(data[data.keys()[0]])[-1]
+        chunk_size = self.chunk_size or int(np.ceil(nfreqs / float(self.nprocs)))
+        bounds = [(f0, min(f0 + chunk_size, nfreqs)) for f0 in range(0, nfreqs, chunk_size)]
+        rc = copy(self)
+        rc.nprocs, rc.chunk_size = 1, None
+        _FREQ_CHUNK_JOB = {'rc': rc, 'cal': cal, 'data': data, 'sol0': sol0, 'wgts': wgts,
+                           'kwargs': kwargs, 'nfreqs': nfreqs}
+        try:
+            results = self._map(_redcal_freq_chunk, bounds)
+        finally:
+            _FREQ_CHUNK_JOB = {}
+        metas, sols = zip(*results)
+        self.phs_avg = None
+        if cal == 'logcal':
+            self.solver_meta = _concatenate_freqs(metas)
+            return _concatenate_freqs(sols)
+        return _concatenate_freqs(metas), _concatenate_freqs(sols)
+
+
+    def _run_blocks(self, cal, blocks, data, sol0, wgts, **kwargs):
+        """Runs cal ('logcal' or 'lincal') separately on each independent parameter block in
+        blocks (see param_blocks), in a pool of self.nprocs processes, and merges the solutions.
+        self.phs_avg is reset to None, since each block detrends its own phases."""
+
+        global _BLOCK_JOB
+        if cal == 'logcal':
+            # starting gains are only divided out, so every block can take all of them
+            blocks = [(bls, sol0.keys()) for bls,block_prms in blocks]
+        rc = copy(self)
+        rc.nprocs, rc.split_blocks = 1, False
+        if self.nprocs > 1:
+            rc.chunk_size = None
+        _BLOCK_JOB = {'rc': rc, 'cal': cal, 'data': data, 'sol0': sol0, 'wgts': wgts, 'kwargs': kwargs}
+        try:
+            results = self._map(_redcal_block, blocks)
+        finally:
+            _BLOCK_JOB = {}
+        metas, sols = zip(*results)
+        self.phs_avg = None
+        sol = {}
+        for block_sol in sols:
+            sol.update(block_sol)
+        if cal == 'logcal':
+            self.solver_meta = _merge_block_metas(metas)
+            return sol
+        return _merge_block_metas(metas), sol
+
+
+    def _cast_sol(self, sol, data):
+        """Casts the arrays in sol to self.dtype, or, if that is None, to the complex dtype that
+        matches the precision of data."""
+
+        dtype = self.dtype
+        if dtype is None:
+            dtype = np.result_type(np.complex64, data[data.keys()[0]])
+        return {k: np.asarray(v, dtype=dtype) for k,v in sol.items()}
+
+
+    def _map(self, func, tasks):
+        """Maps func over tasks in a pool of self.nprocs processes, or serially for nprocs=1."""
+
+        if self.nprocs > 1 and len(tasks) > 1:
+            pool = multiprocessing.Pool(min(self.nprocs, len(tasks)))
+            try:
+                return pool.map(func, tasks)
+            finally:
+                pool.close()
+                pool.join()
+        return map(func, tasks)
 
 
     def build_eqs(self, bls_in_data):
@@ -300,22 +1090,24 @@ class RedundantCalibrator:
             solver: instantiated solver with redcal equations and weights
         """
 
-        dc = DataContainer(data)
+        dc = _as_container(data)
         eqs = self.build_eqs(dc.keys())
-        self.phs_avg = {} # detrend phases within redundant group, used for logcal to avoid phase wraps
+        self.phs_avg = None # detrend phases within redundant group, used for logcal to avoid phase wraps
         if detrend_phs:
-            for blgrp in self.reds:
-                self.phs_avg[blgrp[0]] = np.exp(-1j*np.median(np.unwrap([np.log(dc[bl]).imag for bl in blgrp],axis=0), axis=0))
-                for bl in blgrp:
-                    self.phs_avg[bl] = self.phs_avg[blgrp[0]]
+            rs = self._get_system(dc.keys())
+            d = rs.stack_data(dc)
+            self.phs_avg = rs.phs_avg(d)
+            d *= self.phs_avg[rs.ubl]
+            dc = DataContainer(dict(zip(rs.bls, d)))
         d_ls,w_ls = {}, {}
         for eq,key in eqs.items():
-            d_ls[eq] = dc[key] * self.phs_avg.get(key,1)
+            d_ls[eq] = np.asarray(dc[key], dtype=np.complex128)
         if len(wgts) > 0:
-            wc = DataContainer(wgts)
+            wc = _as_container(wgts)
             for eq,key in eqs.items(): w_ls[eq] = wc[key]
         return solver(data=d_ls, wgts=w_ls, sparse=sparse, **kwargs)
 
+
     def unpack_sol_key(self, k):
         """Turn linsolve's internal variable string into antenna or baseline tuple (with polarization)."""
 
@@ -339,15 +1131,11 @@ class RedundantCalibrator:
         """Given a set of guess gain solutions, return a dictionary of calibrated visbilities
         averged over a redundant group. Not strictly necessary for typical operation."""
 
-        dc = DataContainer(data)
-        ubl_sols = {}
-        for ubl, blgrp in enumerate(self.reds):
-            d_gp = [dc[bl] for bl in blgrp]
-            ubl_sols[blgrp[0]] = np.average(d_gp, axis=0) # XXX add option for median here?
-        return ubl_sols
+        return _as_container(data).mean(self.reds) # XXX add option for median here?
 
 
-    def logcal(self, data, sol0={}, wgts={}, sparse=False):
+    def logcal(self, data, sol0={}, wgts={}, sparse=False, backend='linsolve', method='pinv', tol=1e-10,
+               solver_maxiter=None):
         """Takes the log to linearize redcal equations and minimizes chi^2.
 
         Args:
@@ -358,29 +1146,60 @@ class RedundantCalibrator:
                 Default empty dictionary does nothing.
             wgts: dictionary of linear weights in the same format as data. Defaults to equal wgts.
             sparse: represent the A matrix (visibilities to parameters) sparsely in linsolve
+            backend: 'linsolve' (default) builds and solves linsolve equation strings. 'array'
+                uses RedcalSystem, which builds the equations from antenna and unique baseline
+                index arrays and ignores the sparse argument.
+            method: how the array backend solves the linear systems. 'pinv' (default) uses a
+                pseudo-inverse of the normal matrix. 'lsqr' and 'cg' use preconditioned iterative
+                sparse solvers on each pixel, warm-started from the previous pixel, and store
+                per-pixel solver iterations and residual norms in self.solver_meta.
+            tol: relative tolerance of the iterative solvers, trading accuracy for speed
+            solver_maxiter: maximum iterations of the iterative solvers. None uses scipy's default.
 
         Returns:
             sol: dictionary of gain and visibility solutions in the {(index,antpol): np.array}
                 and {(ind1,ind2,pol): np.array} formats respectively
         """
 
-        try: # XXX Can this be done in the unittests instead? -ARP
-            import linsolve
-        except(ImportError):
-            import unittest
-            raise unittest.SkipTest('linsolve not detected. linsolve must be installed for this functionality')
-
-        fc_data = divide_by_gains(data, sol0, target_type='vis')
-        ls = self._solver(linsolve.LogProductSolver, fc_data, wgts=wgts, detrend_phs=True, sparse=sparse)
-        sol = ls.solve()
-        sol = {self.unpack_sol_key(k): sol[k] for k in sol.keys()}
-        for ubl_key in [k for k in sol.keys() if len(k) == 3]:
-            sol[ubl_key] = sol[ubl_key] * self.phs_avg[ubl_key].conj()
+        if method != 'pinv' and backend != 'array':
+            raise ValueError, 'method %s requires backend="array"' % method
+        solver_kwargs = {'sparse': sparse, 'backend': backend, 'method': method, 'tol': tol,
+                         'solver_maxiter': solver_maxiter}
+        if self.split_blocks:
+            blocks = param_blocks(self.reds, _as_container(data).keys())
+            if len(blocks) > 1:
+                return self._run_blocks('logcal', blocks, data, sol0, wgts, **solver_kwargs)
+        if self.nprocs > 1 or self.chunk_size is not None:
+            return self._run_freq_chunks('logcal', data, sol0, wgts, **solver_kwargs)
+
+        rs = self._get_system(_as_container(data).keys())
+
+        self.solver_meta = {}
+        if backend == 'array':
+            d = divide_by_gains(rs.stack_data(data), sol0, inplace=True, bls=rs.bls)
+            self.phs_avg = rs.phs_avg(d)
+            d *= self.phs_avg[rs.ubl]
+            sol = rs.unstack_sol(rs.logcal(d, wgts=rs.stack_wgts(wgts, d.shape[1:]), method=method, tol=tol,
+                                           solver_maxiter=solver_maxiter))
+            self.solver_meta = rs.solver_meta
+        else:
+            fc_data = divide_by_gains(data, sol0, target_type='vis')
+            try: # XXX Can this be done in the unittests instead? -ARP
+                import linsolve
+            except(ImportError):
+                import unittest
+                raise unittest.SkipTest('linsolve not detected. linsolve must be installed for this functionality')
+            ls = self._solver(linsolve.LogProductSolver, fc_data, wgts=wgts, detrend_phs=True, sparse=sparse)
+            sol = ls.solve()
+            sol = {self.unpack_sol_key(k): sol[k] for k in sol.keys()}
+        for ubl_key, phs_avg in zip(rs.ubls, self.phs_avg):
+            sol[ubl_key] = sol[ubl_key] * phs_avg.conj()
         sol_with_fc = multiply_by_gains(sol, sol0, target_type='gain')
-        return sol_with_fc
+        return self._cast_sol(sol_with_fc, data)
 
 
-    def lincal(self, data, sol0, wgts={}, sparse=False, conv_crit=1e-10, maxiter=50):
+    def lincal(self, data, sol0, wgts={}, sparse=False, conv_crit=1e-10, maxiter=50, backend='linsolve',
+               method='pinv', tol=1e-10, solver_maxiter=None, rcond=1e-15):
         """Taylor expands to linearize redcal equations and iteratively minimizes chi^2.
 
         Args:
@@ -391,13 +1210,41 @@ class RedundantCalibrator:
             sparse: represent the A matrix (visibilities to parameters) sparsely in linsolve
             conv_crit: maximum allowed relative change in solutions to be considered converged
             max_iter: maximum number of lincal iterations allowed before it gives up
+            backend: 'linsolve' (default) builds and solves linsolve equation strings. 'array'
+                uses RedcalSystem, which builds the equations from antenna and unique baseline
+                index arrays and ignores the sparse argument.
+            method: 'pinv' (default), 'lsqr' or 'cg'; how the array backend solves each step (see logcal)
+            tol: relative tolerance of the iterative solvers, trading accuracy for speed
+            solver_maxiter: maximum iterations of the iterative solvers. None uses scipy's default.
+            rcond: cutoff ratio for small singular values in the array backend's pseudo-inverse
 
         Returns:
-            meta: dictionary of information about the convergence and chi^2 of the solution
+            meta: dictionary of information about the convergence and chi^2 of the solution. With
+                the array backend, meta['iter'] holds the number of iterations for each pixel.
+                Iterative methods add per-pixel 'solver_iter' and 'solver_resnorm'.
             sol: dictionary of gain and visibility solutions in the {(index,antpol): np.array}
                 and {(ind1,ind2,pol): np.array} formats respectively
         """
 
+        if method != 'pinv' and backend != 'array':
+            raise ValueError, 'method %s requires backend="array"' % method
+        solver_kwargs = {'sparse': sparse, 'conv_crit': conv_crit, 'maxiter': maxiter, 'backend': backend,
+                         'method': method, 'tol': tol, 'solver_maxiter': solver_maxiter, 'rcond': rcond}
+        if self.split_blocks:
+            blocks = param_blocks(self.reds, _as_container(data).keys())
+            if len(blocks) > 1:
+                return self._run_blocks('lincal', blocks, data, sol0, wgts, **solver_kwargs)
+        if self.nprocs > 1 or self.chunk_size is not None:
+            return self._run_freq_chunks('lincal', data, sol0, wgts, **solver_kwargs)
+
+        if backend == 'array':
+            rs = self._get_system(_as_container(data).keys())
+            d = rs.stack_data(data)
+            meta, prms = rs.lincal(d, rs.stack_sol(sol0), wgts=rs.stack_wgts(wgts, d.shape[1:]),
+                                   conv_crit=conv_crit, maxiter=maxiter, method=method, tol=tol,
+                                   solver_maxiter=solver_maxiter, rcond=rcond)
+            return meta, self._cast_sol(rs.unstack_sol(prms), data)
+
         try: # XXX Can this be done in the unittests instead? -ARP
             import linsolve
         except(ImportError):
@@ -408,9 +1255,165 @@ class RedundantCalibrator:
         ls = self._solver(linsolve.LinProductSolver, data, sol0=sol0, wgts=wgts, sparse=sparse)
         meta, sol = ls.solve_iteratively(conv_crit=conv_crit, maxiter=maxiter)
         sol = {self.unpack_sol_key(k): sol[k] for k in sol.keys()}
+        return meta, self._cast_sol(sol, data)
+
+
+    def warm_lincal(self, data, sol0={}, wgts={}, sparse=False, conv_crit=1e-10, maxiter=50,
+                    chisq_jump=10., backend='linsolve'):
+        """Runs lincal one integration at a time, starting each integration from the converged
+        solution of the previous one. The last solution is kept in self.warm_sol, so consecutive
+        calls (e.g. on consecutive files) continue the warm start. Integrations fall back to a
+        logcal starting point when there is no previous solution or when the median chi^2 of the
+        warm-started solution exceeds chisq_jump times that of the most recent cold start. A
+        warm_sol seeded by the user is accepted until there has been a cold start to compare to.
+        Set self.warm_sol to None to force a cold start.
+
+        Args:
+            data: visibility data in the dictionary format {(ant1,ant2,pol): np.array}
+            sol0: dictionary of starting (e.g. firstcal) gains in the {(ant,antpol): np.array}
+                format, passed to logcal for cold starts.
+            wgts: dictionary of linear weights in the same format as data. Defaults to equal wgts.
+            sparse: represent the A matrix (visibilities to parameters) sparsely in linsolve
+            conv_crit: maximum allowed relative change in solutions to be considered converged
+            maxiter: maximum number of lincal iterations allowed before it gives up
+            chisq_jump: factor by which the median chi^2 may rise above that of the last cold
+                start before the integration is recomputed from logcal
+            backend: 'linsolve' (default) or 'array', see lincal
+
+        Returns:
+            meta: dictionary of information about the convergence and chi^2 of the solution.
+                'iter', 'chisq' and 'conv_crit' have the shape of the data. 'cold_start' marks
+                the integrations started from logcal. 'iter_saved' is the number of iterations
+                saved relative to the most recent cold start (negative when a warm start was
+                tried and rejected, and 0 when there has been no cold start yet).
+            sol: dictionary of gain and visibility solutions in the {(index,antpol): np.array}
+                and {(ind1,ind2,pol): np.array} formats respectively
+        """
+
+        ntimes, nfreqs = np.shape(data[data.keys()[0]])
+        meta = {k: np.zeros((ntimes, nfreqs), dtype=dt) for k,dt in
+                [('iter', int), ('iter_saved', int), ('chisq', float), ('conv_crit', float)]}
+        meta['cold_start'] = np.zeros(ntimes, dtype=bool)
+        lincal_kwargs = {'sparse': sparse, 'conv_crit': conv_crit, 'maxiter': maxiter, 'backend': backend}
+        sols = []
+        for t in range(ntimes):
+            d_t, w_t = _slice_times(data, t, t+1, ntimes), _slice_times(wgts, t, t+1, ntimes)
+            meta_t, wasted = None, 0
+            if self.warm_sol is not None:
+                meta_t, sol_t = self.lincal(d_t, self.warm_sol, wgts=w_t, **lincal_kwargs)
+                if self._cold_chisq is not None and np.median(meta_t['chisq']) > chisq_jump * self._cold_chisq:
+                    meta_t, wasted = None, meta_t['iter']
+            if meta_t is None:
+                sol0_t = self.logcal(d_t, sol0=_slice_times(sol0, t, t+1, ntimes), wgts=w_t,
+                                     sparse=sparse, backend=backend)
+                meta_t, sol_t = self.lincal(d_t, sol0_t, wgts=w_t, **lincal_kwargs)
+                self._cold_iter, self._cold_chisq = meta_t['iter'], np.median(meta_t['chisq'])
+                meta['cold_start'][t] = True
+                meta['iter_saved'][t] = -np.array(wasted)
+            elif self._cold_iter is not None:
+                meta['iter_saved'][t] = np.array(self._cold_iter) - meta_t['iter']
+            for k in ['iter', 'chisq', 'conv_crit']:
+                meta[k][t] = meta_t[k]
+            sols.append(sol_t)
+            self.warm_sol = sol_t
+        sol = {k: np.concatenate([sol_t[k] for sol_t in sols]) for k in sols[0].keys()}
         return meta, sol
 
 
+    def _get_degen_projectors(self, antpos, ants, bl_pairs):
+        """Returns the matrices remove_degen uses to project out and restore degeneracies, along
+        with the indices of the gains entering each antpol's amplitude renormalization. These
+        only depend on the array layout, so they are cached on (pol_mode, ants, bl_pairs, antpos)
+        and kept for the cache_size most recently used layouts.
+
+        Args:
+            antpos: dictionary of antenna positions in the form {ant_index: np.array([x,y,z])}.
+            ants: list of (index,antpol) gain keys, in the order gains are stacked
+            bl_pairs: list of (ind1,ind2,pol) visibility keys, in the order they are stacked
+
+        Returns:
+            proj: dictionary with 'Rgains', 'Rvis' and 'Mgains' matrices and 'amp_terms', a list
+                of (gain mask, first and second visibility pol masks, ant1 indices, ant2 indices)
+                per antpol
+        """
+
+        used_ants = sorted(set([ant[0] for ant in ants] + [i for bl in bl_pairs for i in bl[:2]]))
+        key = (self.pol_mode, tuple(ants), tuple(bl_pairs),
+               tuple((i, tuple(np.ravel(antpos[i]))) for i in used_ants))
+        try:
+            proj = self._degen_cache.pop(key)
+        except(KeyError):
+            proj = self._build_degen_projectors(antpos, ants, bl_pairs)
+        self._degen_cache[key] = proj
+        while len(self._degen_cache) > self.cache_size:
+            self._degen_cache.popitem(last=False)
+        return proj
+
+
+    def _build_degen_projectors(self, antpos, ants, bl_pairs):
+        """Computes the (uncached) output of _get_degen_projectors."""
+
+        gainPols = np.array([ant[1] for ant in ants])
+        # gainPols is list of antpols, one per antenna
+        antpols = list(set(gainPols))
+        positions = np.array([antpos[ant[0]] for ant in ants])
+        visPols = np.array([[bl[2][0], bl[2][1]] for bl in bl_pairs])
+        # visPols is list of pol, one per baseline
+        bl_vecs = np.array([antpos[bl_pair[0]] - antpos[bl_pair[1]] for bl_pair in bl_pairs])
+
+        ant_index = {ant: n for n,ant in enumerate(ants)}
+        ubls = set(bl_pairs)
+        amp_terms = []
+        for antpol in antpols:
+            bls_for_average = [bl for bls in self.reds for bl in bls if (bl[2] == 2*antpol) and (bls[0] in ubls)]
+            i1 = np.array([ant_index[(ant1,pol[0])] for (ant1,ant2,pol) in bls_for_average])
+            i2 = np.array([ant_index[(ant2,pol[1])] for (ant1,ant2,pol) in bls_for_average])
+            amp_terms.append((gainPols == antpol, visPols[:,0] == antpol, visPols[:,1] == antpol, i1, i2))
+
+        if self.pol_mode is '1pol' or self.pol_mode is '4pol_minV':
+            # In 1pol and 4pol_minV, the phase degeneracies are 1 overall phase and 2 tip-tilt terms
+            # Rgains maps gain phases to degenerate parameters (either average phases or phase slopes)
+            Rgains = np.hstack((positions, np.ones((positions.shape[0],1))))
+            # Rvis maps visibility phases to the same set of degenerate parameters, keeping chi^2 constant
+            Rvis = np.hstack((-bl_vecs, np.zeros((len(bl_vecs),1))))
+        else: # pole_mode is '4pol'
+            # two columns give sums for two different polarizations
+            phasePols = np.vstack((gainPols==antpols[0], gainPols==antpols[1])).T
+            Rgains = np.hstack((positions, phasePols))
+            # These terms detect cross terms only, which pick up overall phase terms in 4pol (see HERA memo #30)
+            is_ab = np.array((visPols[:,0] == antpols[0]) * (visPols[:,1] == antpols[1]),dtype=float)
+            is_ba = np.array((visPols[:,0] == antpols[1]) * (visPols[:,1] == antpols[0]),dtype=float)
+            visPhaseSigns = np.vstack((is_ab-is_ba, is_ba-is_ab)).T
+            Rvis = np.hstack((-bl_vecs, -visPhaseSigns))
+        # Mgains is like (AtA)^-1 At in linear estimator formalism. It's a normalized estimator of degeneracies
+        Mgains = np.linalg.pinv(Rgains.T.dot(Rgains)).dot(Rgains.T)
+        return {'Rgains': Rgains, 'Rvis': Rvis, 'Mgains': Mgains, 'amp_terms': amp_terms}
+
+
+    def compute_chisq(self, data, sol, wgts={}):
+        """Computes the chi^2 of a redcal solution in one vectorized pass over the stacked data,
+        without building model visibilities for every baseline in a dictionary.
+
+        Args:
+            data: visibility data in the dictionary format {(ant1,ant2,pol): np.array}
+            sol: dictionary of gain and visibility solutions in the {(index,antpol): np.array}
+                and {(ind1,ind2,pol): np.array} formats respectively
+            wgts: dictionary of linear weights in the same format as data. Defaults to equal wgts.
+
+        Returns:
+            chisq: sum over baselines of wgts * |data - model|^2, with the shape of the data
+            chisq_per_ant: dictionary of chi^2 summed over the baselines that include each
+                antenna, in the {(index,antpol): np.array} format
+            chisq_per_ubl: dictionary of chi^2 summed over each redundant group, keyed by the
+                first baseline of the group
+        """
+
+        rs = self._get_system(_as_container(data).keys())
+        d = rs.stack_data(data)
+        chisq, chisq_per_ant, chisq_per_ubl = rs.chisq_terms(d, rs.stack_sol(sol), wgts=rs.stack_wgts(wgts, d.shape[1:]))
+        return chisq, dict(zip(rs.ants, chisq_per_ant)), dict(zip(rs.ubls, chisq_per_ubl))
+
+
     def remove_degen(self, antpos, sol, degen_sol=None):
         """ Removes degeneracies from solutions (or replaces them with those in degen_sol).
 
@@ -430,21 +1433,15 @@ class RedundantCalibrator:
         g, v = get_gains_and_vis_from_sol(sol)
         if degen_sol is None:
             degen_sol = {key: np.ones_like(val) for key,val in g.items()}
-        ants = g.keys()
-
-        gainPols = np.array([ant[1] for ant in ants])
-        # gainPols is list of antpols, one per antenna
-        antpols = list(set(gainPols))
-        positions = np.array([antpos[ant[0]] for ant in ants])
-        bl_pairs = v.keys()
-        visPols = np.array([[bl[2][0], bl[2][1]] for bl in bl_pairs])
-        # visPols is list of pol, one per baseline
-        bl_vecs = np.array([antpos[bl_pair[0]] - antpos[bl_pair[1]] for bl_pair in bl_pairs])
+        # sorted so that the stacking order, and with it the cached projectors, do not depend on dict order
+        ants = sorted(g.keys())
+        bl_pairs = sorted(v.keys())
         if self.pol_mode not in ['1pol', '2pol', '4pol', '4pol_minV']:
             raise ValueError, 'Remove_degen cannot operate on pol_mode determined from reds'
 
         #if mode is 2pol, run as two 1pol remove degens
         if self.pol_mode is '2pol':
+            antpols = list(set([ant[1] for ant in ants]))
             self.pol_mode = '1pol'
             newSol = self.remove_degen(antpos, {key: val for key,val in sol.items()
                      if antpols[0] in key[-1]}, degen_sol=degen_sol)
@@ -457,41 +1454,22 @@ class RedundantCalibrator:
         gainSols = np.array([sol[ant] for ant in ants])
         visSols = np.array([sol[bl_pair] for bl_pair in bl_pairs])
         degenGains = np.array([degen_sol[ant] for ant in ants])
+        proj = self._get_degen_projectors(antpos, ants, bl_pairs)
 
         #Amplitude renormalization: fixes the mean abs product of gains (as they appear in visibilities)
-        for antpol in antpols:
-            bls_for_average = [bl for bls in self.reds for bl in bls if (bl[2] == 2*antpol) and (bls[0] in bl_pairs)]
-            meanSqAmplitude = np.mean([np.abs(g[(ant1,pol[0])] * g[(ant2,pol[1])])
-                for (ant1,ant2,pol) in bls_for_average], axis=0)
-            degenMeanSqAmplitude = np.mean([np.abs(degen_sol[(ant1,pol[0])] * degen_sol[(ant2,pol[1])])
-                for (ant1,ant2,pol) in bls_for_average], axis=0)
-            gainSols[gainPols == antpol] *= (degenMeanSqAmplitude / meanSqAmplitude)**.5
-            visSols[visPols[:,0] == antpol] *= (meanSqAmplitude / degenMeanSqAmplitude)**.5
-            visSols[visPols[:,1] == antpol] *= (meanSqAmplitude / degenMeanSqAmplitude)**.5
+        for gainMask, visMask1, visMask2, i1, i2 in proj['amp_terms']:
+            meanSqAmplitude = np.mean(np.abs(gainSols[i1] * gainSols[i2]), axis=0)
+            degenMeanSqAmplitude = np.mean(np.abs(degenGains[i1] * degenGains[i2]), axis=0)
+            gainSols[gainMask] *= (degenMeanSqAmplitude / meanSqAmplitude)**.5
+            visSols[visMask1] *= (meanSqAmplitude / degenMeanSqAmplitude)**.5
+            visSols[visMask2] *= (meanSqAmplitude / degenMeanSqAmplitude)**.5
 
         # Fix phase terms
-        if self.pol_mode is '1pol' or self.pol_mode is '4pol_minV':
-            # In 1pol and 4pol_minV, the phase degeneracies are 1 overall phase and 2 tip-tilt terms
-            # Rgains maps gain phases to degenerate parameters (either average phases or phase slopes)
-            Rgains = np.hstack((positions, np.ones((positions.shape[0],1))))
-            # Rvis maps visibility phases to the same set of degenerate parameters, keeping chi^2 constant
-            Rvis = np.hstack((-bl_vecs, np.zeros((len(bl_vecs),1))))
-        else: # pole_mode is '4pol'
-            # two columns give sums for two different polarizations
-            phasePols = np.vstack((gainPols==antpols[0], gainPols==antpols[1])).T
-            Rgains = np.hstack((positions, phasePols))
-            # These terms detect cross terms only, which pick up overall phase terms in 4pol (see HERA memo #30)
-            is_ab = np.array((visPols[:,0] == antpols[0]) * (visPols[:,1] == antpols[1]),dtype=float)
-            is_ba = np.array((visPols[:,0] == antpols[1]) * (visPols[:,1] == antpols[0]),dtype=float)
-            visPhaseSigns = np.vstack((is_ab-is_ba, is_ba-is_ab)).T
-            Rvis = np.hstack((-bl_vecs, -visPhaseSigns))
-        # Mgains is like (AtA)^-1 At in linear estimator formalism. It's a normalized estimator of degeneracies
-        Mgains = np.linalg.pinv(Rgains.T.dot(Rgains)).dot(Rgains.T)
         # degenToRemove is the amount we need to move in the degenerate subspace
-        degenToRemove = np.einsum('ij,jkl', Mgains, np.angle(gainSols*np.conj(degenGains)))
+        degenToRemove = np.einsum('ij,jkl', proj['Mgains'], np.angle(gainSols*np.conj(degenGains)))
         # Now correct gains and visibilities while preserving chi^2
-        gainSols *= np.exp(-1.0j * np.einsum('ij,jkl',Rgains,degenToRemove))
-        visSols *= np.exp(-1.0j * np.einsum('ij,jkl',Rvis,degenToRemove))
+        gainSols *= np.exp(-1.0j * np.einsum('ij,jkl',proj['Rgains'],degenToRemove))
+        visSols *= np.exp(-1.0j * np.einsum('ij,jkl',proj['Rvis'],degenToRemove))
 
         #Create new solutions dictionary
         newSol = {ant: gainSol for ant,gainSol in zip(ants,gainSols)}
@@ -0,0 +1,281 @@
+'''Synthetic redundant HERA arrays and visibilities for testing and benchmarking calibration.'''
+
+from __future__ import print_function, division, absolute_import
+import os
+import numpy as np
+from pyuvdata import UVData, uvtel
+import pyuvdata.utils as uvutils
+from hera_cal import redcal
+from hera_cal.datacontainer import ArrayDataContainer
+
+# antennas per side of the hexagonal arrays with HERA build-out sizes
+POLNUM = {'xx': -5, 'yy': -6, 'xy': -7, 'yx': -8}
+
+
+def hex_array(nants, sep=14.7):
+    '''Build a hexagonally packed array of nants antennas.
+
+    For nants = 19, 37, 127 (or any other centered hexagonal number) this is the filled hexagon.
+    Otherwise, the nants antennas closest to the center of the smallest filled hexagon that holds
+    them are kept, so e.g. nants=350 gives a HERA-350 sized array with comparable redundancy
+    (though not the split core and outriggers of the real HERA-350 layout).
+
+    Args:
+        nants: number of antennas (int)
+        sep: separation of neighbouring antennas in meters. Default is 14.7 m.
+    Returns:
+        antpos: dictionary of antenna positions in the form {ant_index: np.array([x,y,z])}, with
+            antennas numbered outward from the center of the array.
+    '''
+    row_length = lambda hexNum, row: 2 * hexNum - abs(row) - 1
+    hexNum = 1
+    while sum([row_length(hexNum, row) for row in range(hexNum - 1, -hexNum, -1)]) < nants:
+        hexNum += 1
+    pos = []
+    for row in range(hexNum - 1, -hexNum, -1):
+        for col in range(row_length(hexNum, row)):
+            xPos = ((-(2 * hexNum - abs(row)) + 2) / 2.0 + col) * sep
+            yPos = row * sep * 3**.5 / 2
+            pos.append([xPos, yPos, 0.])
+    pos = np.array(pos)
+    radius = np.round(np.linalg.norm(pos, axis=1) / sep, 6)
+    angle = np.round(np.arctan2(pos[:, 1], pos[:, 0]), 6)
+    order = np.lexsort((angle, radius))[:nants]
+    return {i: pos[k] for i, k in enumerate(order)}
+
+
+class RedundantSimulator(object):
+
+    def __init__(self, antpos, pols=['xx'], pol_mode=None, freqs=None, times=None, ntimes=60, nfreqs=1024,
+                 gain_scatter=.1, delay_scatter=10., noise_amp=0., flag_frac=0., rfi_frac=0., rfi_amp=100.,
+                 seed=0, dtype=np.complex64):
+        '''Simulator of redundant visibilities for an array at production sizes.
+
+        Every random quantity (gains, unique baseline visibilities, noise, flags) is drawn from its own
+        seeded random stream, so visibilities can be generated a chunk of baselines at a time, in any
+        order, and always come out the same. Only the chunk being generated is held in memory.
+
+        Args:
+            antpos: dictionary of antenna positions in the form {ant_index: np.array([x,y,z])}, in meters.
+            pols: list of visibility polarizations, e.g. ['xx','yy'] or ['xx','xy','yx','yy']
+            pol_mode: polarization mode as in redcal.get_reds. Default None picks '1pol', '2pol'
+                or '4pol' from pols.
+            freqs: frequencies in Hz. Default is nfreqs channels across 100-200 MHz.
+            times: julian dates of the integrations. Default is ntimes 10.7 s integrations.
+            ntimes, nfreqs: shape of the data, used if times or freqs are not given.
+            gain_scatter: relative amplitude of the per-antenna complex gain scatter.
+            delay_scatter: rms of the per-antenna cable delays in ns.
+            noise_amp: rms of the complex gaussian noise added to each visibility. Default 0.
+            flag_frac: fraction of time/frequency pixels randomly flagged on each baseline.
+            rfi_frac: fraction of channels occupied by RFI on all baselines. These channels are
+                flagged and have noise of amplitude rfi_amp added.
+            rfi_amp: amplitude of RFI relative to the (unit rms) sky visibilities.
+            seed: seed from which all random streams are derived (int)
+            dtype: complex dtype of the generated gains and visibilities. Default np.complex64.
+        '''
+        self.antpos = antpos
+        self.pols = list(pols)
+        if pol_mode is None:
+            if len(set(''.join(self.pols))) == 1:
+                pol_mode = '1pol'
+            elif any([p[0] != p[1] for p in self.pols]):
+                pol_mode = '4pol'
+            else:
+                pol_mode = '2pol'
+        self.pol_mode = pol_mode
+        if freqs is None:
+            freqs = np.linspace(100e6, 200e6, nfreqs, endpoint=False)
+        if times is None:
+            times = 2458000.5 + np.arange(ntimes) * 10.7 / 86400.
+        self.freqs = np.asarray(freqs, dtype=float)
+        self.times = np.asarray(times, dtype=float)
+        self.shape = (len(self.times), len(self.freqs))
+        self.gain_scatter = gain_scatter
+        self.delay_scatter = delay_scatter
+        self.noise_amp = noise_amp
+        self.flag_frac = flag_frac
+        self.rfi_amp = rfi_amp
+        self.seed = seed
+        self.dtype = dtype
+
+        self.reds = redcal.get_reds(antpos, pols=self.pols, pol_mode=pol_mode)
+        self.bls = [bl for bls in self.reds for bl in bls]
+        self.ubl_index = {bl: n for n, bls in enumerate(self.reds) for bl in bls}
+        self.bl_index = {bl: n for n, bl in enumerate(self.bls)}
+        self.ants = sorted(set([(i, p[0]) for i, j, p in self.bls] + [(j, p[1]) for i, j, p in self.bls]))
+        nrfi = int(round(rfi_frac * len(self.freqs)))
+        self.rfi_chans = np.sort(self._random_state(0).choice(len(self.freqs), nrfi, replace=False))
+
+        # per-antenna gain amplitude/phase and delay, drawn once since they are small
+        self._gain_prms = {}
+        for ant in self.ants:
+            rs = self._random_state(1, ant[0], ord(ant[1]))
+            g = 1 + gain_scatter * (rs.normal(scale=.5**.5) + 1j * rs.normal(scale=.5**.5))
+            self._gain_prms[ant] = (g, delay_scatter * rs.normal())
+
+    def _random_state(self, *keys):
+        '''Return the random stream identified by self.seed and keys (non-negative ints).'''
+        return np.random.RandomState([self.seed] + list(keys))
+
+    def _noise(self, rs, amp=1., shape=None):
+        '''Complex gaussian noise of rms amp, by default with the shape of the data.'''
+        if shape is None:
+            shape = self.shape
+        sig = amp / 2**.5
+        return rs.normal(scale=sig, size=shape) + 1j * rs.normal(scale=sig, size=shape)
+
+    def gain(self, ant):
+        '''Return the true gain of ant = (index, antpol) as a read-only (Ntimes, Nfreqs) array.'''
+        g, delay = self._gain_prms[ant]
+        spectrum = (g * np.exp(-2j * np.pi * self.freqs / 1e9 * delay)).astype(self.dtype)
+        return np.broadcast_to(spectrum, self.shape)
+
+    def delay(self, ant):
+        '''Return the cable delay in ns of ant = (index, antpol) that is part of its true gain.'''
+        return self._gain_prms[ant][1]
+
+    def true_gains(self):
+        '''Return all true gains in the {(index,antpol): np.array} format.'''
+        return {ant: self.gain(ant) for ant in self.ants}
+
+    def true_vis(self, bl):
+        '''Return the true visibility of the unique baseline that bl = (i,j,pol) belongs to.'''
+        n = self.ubl_index[bl]
+        return self._noise(self._random_state(2, n)).astype(self.dtype)
+
+    def iter_chunks(self, chunk_size=1024, pols=None):
+        '''Generate the visibilities and flags of the array, chunk_size baselines at a time.
+
+        Args:
+            chunk_size: number of baselines per chunk. Memory use is about
+                chunk_size * Ntimes * Nfreqs * (itemsize of dtype + 1) bytes.
+            pols: only generate baselines of these polarizations. Default is all of self.pols.
+        Yields:
+            data: ArrayDataContainer of visibilities for the baselines of the chunk
+            flags: ArrayDataContainer of boolean flags (True is flagged) for the same baselines
+        '''
+        bls = self.bls if pols is None else [bl for bl in self.bls if bl[2] in pols]
+        rfi_flags = np.zeros(self.shape[1], dtype=bool)
+        rfi_flags[self.rfi_chans] = True
+        for start in xrange(0, len(bls), chunk_size):
+            data, flags = {}, {}
+            vis = {}
+            for bl in bls[start:start + chunk_size]:
+                i, j, pol = bl
+                n = self.ubl_index[bl]
+                if not vis.has_key(n):
+                    vis[n] = self.true_vis(bl)
+                d = vis[n] * self.gain((i, pol[0])) * self.gain((j, pol[1])).conj()
+                rs = self._random_state(3, self.bl_index[bl])
+                if self.noise_amp > 0:
+                    d += self._noise(rs, self.noise_amp).astype(self.dtype)
+                if len(self.rfi_chans) > 0:
+                    d[:, self.rfi_chans] += self._noise(rs, self.rfi_amp, (self.shape[0], len(self.rfi_chans)))
+                if self.flag_frac > 0:
+                    flags[bl] = rs.uniform(size=self.shape) < self.flag_frac
+                    flags[bl] |= rfi_flags
+                else:
+                    flags[bl] = np.repeat(rfi_flags[None], self.shape[0], axis=0)
+                data[bl] = d
+            yield ArrayDataContainer(data), ArrayDataContainer(flags)
+
+    def to_uvdata(self, pol, chunk_size=1024):
+        '''Return a UVData object holding the simulated visibilities of one polarization.
+        The data array is filled chunk by chunk, so peak memory is the size of the output
+        plus a single chunk.
+
+        Args:
+            pol: visibility polarization, e.g. 'xx'
+            chunk_size: number of baselines generated at a time (see iter_chunks)
+        Returns:
+            uv: UVData object with drift-scan, time-major (Ntimes, Nbls) ordered data.
+        '''
+        bls = [bl for bl in self.bls if bl[2] == pol]
+        ntimes, nfreqs = self.shape
+        uv = UVData()
+        uv.Ntimes = ntimes
+        uv.Nbls = len(bls)
+        uv.Nblts = uv.Ntimes * uv.Nbls
+        uv.Nfreqs = nfreqs
+        uv.Npols = 1
+        uv.Nspws = 1
+        uv.spw_array = np.array([1])
+        uv.freq_array = self.freqs.reshape(1, -1)
+        uv.channel_width = np.float(np.diff(self.freqs[:2])[0]) if nfreqs > 1 else 1e8
+        uv.polarization_array = np.array([POLNUM[pol]])
+        uv.integration_time = np.float(np.diff(self.times[:2])[0] * 86400.) if ntimes > 1 else 10.7
+        uv.vis_units = 'uncalib'
+
+        data = np.empty((ntimes, uv.Nbls, nfreqs), dtype=self.dtype)
+        flags = np.empty((ntimes, uv.Nbls, nfreqs), dtype=bool)
+        bl_pos = {bl: b for b, bl in enumerate(bls)}
+        for d, f in self.iter_chunks(chunk_size, pols=[pol]):
+            for bl in d.keys():
+                data[:, bl_pos[bl]], flags[:, bl_pos[bl]] = d[bl], f[bl]
+        uv.data_array = data.reshape(uv.Nblts, 1, nfreqs, 1)
+        uv.flag_array = flags.reshape(uv.Nblts, 1, nfreqs, 1)
+        uv.nsample_array = np.ones(uv.data_array.shape, dtype=np.float)
+
+        uv.ant_1_array = np.tile([i for i, j, p in bls], ntimes)
+        uv.ant_2_array = np.tile([j for i, j, p in bls], ntimes)
+        uv.baseline_array = uv.antnums_to_baseline(uv.ant_1_array, uv.ant_2_array)
+        uv.time_array = np.repeat(self.times, uv.Nbls)
+        uv.uvw_array = np.tile([self.antpos[j] - self.antpos[i] for i, j, p in bls], (ntimes, 1))
+
+        # observation parameters
+        uv.object_name = 'zenith'
+        uv.telescope_name = 'HERA'
+        uv.instrument = 'HERA'
+        tobj = uvtel.get_telescope(uv.telescope_name)
+        uv.telescope_location = tobj.telescope_location
+        lat, lon, alt = uv.telescope_location_lat_lon_alt
+        uv.set_lsts_from_time_array()
+        uv.history = 'Simulated with hera_cal.simulate.RedundantSimulator (seed={0}).'.format(self.seed)
+
+        # phasing information
+        uv.phase_type = 'drift'
+        uv.zenith_ra = uv.lst_array
+        uv.zenith_dec = np.array([lat] * uv.Nblts)
+
+        # antenna information: east/north/up positions rotated to ECEF relative to the array center
+        ants = sorted(self.antpos.keys())
+        uv.Nants_telescope = len(ants)
+        uv.Nants_data = len(np.unique(np.concatenate([uv.ant_1_array, uv.ant_2_array])))
+        uv.antenna_numbers = np.array(ants, dtype=int)
+        uv.antenna_names = ['ant{0}'.format(ant) for ant in ants]
+        antpos = []
+        for ant in ants:
+            e, n, u = self.antpos[ant]
+            rotECEF = np.array([-np.sin(lat) * n + np.cos(lat) * u, e, np.cos(lat) * n + np.sin(lat) * u])
+            antpos.append(uvutils.ECEF_from_rotECEF(rotECEF, lon))
+        uv.antenna_positions = np.array(antpos)
+        uv.antenna_diameters = tobj.antenna_diameters * np.ones(uv.Nants_telescope)
+
+        uv.check()
+        return uv
+
+    def write(self, outdir, filetype='miriad', chunk_size=1024, overwrite=False, **kwargs):
+        '''Write one file per polarization, named like HERA data so that omni_run and firstcal_run
+        can be pointed at them directly (e.g. zen.2458000.50000.xx.HH.uv).
+
+        Args:
+            outdir: directory to write the files to
+            filetype: 'miriad' or 'uvfits'. Other keyword arguments are passed on to
+                UVData.write_<filetype> (e.g. force_phase=True for uvfits).
+            chunk_size: number of baselines generated at a time (see iter_chunks)
+            overwrite: overwrite existing files.
+        Returns:
+            filenames: list of the written files, in the order of self.pols
+        '''
+        ext = {'miriad': 'uv', 'uvfits': 'uvfits'}[filetype]
+        filenames = []
+        for pol in self.pols:
+            fn = os.path.join(outdir, 'zen.{0:.5f}.{1}.HH.{2}'.format(self.times[0], pol, ext))
+            if os.path.exists(fn) and not overwrite:
+                raise IOError('{0} exists. Use overwrite=True to replace it.'.format(fn))
+            uv = self.to_uvdata(pol, chunk_size=chunk_size)
+            if filetype == 'miriad':
+                kwargs['clobber'] = overwrite
+            getattr(uv, 'write_' + filetype)(fn, **kwargs)
+            filenames.append(fn)
+        return filenames
@@ -1,5 +1,9 @@
 import unittest
+import os
+import shutil
 from hera_cal import datacontainer
+from hera_cal.data import DATA_PATH
+from pyuvdata import UVData
 import numpy as np
 
 class TestDataContainer(unittest.TestCase):
@@ -158,6 +162,359 @@ class TestDataContainer(unittest.TestCase):
         self.assertEqual(dc.get((1, 2), 'yy'), 1j)
         self.assertEqual(dc.get((2, 1), 'yy'), -1j)
 
+    def test_setitem_delitem(self):
+        dc = datacontainer.DataContainer(self.both)
+        dc[(1, 4, 'xx')] = 2j
+        self.assertEqual(dc[(4, 1, 'xx')], -2j)
+        self.assertTrue(dc.has_bl((1, 4)))
+        self.assertEqual(dc.pols((4, 1)), set(['xx']))
+        self.assertEqual(dc.bls('yy'), set(self.bls))
+        # setting a conjugated key updates the stored key
+        dc[(2, 1, 'xx')] = 3j
+        self.assertEqual(dc[(1, 2, 'xx')], -3j)
+        self.assertFalse((2, 1, 'xx') in dc.keys())
+        self.assertEqual(len(dc), 2 * len(self.bls) + 1)
+        del dc[(4, 1, 'xx')]
+        self.assertFalse(dc.has_key((1, 4, 'xx')))
+        self.assertFalse(dc.has_bl((1, 4)))
+        self.assertRaises(KeyError, dc.__getitem__, (1, 4, 'xx'))
+        self.assertRaises(KeyError, dc.__delitem__, (1, 4, 'xx'))
+        self.assertRaises(ValueError, dc.__setitem__, (1, 4), 1j)
+        for bl in self.bls:
+            del dc[bl + ('yy',)]
+        self.assertFalse(dc.has_pol('yy'))
+        self.assertEqual(dc.pols(), set(['xx']))
+        self.assertEqual(dc['yy'], {})
+        self.assertEqual(self.both[(1, 2, 'xx')], 1j)
+        # the conjugate becomes reachable when a key stored in both orientations is deleted
+        dc = datacontainer.DataContainer({(2, 1, 'yy'): 1., (1, 2, 'yy'): 2.})
+        self.assertEqual(dc[(2, 1, 'yy')], 1.)
+        del dc[(2, 1, 'yy')]
+        self.assertEqual(dc[(2, 1, 'yy')], 2.)
+        self.assertEqual(dc.bls('yy'), set([(1, 2)]))
+
+    def test_conj_bls(self):
+        dc = datacontainer.DataContainer({(1, 2, 'xx'): 1j, (2, 1, 'yy'): 1j})
+        self.assertEqual(dc.bls('xx'), set([(1, 2), (2, 1)]))
+        self.assertEqual(dc.pols((1, 2)), set(['xx', 'yy']))
+        self.assertEqual(dc[(2, 1)], {'xx': -1j, 'yy': 1j})
+
+    def test_incremental_index(self):
+        np.random.seed(1)
+        dc = datacontainer.DataContainer({})
+        keys = [(i, j, pol) for i in range(3) for j in range(3) for pol in ['xx', 'yy', 'xy']]
+        for n in range(300):
+            key = keys[np.random.randint(len(keys))]
+            if dc.has_key(key):
+                del dc[key]
+            else:
+                dc[key] = 1j
+            stored = dc.keys()
+            self.assertEqual(dc.bls(), set([k[:2] for k in stored]))
+            self.assertEqual(dc.pols(), set([k[2] for k in stored]))
+            for pol in ['xx', 'yy', 'xy']:
+                bls = set([k[:2] for k in stored if k[2] == pol])
+                self.assertEqual(dc.bls(pol), bls | set([bl[::-1] for bl in bls if bl[::-1] in dc.bls()]))
+            self.assertEqual(dc.bls(), datacontainer.DataContainer(dict(dc._data)).bls())
+
+    def test_from_uvdata(self):
+        uvd = UVData()
+        uvd.read_miriad(os.path.join(DATA_PATH, 'zen.2457698.40355.xx.HH.uvcA'))
+        data, flags, nsamples = datacontainer.DataContainer.from_uvdata(uvd)
+        self.assertEqual(data.pols(), set(['xx']))
+        self.assertEqual(len(data.keys()), uvd.Nbls)
+        for (i, j, pol) in data.keys():
+            blmask = (uvd.ant_1_array == i) & (uvd.ant_2_array == j)
+            np.testing.assert_equal(data[(i, j, pol)], uvd.data_array[blmask, 0, :, 0])
+            np.testing.assert_equal(flags[(i, j, pol)], uvd.flag_array[blmask, 0, :, 0])
+            np.testing.assert_equal(nsamples[(i, j, pol)], uvd.nsample_array[blmask, 0, :, 0])
+            self.assertTrue(np.may_share_memory(data[(i, j, pol)], uvd.data_array))
+        bl = data.keys()[0][:2]
+        data, flags, nsamples = datacontainer.DataContainer.from_uvdata(uvd, bls=[bl[::-1]], pols=['xx'])
+        self.assertEqual(data.keys(), [bl + ('xx',)])
+        data, flags, nsamples = datacontainer.DataContainer.from_uvdata(uvd, pols=['yy'])
+        self.assertEqual(data.keys(), [])
+
+    def test_from_uvdata_blt_order(self):
+        ntimes, ant_pairs = 3, [(1, 2), (1, 3), (2, 3)]
+        uvd = UVData()
+        uvd.Ntimes, uvd.Nbls, uvd.Nblts, uvd.Nspws, uvd.Nfreqs, uvd.Npols = 3, 3, 9, 1, 4, 1
+        uvd.polarization_array = np.array([-5])
+        for blt_order in ['time', 'baseline']:
+            if blt_order == 'time':
+                times, bls = np.repeat(np.arange(ntimes), 3), ant_pairs * ntimes
+            else:
+                times, bls = np.tile(np.arange(ntimes), 3)[::-1], np.repeat(ant_pairs, ntimes, axis=0).tolist()
+            uvd.time_array = times.astype(float)
+            uvd.ant_1_array = np.array([bl[0] for bl in bls])
+            uvd.ant_2_array = np.array([bl[1] for bl in bls])
+            uvd.baseline_array = 2048 * uvd.ant_1_array + uvd.ant_2_array
+            uvd.data_array = (100 * uvd.baseline_array + times)[:, None, None, None] * np.ones((9, 1, 4, 1)) * 1j
+            uvd.flag_array = np.zeros((9, 1, 4, 1), dtype=bool)
+            uvd.nsample_array = np.ones((9, 1, 4, 1))
+            data, flags, nsamples = datacontainer.DataContainer.from_uvdata(uvd)
+            self.assertEqual(set(data.keys()), set([bl + ('xx',) for bl in ant_pairs]))
+            for (i, j) in ant_pairs:
+                expected = (100 * (2048 * i + j) + np.arange(ntimes))[:, None] * np.ones((1, 4)) * 1j
+                np.testing.assert_equal(data[(i, j, 'xx')], expected)
+                np.testing.assert_equal(flags[(i, j, 'xx')], False)
+                self.assertEqual(np.may_share_memory(data[(i, j, 'xx')], uvd.data_array), blt_order == 'time')
+
+    def test_arithmetic(self):
+        data = {k: (n + 1j) * np.ones(3) for n, k in enumerate(sorted(self.both.keys()))}
+        dc = datacontainer.DataContainer(data)
+        other = datacontainer.DataContainer({(k[1], k[0], k[2]): np.conj(v) for k, v in data.items()})
+        for result, expected in [(dc + other, lambda v: 2 * v), (dc - 1, lambda v: v - 1),
+                                 (2 * dc, lambda v: 2 * v), (dc / other, lambda v: 1.),
+                                 (1 - dc, lambda v: 1 - v), (2. / dc, lambda v: 2. / v),
+                                 (np.arange(3) * dc, lambda v: np.arange(3) * v),
+                                 (-dc, lambda v: -v), (abs(dc), np.abs), (dc.conj(), np.conj)]:
+            self.assertEqual(set(result.keys()), set(data.keys()))
+            for k, v in data.items():
+                np.testing.assert_almost_equal(result[k], expected(v), 12)
+        bufs = {k: np.zeros(3, dtype=complex) for k in data.keys()}
+        out = datacontainer.DataContainer(dict(bufs))
+        self.assertTrue(dc.multiply(dict(data), out=out) is out)
+        for k, v in data.items():
+            self.assertTrue(out[k] is bufs[k])
+            np.testing.assert_almost_equal(out[k], v * v, 12)
+        self.assertRaises(ValueError, dc.add, 1, out=data)
+        self.assertRaises(ValueError, dc.add, 1, out=datacontainer.DataContainer({(1, 2, 'xx'): 0}))
+        # containers of scalars are updated by assignment
+        dc = datacontainer.DataContainer(self.both)
+        dc.add(1, out=dc)
+        self.assertEqual(dc[(1, 2, 'xx')], 1 + 1j)
+
+    def test_mean_median(self):
+        data = {(1, 2, 'xx'): np.array([1., 2.]), (2, 3, 'xx'): np.array([3., 10.]),
+                (1, 3, 'xx'): np.array([4., 4.]), (3, 4, 'xx'): np.array([0., 0.])}
+        dc = datacontainer.DataContainer(data)
+        reds = [[(1, 2, 'xx'), (3, 2, 'xx'), (3, 4, 'xx')], [(1, 3, 'xx')]]
+        means = dc.mean(reds)
+        np.testing.assert_almost_equal(means[(1, 2, 'xx')], [4. / 3, 4.])
+        np.testing.assert_almost_equal(means[(1, 3, 'xx')], [4., 4.])
+        medians = dc.median(reds)
+        np.testing.assert_almost_equal(medians[(1, 2, 'xx')], [1., 2.])
+        buf = np.zeros(2)
+        out = dc.median(reds, out={(1, 3, 'xx'): buf})
+        self.assertTrue(out[(1, 3, 'xx')] is buf)
+        np.testing.assert_almost_equal(buf, [4., 4.])
+        means = datacontainer.DataContainer({(1, 2, 'xx'): np.array([1, 2])}).mean([[(1, 2, 'xx')]])
+        self.assertEqual(means[(1, 2, 'xx')].dtype, np.float64)
+
+
+class TestArrayDataContainer(unittest.TestCase):
+
+    def setUp(self):
+        self.bls = [(1, 2), (2, 3), (3, 4), (1, 3), (2, 4)]
+        self.pols = ['xx', 'yy']
+        self.data = {}
+        for n, bl in enumerate(self.bls):
+            for pol in self.pols:
+                self.data[bl + (pol,)] = (n + 1j) * np.ones((3, 4))
+
+    def test_init(self):
+        dc = datacontainer.ArrayDataContainer(self.data)
+        self.assertEqual(set(self.bls), dc.bls())
+        self.assertEqual(set(self.pols), dc.pols())
+        self.assertEqual(len(dc.keys()), len(self.data))
+        for pol in self.pols:
+            self.assertEqual(dc.block(pol).shape, (len(self.bls), 3, 4))
+            self.assertTrue(dc.block(pol).flags['C_CONTIGUOUS'])
+            self.assertEqual(dc.bl_order(pol), sorted(self.bls))
+        dc = datacontainer.ArrayDataContainer(self.data, dtype=np.complex64)
+        self.assertEqual(dc.block('xx').dtype, np.complex64)
+        self.data[(1, 2, 'xx')] = np.ones(2)
+        self.assertRaises(ValueError, datacontainer.ArrayDataContainer, self.data)
+
+    def test_getitem(self):
+        dc = datacontainer.ArrayDataContainer(self.data)
+        np.testing.assert_equal(dc[(2, 3, 'xx')], self.data[(2, 3, 'xx')])
+        np.testing.assert_equal(dc[(3, 2, 'xx')], np.conj(self.data[(2, 3, 'xx')]))
+        self.assertEqual(set(dc[(1, 2)].keys()), set(self.pols))
+        self.assertEqual(set(dc['yy'].keys()), set(self.bls))
+        self.assertTrue(dc.has_key((3, 2), 'yy'))
+        # views into the blocks
+        row, conj = dc.index((2, 3, 'xx'))
+        self.assertFalse(conj)
+        self.assertTrue(dc[(2, 3, 'xx')].base is dc.block('xx'))
+        dc[(2, 3, 'xx')][:] = 7
+        np.testing.assert_equal(dc.block('xx')[row], 7)
+        self.assertEqual(dc.index((3, 2, 'xx')), (row, True))
+
+    def test_from_blocks(self):
+        block = np.arange(6.).reshape(3, 2)
+        dc = datacontainer.ArrayDataContainer.from_blocks({'xx': block}, {'xx': [(1, 2), (2, 3), (1, 3)]})
+        self.assertTrue(dc.block('xx') is block)
+        np.testing.assert_equal(dc[(2, 3, 'xx')], [2, 3])
+        self.assertRaises(ValueError, datacontainer.ArrayDataContainer.from_blocks,
+                          {'xx': block}, {'xx': [(1, 2)]})
+
+    def test_setitem_delitem(self):
+        dc = datacontainer.ArrayDataContainer(self.data)
+        block = dc.block('xx')
+        dc[(3, 2, 'xx')] = 2j * np.ones((3, 4))
+        self.assertTrue(dc.block('xx') is block)
+        np.testing.assert_equal(dc[(2, 3, 'xx')], -2j)
+        dc[(1, 4, 'xx')] = np.ones((3, 4))
+        self.assertEqual(dc.block('xx').shape, (len(self.bls) + 1, 3, 4))
+        self.assertEqual(dc.bl_order('xx')[-1], (1, 4))
+        np.testing.assert_equal(dc[(4, 1, 'xx')], 1)
+        np.testing.assert_equal(dc[(2, 3, 'xx')], -2j)
+        dc[(1, 2, 'xy')] = np.ones((3, 4))
+        self.assertEqual(dc.pols(), set(['xx', 'yy', 'xy']))
+        del dc[(2, 1, 'xx')]
+        self.assertFalse(dc.has_key((1, 2, 'xx')))
+        self.assertEqual(dc.block('xx').shape, (len(self.bls), 3, 4))
+        np.testing.assert_equal(dc[(4, 1, 'xx')], 1)
+        del dc[(1, 2, 'xy')]
+        self.assertFalse(dc.has_pol('xy'))
+
+    def test_arithmetic(self):
+        dc = datacontainer.ArrayDataContainer(self.data)
+        other = datacontainer.ArrayDataContainer(self.data)
+        result = dc * other - 1
+        self.assertTrue(isinstance(result, datacontainer.ArrayDataContainer))
+        for k, v in self.data.items():
+            np.testing.assert_almost_equal(result[k], v * v - 1, 12)
+        block = dc.block('xx')
+        self.assertTrue(dc.divide(other, out=dc) is dc)
+        self.assertTrue(dc.block('xx') is block)
+        np.testing.assert_almost_equal(block, 1, 12)
+        # different layouts fall back to key by key operations
+        result = other + datacontainer.DataContainer(self.data)
+        for k, v in self.data.items():
+            np.testing.assert_almost_equal(result[k], 2 * v, 12)
+        reds = [[(1, 2, 'xx'), (3, 2, 'xx')], [(1, 3, 'yy')]]
+        means = other.mean(reds)
+        np.testing.assert_almost_equal(means[(1, 2, 'xx')], .5 * (self.data[(1, 2, 'xx')] + np.conj(self.data[(2, 3, 'xx')])))
+
+    def test_stack(self):
+        dc = datacontainer.ArrayDataContainer(self.data)
+        keys = [(2, 3, 'yy'), (1, 2, 'xx'), (4, 3, 'xx'), (1, 3, 'yy')]
+        d = dc.stack(keys)
+        self.assertEqual(d.shape, (4, 3, 4))
+        for n, key in enumerate(keys):
+            np.testing.assert_equal(d[n], dc[key])
+
+
+class TestLazyDataContainer(unittest.TestCase):
+
+    def setUp(self):
+        self.bls = [(1, 2), (2, 3), (3, 4), (1, 3), (2, 4)]
+        self.data = {}
+        for n, bl in enumerate(self.bls):
+            for pol in ['xx', 'yy']:
+                self.data[bl + (pol,)] = (n + 1j) * np.ones((3, 4), dtype=np.complex64)
+        self.dc = datacontainer.DataContainer(self.data)
+        self.outdir = os.path.join(DATA_PATH, 'test_output', 'lazy_dc')
+
+    def tearDown(self):
+        for fn in [self.outdir, self.outdir + '.h5']:
+            if os.path.isdir(fn):
+                shutil.rmtree(fn)
+            elif os.path.exists(fn):
+                os.remove(fn)
+
+    def check_lazy(self, filename):
+        datacontainer.write_blocks(self.dc, filename)
+        # room for two keys
+        lazy = datacontainer.LazyDataContainer(filename, cache_bytes=2 * 3 * 4 * 8)
+        self.assertEqual(set(lazy.keys()), set(self.data.keys()))
+        self.assertEqual(lazy.bls(), set(self.bls))
+        self.assertEqual(lazy.pols(), set(['xx', 'yy']))
+        for k in self.data.keys():
+            np.testing.assert_equal(lazy[k], self.data[k])
+            self.assertEqual(lazy[k].dtype, np.complex64)
+        np.testing.assert_equal(lazy[(2, 1, 'xx')], np.conj(self.data[(1, 2, 'xx')]))
+        self.assertEqual(len(lazy._cache), 2)
+        self.assertRaises(ValueError, lazy[(1, 2, 'xx')].__setitem__, 0, 0)
+        self.assertRaises(TypeError, lazy.__setitem__, (1, 2, 'xx'), 0)
+        self.assertRaises(TypeError, lazy.__delitem__, (1, 2, 'xx'))
+        lazy.clear_cache()
+        hits, misses = lazy.cache_hits, lazy.cache_misses
+        lazy[(1, 2, 'xx')], lazy[(2, 3, 'xx')], lazy[(1, 2, 'xx')], lazy[(3, 4, 'xx')], lazy[(1, 2, 'xx')]
+        self.assertEqual(lazy.cache_hits - hits, 2)
+        self.assertEqual(lazy.cache_misses - misses, 3)
+        self.assertEqual(lazy._cache.keys(), [(3, 4, 'xx'), (1, 2, 'xx')])
+        lazy.close()
+
+    def test_npy(self):
+        self.check_lazy(self.outdir)
+        self.assertRaises(IOError, datacontainer.LazyDataContainer, self.outdir + '.npz')
+
+    def test_hdf5(self):
+        try:
+            import h5py
+        except(ImportError):
+            raise unittest.SkipTest('h5py not detected.')
+        self.check_lazy(self.outdir + '.h5')
+
+
+class TestWriteRead(unittest.TestCase):
+
+    def setUp(self):
+        self.bls = [(1, 2), (2, 3), (3, 4), (1, 3), (2, 4)]
+        self.data = {}
+        for n, bl in enumerate(self.bls):
+            for pol in ['xx', 'yy']:
+                self.data[bl + (pol,)] = (n + 1j) * np.arange(12, dtype=np.complex64).reshape(3, 4)
+        self.dc = datacontainer.DataContainer(self.data)
+        self.meta = {'times': np.arange(3.), 'freqs': np.linspace(1e8, 2e8, 4)}
+        self.outfile = os.path.join(DATA_PATH, 'test_output', 'test_dc')
+
+    def tearDown(self):
+        for fn in [self.outfile, self.outfile + '.npz', self.outfile + '.h5']:
+            if os.path.isdir(fn):
+                shutil.rmtree(fn)
+            elif os.path.exists(fn):
+                os.remove(fn)
+
+    def check_write_read(self, filename, **kwargs):
+        self.dc.write(filename, meta=self.meta, **kwargs)
+        dc = datacontainer.DataContainer.read(filename)
+        self.assertTrue(isinstance(dc, datacontainer.ArrayDataContainer))
+        self.assertEqual(set(dc.keys()), set(self.data.keys()))
+        for k, v in self.data.items():
+            np.testing.assert_equal(dc[k], v)
+            self.assertEqual(dc[k].dtype, np.complex64)
+        meta = datacontainer.DataContainer.read_meta(filename)
+        self.assertEqual(set(meta.keys()), set(self.meta.keys()))
+        for k in self.meta:
+            np.testing.assert_equal(meta[k], self.meta[k])
+        # partial reads
+        dc = datacontainer.DataContainer.read(filename, keys=[(3, 2, 'xx'), (2, 4, 'xx'), (1, 2, 'yy')],
+                                              pols=['xx'], times=slice(1, 3), freqs=[0, 3])
+        self.assertEqual(set(dc.keys()), set([(2, 3, 'xx'), (2, 4, 'xx')]))
+        np.testing.assert_equal(dc[(3, 2, 'xx')], np.conj(self.data[(2, 3, 'xx')][1:3][:, [0, 3]]))
+        dc = datacontainer.DataContainer.read(filename, ants=[1, 2, 3])
+        self.assertEqual(dc.bls(), set([(1, 2), (2, 3), (1, 3)]))
+        dc = datacontainer.DataContainer.read(filename, pols=['xy'])
+        self.assertEqual(dc.keys(), [])
+
+    def test_npy(self):
+        self.check_write_read(self.outfile)
+
+    def test_npz(self):
+        self.check_write_read(self.outfile + '.npz', chunks=(2,), compression=True)
+        with np.load(self.outfile + '.npz') as npz:
+            self.assertEqual(len([name for name in npz.files if name.startswith('xx.data')]), 3)
+
+    def test_hdf5(self):
+        try:
+            import h5py
+        except(ImportError):
+            raise unittest.SkipTest('h5py not detected.')
+        self.check_write_read(self.outfile + '.h5', chunks=(2, 3, 4), compression='gzip')
+        # chunks are clamped to each pol's shape separately
+        data = dict(self.data)
+        for bl in self.bls[1:]:
+            del data[bl + ('xx',)]
+        datacontainer.write_blocks(datacontainer.DataContainer(data), self.outfile + '.h5', chunks=(4, 3, 4))
+        with h5py.File(self.outfile + '.h5', 'r') as h5:
+            self.assertEqual(h5['xx']['data'].chunks, (1, 3, 4))
+            self.assertEqual(h5['yy']['data'].chunks, (4, 3, 4))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -7,6 +7,7 @@ import numpy as np
 import optparse
 import shutil
 import re
+import json
 from copy import deepcopy
 import aipy
 from omnical.calib import RedundantInfo
@@ -15,6 +16,7 @@ import hera_cal.omni as omni
 from hera_cal.data import DATA_PATH
 from hera_cal.calibrations import CAL_PATH
 import hera_cal.redcal as rc
+from hera_cal.datacontainer import DataContainer
 
 
 class AntennaArray(aipy.fit.AntennaArray):
@@ -313,6 +315,30 @@ class TestMethods(object):
                     np.testing.assert_equal(np.resize(
                         uvcal.delay_array[ai, nsp, 0, :, ip].T, (Ntimes,)),  gains[pol2str[pol]][ant])
 
+    def test_from_fits_native_vis(self):
+        fn = os.path.join(DATA_PATH, 'test_input', 'zen.2457698.40355.xx.HH.uvc.omni.calfits')
+        meta, gains, vis, xtalk = omni.from_fits(fn)
+        outfn = os.path.join(DATA_PATH, 'test_output', 'zen.2457698.40355.xx.HH.uvc.omni.calfits')
+        shutil.copy(fn, outfn)
+        fsj = outfn[:-len('.omni.calfits')]
+        vis_meta = {'times': meta['times'], 'lsts': meta['lsts'], 'freqs': meta['freqs']}
+        DataContainer(vis).write(fsj + '.vis.npz', meta=vis_meta)
+        DataContainer({pol: {bl: x[0] for bl, x in xtalk[pol].items()} for pol in xtalk}).write(
+            fsj + '.xtalk.npz', meta=vis_meta)
+        meta2, gains2, vis2, xtalk2 = omni.from_fits(outfn)
+        np.testing.assert_almost_equal(meta2['lsts'], meta['lsts'])
+        for v, v2 in [(vis, vis2), (xtalk, xtalk2)]:
+            nt.assert_equal(v.keys(), v2.keys())
+            nt.assert_equal(set(v['xx'].keys()), set(v2['xx'].keys()))
+            for bl in v['xx']:
+                np.testing.assert_equal(v['xx'][bl], v2['xx'][bl])
+        ants = [9, 10, 112, 20, 22]
+        meta2, gains2, vis2, xtalk2 = omni.from_fits(outfn, antenna_nums=ants)
+        for bl in vis2['xx']:
+            nt.assert_true(bl[0] in ants and bl[1] in ants)
+        for f in [outfn, fsj + '.vis.npz', fsj + '.xtalk.npz']:
+            os.remove(f)
+
     def test_from_fits_gain_select(self):
         Ntimes = 3
         Nchans = 1024  # hardcoded for this file
@@ -974,6 +1000,27 @@ class Test_omni_apply(object):
         # clean up when we're done
         shutil.rmtree(objective_file)
 
+    def test_single_file_execution_omni_apply_profile(self):
+        objective_file = os.path.join(DATA_PATH, 'test_output', 'zen.2457698.40355.xx.HH.uvcAAO')
+        profile_file = objective_file + '.profile.json'
+        if os.path.exists(objective_file):
+            shutil.rmtree(objective_file)
+        o = omni.get_optionParser('omni_apply')
+        omni_file = os.path.join(DATA_PATH, 'test_input', xx_ocal)
+        vis_file = os.path.join(DATA_PATH,  xx_vis)
+        cmd = "-p xx --omnipath={0} --extension=O --outpath={1} --profile {2}".format(
+            omni_file, os.path.join(DATA_PATH, 'test_output'), vis_file)
+
+        opts, files = o.parse_args(cmd.split())
+        omni.omni_apply(files, opts)
+        with open(profile_file) as f:
+            profile = json.load(f)
+        nt.assert_equal(profile['files'], [vis_file])
+        nt.assert_equal([r['stage'] for r in profile['stages']], ['read', 'cal_load', 'apply', 'write'])
+        # clean up when we're done
+        shutil.rmtree(objective_file)
+        os.remove(profile_file)
+
     def test_single_file_execution_omni_apply_custompath(self):
         objective_file = os.path.join('./', 'zen.2457698.40355.xx.HH.uvcAAO')
         if os.path.exists(objective_file):
@@ -0,0 +1,95 @@
+'''Tests for profiling.py'''
+
+import unittest
+import os
+import json
+import numpy as np
+from hera_cal import profiling
+from hera_cal.data import DATA_PATH
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.env = os.environ.pop(profiling.ENV_VAR, None)
+        self.outfile = os.path.join(DATA_PATH, 'test_output', 'test.profile.json')
+
+    def tearDown(self):
+        profiling.stop()
+        if self.env is not None:
+            os.environ[profiling.ENV_VAR] = self.env
+        else:
+            os.environ.pop(profiling.ENV_VAR, None)
+        if os.path.exists(self.outfile):
+            os.remove(self.outfile)
+
+    def test_enabled(self):
+        self.assertFalse(profiling.enabled())
+        self.assertTrue(profiling.enabled(True))
+        os.environ[profiling.ENV_VAR] = '0'
+        self.assertFalse(profiling.enabled())
+        os.environ[profiling.ENV_VAR] = '1'
+        self.assertTrue(profiling.enabled())
+
+    def test_disabled(self):
+        self.assertTrue(profiling.start() is None)
+        with profiling.stage('read'):
+            pass
+        profiling.write(self.outfile)
+        self.assertFalse(os.path.exists(self.outfile))
+
+    def test_stages(self):
+        prof = profiling.start(True)
+        with profiling.stage('read'):
+            with profiling.stage('inner'):
+                x = np.ones(2**22)
+        try:
+            with profiling.stage('lincal'):
+                raise ValueError
+        except ValueError:
+            pass
+        profiling.start_stage('apply')
+        del x
+        profiling.stop_stage('apply')
+        self.assertRaises(ValueError, profiling.stop_stage, 'apply')
+        self.assertEqual([r['stage'] for r in prof.records], ['inner', 'read', 'lincal', 'apply'])
+        for r in prof.records:
+            self.assertTrue(r['wall_time'] >= 0)
+            self.assertTrue(r['cpu_time'] >= 0)
+        if os.path.exists('/proc/self/statm'):
+            self.assertTrue(prof.records[0]['rss_delta_mb'] > 16)
+            self.assertTrue(prof.records[3]['rss_delta_mb'] < -16)
+            self.assertTrue(prof.records[0]['rss_mb'] > 32)
+        if prof._track_hwm:
+            # a temporary freed within the stage still shows up in its peak
+            with profiling.stage('temporary'):
+                y = np.ones(2**22)
+                del y
+            r = prof.records[4]
+            self.assertTrue(r['peak_rss_mb'] - r['rss_mb'] > 16)
+            self.assertTrue(abs(r['rss_delta_mb']) < 16)
+            self.assertTrue(prof.records[1]['peak_rss_mb'] >= prof.records[0]['peak_rss_mb'])
+            prof.records.pop()
+        for r in prof.records:
+            self.assertTrue(r['peak_rss_mb'] is None or r['peak_rss_mb'] >= r['rss_mb'])
+        self.assertTrue(prof.records[1]['wall_time'] >= prof.records[0]['wall_time'])
+
+        profiling.write(self.outfile, files=['zen.xx.uv'])
+        self.assertEqual(prof.records, [])
+        with open(self.outfile) as f:
+            out = json.load(f)
+        self.assertEqual(out['files'], ['zen.xx.uv'])
+        self.assertEqual([r['stage'] for r in out['stages']], ['inner', 'read', 'lincal', 'apply'])
+        if prof._track_hwm:
+            self.assertTrue(out['process_peak_rss_mb'] >= max([r['peak_rss_mb'] for r in out['stages']]))
+        self.assertTrue(out['process_peak_rss_mb'] > 32)
+        self.assertAlmostEqual(out['wall_time'], sum([r['wall_time'] for r in out['stages']]))
+
+        profiling.stop()
+        with profiling.stage('write'):
+            pass
+        self.assertEqual(prof.records, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
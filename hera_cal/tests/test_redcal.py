@@ -1,7 +1,12 @@
 import hera_cal.redcal as om
 import numpy as np
 import unittest
+import os
+import shutil
+import warnings
 from copy import deepcopy
+from hera_cal.datacontainer import LazyDataContainer, write_blocks
+from hera_cal.data import DATA_PATH
 
 np.random.seed(0)
 
@@ -122,6 +127,43 @@ class TestMethods(unittest.TestCase):
         self.assertEqual(len(om.get_pos_reds(pos)),630)
         pos = build_hex_array(3,sep=14.7)
         self.assertEqual(len(om.get_pos_reds(pos)),30)
+        self.assertEqual(om.get_pos_reds({0: np.zeros(3)}), [])
+
+    def test_get_pos_red_matches_loop(self):
+        def loop_get_pos_reds(antpos, precisionFactor=1e6):
+            keys = antpos.keys()
+            reds = {}
+            array_is_2D = np.all(np.all(np.array(antpos.values())[:,2]==0))
+            for i,ant1 in enumerate(keys):
+                for ant2 in keys[i+1:]:
+                    delta = tuple((precisionFactor*2.0 * (np.array(antpos[ant1]) - np.array(antpos[ant2]))).astype(int))
+                    if delta[0] > 0 or (delta[0]==0 and delta[1] > 0) or (delta[0]==0 and delta[1]==0 and delta[2] > 0):
+                        bl_pair = (ant1,ant2)
+                    else:
+                        delta = tuple([-d for d in delta])
+                        bl_pair = (ant2,ant1)
+                    p_or_m = (0,-1,1)
+                    if array_is_2D:
+                        epsilons = [[dx,dy,0] for dx in p_or_m for dy in p_or_m]
+                    else:
+                        epsilons = [[dx,dy,dz] for dx in p_or_m for dy in p_or_m for dz in p_or_m]
+                    for epsilon in epsilons:
+                        newKey = (delta[0]+epsilon[0], delta[1]+epsilon[1], delta[2]+epsilon[2])
+                        if reds.has_key(newKey):
+                            reds[newKey].append(bl_pair)
+                            break
+                    if not reds.has_key(newKey):
+                        reds[delta] = [bl_pair]
+            orderedDeltas = [delta for (length,delta) in sorted(zip([np.linalg.norm(delta) for delta in reds.keys()],reds.keys()))]
+            return [reds[delta] for delta in orderedDeltas]
+
+        for pos in [build_hex_array(5), build_linear_array(7)]:
+            self.assertEqual(om.get_pos_reds(pos), loop_get_pos_reds(pos))
+            jittered = {ant: p + 1e-7 * np.random.randn(3) for ant,p in pos.items()}
+            self.assertEqual(om.get_pos_reds(jittered), loop_get_pos_reds(jittered))
+        # coarse precision puts group keys next to each other
+        pos = {ant: p for ant,p in enumerate(np.round(10 * np.random.rand(30,3), 1))}
+        self.assertEqual(om.get_pos_reds(pos, precisionFactor=3), loop_get_pos_reds(pos, precisionFactor=3))
 
 
     def test_add_pol_reds(self):
@@ -157,6 +199,64 @@ class TestMethods(unittest.TestCase):
         self.assertAlmostEqual(.3+2.6j, gains[(1,'x')], 10)
         self.assertAlmostEqual(1.0, gains_out[(1,'x')], 10)
 
+    def test_apply_gains_inplace_and_out(self):
+        antpos = build_linear_array(4)
+        reds = om.get_reds(antpos, pols=['xx'], pol_mode='1pol')
+        gains, true_vis, d = om.sim_red_data(reds, gain_scatter=.1, shape=(2,3))
+        gains.pop((3,'x'))
+        expected = om.divide_by_gains(d, gains)
+        d_in = deepcopy(d)
+        arrays = {k: v for k,v in d_in.items()}
+        out = om.divide_by_gains(d_in, gains, inplace=True)
+        self.assertTrue(out is d_in)
+        for k in d.keys():
+            self.assertTrue(d_in[k] is arrays[k])
+            np.testing.assert_almost_equal(d_in[k], expected[k], 12)
+        bufs = {k: np.zeros_like(v) for k,v in d.items()}
+        out = om.divide_by_gains(d, gains, out=dict(bufs))
+        for k in d.keys():
+            self.assertTrue(out[k] is bufs[k])
+            np.testing.assert_almost_equal(out[k], expected[k], 12)
+        dc = om.DataContainer(d)
+        out = om.divide_by_gains(dc, gains)
+        self.assertTrue(type(out) is om.DataContainer)
+        self.assertEqual(out.pols(), set(['xx']))
+        for k in d.keys():
+            self.assertFalse(out[k] is d[k])
+            np.testing.assert_almost_equal(out[k], expected[k], 12)
+        out_dc = om.DataContainer(dict(bufs))
+        out = om.divide_by_gains(dc, gains, out=out_dc)
+        self.assertTrue(out is out_dc)
+        for k in d.keys():
+            self.assertTrue(out[k] is bufs[k])
+            np.testing.assert_almost_equal(out[k], expected[k], 12)
+        self.assertTrue(type(om.divide_by_gains(d, gains)) is dict)
+
+        bls = d.keys()
+        block = np.array([d[bl] for bl in bls])
+        out = om.divide_by_gains(block, gains, bls=bls)
+        self.assertFalse(out is block)
+        np.testing.assert_almost_equal(out, [expected[bl] for bl in bls], 12)
+        om.multiply_by_gains(out, gains, bls=bls, inplace=True)
+        np.testing.assert_almost_equal(out, block, 12)
+        g2 = {k: v**2 for k,v in gains.items()}
+        gains_out = om.multiply_by_gains(gains, gains, target_type='gain', inplace=True)
+        self.assertTrue(gains_out is gains)
+        for k in g2.keys():
+            np.testing.assert_almost_equal(gains[k], g2[k], 12)
+
+    def test_group_pixels_by_wgts(self):
+        wgts = np.ones((4,6))
+        wgts[1,[0,3]] = 0
+        wgts[2,[2,3]] = 0
+        pixels, grp_wgts = om.group_pixels_by_wgts(wgts)
+        self.assertEqual(len(pixels), 4)
+        self.assertEqual(sorted(np.concatenate(pixels)), range(6))
+        for pix, w in zip(pixels, grp_wgts):
+            for p in pix:
+                np.testing.assert_equal(wgts[:,p], w)
+        self.assertTrue([1,4,5] in [list(pix) for pix in pixels])
+
 
 class TestRedundantCalibrator(unittest.TestCase):
     
@@ -261,6 +361,405 @@ class TestRedundantCalibrator(unittest.TestCase):
                 np.testing.assert_almost_equal(np.angle(d_bl*mdl.conj()), 0, 10)
 
 
+    def test_logcal_array_backend(self):
+        antpos = build_hex_array(3)
+        reds = om.get_reds(antpos, pols=['xx','yy'], pol_mode='2pol')
+        info = om.RedundantCalibrator(reds)
+        gains, true_vis, d = om.sim_red_data(reds, gain_scatter=.05, shape=(3,4))
+        for k in d.keys():
+            d[k] += .01 * om.noise(d[k].shape)
+        w = dict([(k,np.random.uniform(.5,1.,size=(3,4))) for k in d.keys()])
+        for wgts in [{}, w]:
+            sol_ls = info.logcal(d, wgts=wgts)
+            sol = info.logcal(d, wgts=wgts, backend='array')
+            self.assertEqual(set(sol.keys()), set(sol_ls.keys()))
+            for k in sol.keys():
+                self.assertEqual(sol[k].shape, (3,4))
+                np.testing.assert_almost_equal(sol[k], sol_ls[k], 10)
+
+    def test_logcal_array_backend_reuses_factorization(self):
+        antpos = build_hex_array(3)
+        reds = om.get_reds(antpos, pols=['xx'], pol_mode='1pol')
+        info = om.RedundantCalibrator(reds)
+        gains, true_vis, d = om.sim_red_data(reds, gain_scatter=.05, shape=(3,4))
+        sol = info.logcal(d, backend='array')
+        rs = info._get_system(d.keys())
+        AtAi = dict(rs._AtAi)
+        self.assertEqual(len(AtAi), 2)
+        gains, true_vis, d = om.sim_red_data(reds, gain_scatter=.05, shape=(5,6))
+        w = dict([(k,2.) for k in d.keys()])
+        sol = info.logcal(d, wgts=w, backend='array')
+        self.assertTrue(info._get_system(d.keys()) is rs)
+        for k in AtAi.keys():
+            self.assertTrue(rs._AtAi[k] is AtAi[k])
+        sol_ls = info.logcal(d, wgts=w)
+        for k in sol.keys():
+            self.assertEqual(sol[k].shape, (5,6))
+            np.testing.assert_almost_equal(sol[k], sol_ls[k], 10)
+
+    def test_phs_avg(self):
+        antpos = build_hex_array(3)
+        reds = om.get_reds(antpos, pols=['xx','yy'], pol_mode='2pol')
+        info = om.RedundantCalibrator(reds)
+        gains, true_vis, d = om.sim_red_data(reds, gain_scatter=.5, shape=(2,5))
+        d.pop(reds[0][1]) # groups with missing baselines only use those present
+        rs = info._get_system(d.keys())
+        stacked = rs.stack_data(d)
+        phs_avg = rs.phs_avg(stacked)
+        self.assertEqual(phs_avg.shape, (rs.nubls,2,5))
+        for n,ubl in enumerate(rs.ubls):
+            blgrp = [bl for bl in reds[[blgrp[0] for blgrp in reds].index(ubl)] if d.has_key(bl)]
+            expected = np.exp(-1j*np.median(np.unwrap([np.log(d[bl]).imag for bl in blgrp],axis=0), axis=0))
+            np.testing.assert_almost_equal(phs_avg[n], expected, 12)
+
+    def test_compute_chisq(self):
+        antpos = build_hex_array(3)
+        reds = om.get_reds(antpos, pols=['xx','yy'], pol_mode='2pol')
+        info = om.RedundantCalibrator(reds)
+        gains, true_vis, d = om.sim_red_data(reds, gain_scatter=.05, shape=(2,3))
+        sol = deepcopy(gains)
+        sol.update(true_vis)
+        chisq, chisq_per_ant, chisq_per_ubl = info.compute_chisq(d, sol)
+        np.testing.assert_almost_equal(chisq, 0, 10)
+        for k in d.keys():
+            d[k] += .1 * om.noise(d[k].shape)
+        w = dict([(k,np.random.uniform(.5,1.,size=(2,3))) for k in d.keys()])
+        chisq, chisq_per_ant, chisq_per_ubl = info.compute_chisq(d, sol, wgts=w)
+        res2 = {bl: w[bl] * np.abs(d[bl] - sol[(bl[0],bl[2][0])] * sol[(bl[1],bl[2][1])].conj()
+                * sol[blgrp[0]])**2 for blgrp in reds for bl in blgrp}
+        np.testing.assert_almost_equal(chisq, np.sum(res2.values(), axis=0), 10)
+        self.assertEqual(set(chisq_per_ant.keys()), set(gains.keys()))
+        for ant in gains.keys():
+            expected = np.sum([r for bl,r in res2.items() if ant in [(bl[0],bl[2][0]), (bl[1],bl[2][1])]], axis=0)
+            np.testing.assert_almost_equal(chisq_per_ant[ant], expected, 10)
+        self.assertEqual(len(chisq_per_ubl), len(reds))
+        for blgrp in reds:
+            np.testing.assert_almost_equal(chisq_per_ubl[blgrp[0]], np.sum([res2[bl] for bl in blgrp], axis=0), 10)
+
+    def test_system_cache(self):
+        antpos = build_hex_array(3)
+        reds = om.get_reds(antpos, pols=['xx'], pol_mode='1pol')
+        info = om.RedundantCalibrator(reds, cache_size=2)
+        gains, true_vis, d = om.sim_red_data(reds, gain_scatter=.05, shape=(2,3))
+        bls = d.keys()
+        rs = info._get_system(bls)
+        self.assertTrue(info._get_system(bls[::-1]) is rs)
+        self.assertEqual(set(rs.bls), set(bls))
+        rs1 = info._get_system(bls[1:])
+        self.assertFalse(rs1 is rs)
+        self.assertEqual(len(rs1.bls), len(bls) - 1)
+        self.assertTrue(info._get_system(bls) is rs)
+        rs2 = info._get_system(bls[2:])
+        self.assertEqual(len(info._system_cache), 2)
+        self.assertTrue(info._get_system(bls) is rs) # most recently used is kept
+        self.assertFalse(info._get_system(bls[1:]) is rs1) # least recently used was evicted
+        info.clear_cache()
+        self.assertEqual(len(info._system_cache), 0)
+        self.assertFalse(info._get_system(bls) is rs)
+
+    def test_degen_projector_cache(self):
+        antpos = build_hex_array(3)
+        reds = om.get_reds(antpos, pols=['xx','yy'], pol_mode='2pol')
+        info = om.RedundantCalibrator(reds)
+        gains, true_vis, d = om.sim_red_data(reds, gain_scatter=.05, shape=(2,3))
+        sol = deepcopy(gains)
+        sol.update(true_vis)
+        newSol = info.remove_degen(antpos, sol)
+        self.assertEqual(len(info._degen_cache), 2) # one per antpol
+        self.assertEqual(info.pol_mode, '2pol')
+        projs = info._degen_cache.values()
+        sol2 = {k: 2 * v for k,v in sol.items()}
+        newSol2 = info.remove_degen(antpos, sol2)
+        self.assertEqual(len(info._degen_cache), 2)
+        for proj in projs:
+            self.assertTrue(any([proj is p for p in info._degen_cache.values()]))
+        info.clear_cache()
+        self.assertEqual(len(info._degen_cache), 0)
+        for k,v in info.remove_degen(antpos, sol2).items():
+            np.testing.assert_almost_equal(v, newSol2[k], 12)
+        # moving an antenna changes the projectors
+        antpos[0] = antpos[0] + np.array([1., 0, 0])
+        info.remove_degen(antpos, sol)
+        self.assertEqual(len(info._degen_cache), 4)
+
+    def test_freq_chunks(self):
+        antpos = build_hex_array(3)
+        reds = om.get_reds(antpos, pols=['xx'], pol_mode='1pol')
+        info = om.RedundantCalibrator(reds)
+        gains, true_vis, d = om.sim_red_data(reds, gain_scatter=.05, shape=(2,7))
+        for k in d.keys():
+            d[k] += .01 * om.noise(d[k].shape)
+        w = dict([(k,np.random.uniform(.5,1.,size=(2,7))) for k in d.keys()])
+        fc_gains = {ant: np.ones((1,7), dtype=complex) for ant in gains.keys()}
+        for backend in ['linsolve', 'array']:
+            sol0 = info.logcal(d, sol0=fc_gains, wgts=w, backend=backend)
+            meta, sol = info.lincal(d, sol0, wgts=w, backend=backend)
+            for nprocs, chunk_size in [(2, None), (2, 3), (1, 3)]:
+                chunked = om.RedundantCalibrator(reds, nprocs=nprocs, chunk_size=chunk_size)
+                sol0_chunked = chunked.logcal(d, sol0=fc_gains, wgts=w, backend=backend)
+                for k in sol0.keys():
+                    np.testing.assert_almost_equal(sol0_chunked[k], sol0[k], 10)
+                meta_chunked, sol_chunked = chunked.lincal(d, sol0, wgts=w, backend=backend)
+                np.testing.assert_almost_equal(meta_chunked['chisq'], meta['chisq'], 10)
+                self.assertEqual(np.max(meta_chunked['iter']), np.max(meta['iter']))
+                for k in sol.keys():
+                    self.assertEqual(sol_chunked[k].shape, (2,7))
+                    np.testing.assert_almost_equal(sol_chunked[k], sol[k], 10)
+            # a chunked run does not leave the phases of an earlier unchunked run behind
+            info.logcal(d, sol0=fc_gains, wgts=w, backend=backend)
+            self.assertFalse(info.phs_avg is None)
+            info.chunk_size = 3
+            info.logcal(d, sol0=fc_gains, wgts=w, backend=backend)
+            self.assertTrue(info.phs_avg is None)
+            info.chunk_size = None
+
+    def test_split_blocks(self):
+        antpos = build_hex_array(3)
+        reds = om.get_reds(antpos, pols=['xx','yy'], pol_mode='2pol')
+        # a second, disconnected sub-array
+        antpos2 = {ant + 100: pos for ant,pos in build_linear_array(5, sep=10.).items()}
+        reds += om.get_reds(antpos2, pols=['xx'], pol_mode='1pol')
+        info = om.RedundantCalibrator(reds, split_blocks=True)
+        gains, true_vis, d = om.sim_red_data(reds, gain_scatter=.05, shape=(2,3))
+        blocks = om.param_blocks(reds, d.keys())
+        self.assertEqual(len(blocks), 3)
+        self.assertEqual(len(om.param_blocks(reds[:-4], d.keys())), 2)
+        rs = info._get_system(d.keys())
+        self.assertEqual(sorted(sum([bls for bls,prms in blocks], [])), sorted(rs.bls))
+        self.assertEqual(sorted(sum([prms for bls,prms in blocks], [])), sorted(rs.ants + rs.ubls))
+        for bls, prms in blocks:
+            self.assertEqual(set([bl[2] for bl in bls]), set([prm[1] * 2 for prm in prms if len(prm) == 2]))
+        for k in d.keys():
+            d[k] += .01 * om.noise(d[k].shape)
+        joint = om.RedundantCalibrator(reds)
+        for backend in ['linsolve', 'array']:
+            sol0 = joint.logcal(d, backend=backend)
+            meta0, sol1 = joint.lincal(d, sol0, backend=backend)
+            for rc in [info, om.RedundantCalibrator(reds, nprocs=3, split_blocks=True)]:
+                sol = rc.logcal(d, backend=backend)
+                self.assertTrue(rc.phs_avg is None)
+                self.assertEqual(set(sol.keys()), set(sol0.keys()))
+                for k in sol.keys():
+                    np.testing.assert_almost_equal(sol[k], sol0[k], 10)
+                meta, sol = rc.lincal(d, sol0, backend=backend)
+                np.testing.assert_almost_equal(meta['chisq'], meta0['chisq'], 8)
+                for k in sol.keys():
+                    np.testing.assert_almost_equal(sol[k], sol1[k], 8)
+
+    def test_logcal_array_backend_flag_patterns(self):
+        antpos = build_hex_array(3)
+        reds = om.get_reds(antpos, pols=['xx'], pol_mode='1pol')
+        info = om.RedundantCalibrator(reds)
+        gains, true_vis, d = om.sim_red_data(reds, gain_scatter=.05, shape=(4,5))
+        for k in d.keys():
+            d[k] += .01 * om.noise(d[k].shape)
+        w = dict([(k,np.ones((4,5))) for k in d.keys()])
+        w[reds[0][0]][:,1] = 0 # flagged channel
+        w[reds[1][0]][2,:] = 0 # flagged integration
+        w[reds[2][1]][:,1] = 0
+        sol = info.logcal(d, wgts=w, backend='array')
+        sol_ls = info.logcal(d, wgts=w)
+        for k in sol.keys():
+            np.testing.assert_almost_equal(sol[k], sol_ls[k], 10)
+
+    def test_lincal_array_backend(self):
+        antpos = build_hex_array(3)
+        reds = om.get_reds(antpos, pols=['xx'], pol_mode='1pol')
+        info = om.RedundantCalibrator(reds)
+        gains, true_vis, d = om.sim_red_data(reds, gain_scatter=.05, shape=(2,3))
+        sol0 = info.logcal(d)
+        for k in d.keys():
+            d[k] += .01 * om.noise(d[k].shape)
+        w = dict([(k,np.random.uniform(.5,1.,size=(2,3))) for k in d.keys()])
+        for wgts in [{}, w]:
+            meta_ls, sol_ls = info.lincal(d, sol0, wgts=wgts)
+            meta, sol = info.lincal(d, sol0, wgts=wgts, backend='array')
+            self.assertEqual(meta['iter'].shape, (2,3))
+            self.assertEqual(np.max(meta['iter']), meta_ls['iter'])
+            np.testing.assert_almost_equal(meta['chisq'], meta_ls['chisq'], 10)
+            for k in sol.keys():
+                self.assertEqual(sol[k].shape, (2,3))
+                np.testing.assert_almost_equal(sol[k], sol_ls[k], 10)
+
+        gains, true_vis, d = om.sim_red_data(reds, gain_scatter=.05)
+        sol0 = info.logcal(d, backend='array')
+        for k in d.keys():
+            d[k][:,3] += .1 * om.noise(d[k].shape[0]) # a channel that takes longer to converge
+        meta, sol = info.lincal(d, sol0, backend='array', maxiter=10)
+        self.assertEqual(meta['iter'].shape, (10,10))
+        self.assertTrue(np.all(meta['iter'][:,3] > np.max(np.delete(meta['iter'], 3, axis=1))))
+        meta_ls, sol_ls = info.lincal(d, sol0, maxiter=10)
+        np.testing.assert_almost_equal(meta['chisq'], meta_ls['chisq'], 10)
+
+        gains, true_vis, d = om.sim_red_data(reds, gain_scatter=.05)
+        meta, sol = info.lincal(d, info.logcal(d, backend='array'), backend='array')
+        np.testing.assert_almost_equal(meta['chisq'], 0, 10)
+        for bls in reds:
+            for bl in bls:
+                mdl = sol[(bl[0],'x')] * sol[(bl[1],'x')].conj() * sol[bls[0]]
+                np.testing.assert_almost_equal(d[bl], mdl, 10)
+
+        rs = info._get_system(d.keys())
+        dd = rs.stack_data(d)
+        prms0 = rs.stack_sol(info.logcal(d))
+        meta, prms = rs.lincal(dd, prms0)
+        meta_b, prms_b = rs.lincal(dd, prms0, pix_batch=7)
+        np.testing.assert_almost_equal(prms_b, prms, 10)
+        np.testing.assert_array_equal(meta_b['iter'], meta['iter'])
+
+    def test_iterative_solvers(self):
+        antpos = build_hex_array(3)
+        reds = om.get_reds(antpos, pols=['xx'], pol_mode='1pol')
+        info = om.RedundantCalibrator(reds)
+        gains, true_vis, d = om.sim_red_data(reds, gain_scatter=.05, shape=(2,2))
+        for k in d.keys():
+            d[k] += 1e-3 * om.noise(d[k].shape)
+        w = dict([(k,np.random.uniform(.5,1.,size=(2,2))) for k in d.keys()])
+        sol0 = info.logcal(d, wgts=w, backend='array')
+        self.assertEqual(info.solver_meta, {})
+        meta0, sol1 = info.lincal(d, sol0, wgts=w, backend='array')
+        for method in ['lsqr', 'cg']:
+            sol = info.logcal(d, wgts=w, backend='array', method=method)
+            self.assertEqual(info.solver_meta['solver_iter'].shape, (2,2))
+            self.assertTrue(np.all(info.solver_meta['solver_iter'] > 0))
+            # solutions may differ along degeneracies, but the models agree
+            np.testing.assert_almost_equal(info.compute_chisq(d, sol, w)[0], info.compute_chisq(d, sol0, w)[0], 8)
+            meta, sol = info.lincal(d, sol, wgts=w, backend='array', method=method, maxiter=10)
+            np.testing.assert_almost_equal(meta['chisq'], meta0['chisq'], 8)
+            self.assertTrue(np.all(meta['solver_iter'] > 0))
+            self.assertEqual(meta['solver_resnorm'].shape, (2,2))
+        self.assertRaises(ValueError, info.logcal, d, method='lsqr')
+        self.assertRaises(ValueError, info.lincal, d, sol0, method='cg')
+
+    def test_single_precision(self):
+        antpos = build_hex_array(3)
+        reds = om.get_reds(antpos, pols=['xx'], pol_mode='1pol')
+        info = om.RedundantCalibrator(reds)
+        gains, true_vis, d = om.sim_red_data(reds, gain_scatter=.05, shape=(2,3), dtype=np.complex64)
+        for k in d.keys():
+            self.assertEqual(d[k].dtype, np.complex64)
+        d64 = {k: v.astype(np.complex128) for k,v in d.items()}
+        for backend in ['linsolve', 'array']:
+            sol0 = info.logcal(d, backend=backend)
+            meta, sol = info.lincal(d, sol0, backend=backend)
+            sol0_64 = info.logcal(d64, backend=backend)
+            meta_64, sol_64 = info.lincal(d64, sol0_64, backend=backend)
+            for k in sol.keys():
+                self.assertEqual(sol0[k].dtype, np.complex64)
+                self.assertEqual(sol[k].dtype, np.complex64)
+                self.assertEqual(sol_64[k].dtype, np.complex128)
+                np.testing.assert_allclose(sol[k], sol_64[k], rtol=1e-5)
+            for bls in reds:
+                for bl in bls:
+                    mdl = sol[(bl[0],'x')] * sol[(bl[1],'x')].conj() * sol[bls[0]]
+                    self.assertEqual(mdl.dtype, np.complex64)
+                    np.testing.assert_allclose(mdl, d[bl], rtol=1e-5)
+        # an explicit dtype overrides the precision of the data
+        info = om.RedundantCalibrator(reds, dtype=np.complex128)
+        sol0 = info.logcal(d, backend='array')
+        self.assertTrue(all([v.dtype == np.complex128 for v in sol0.values()]))
+
+    def test_array_data_container(self):
+        antpos = build_hex_array(3)
+        reds = om.get_reds(antpos, pols=['xx','yy'], pol_mode='2pol')
+        info = om.RedundantCalibrator(reds)
+        gains, true_vis, d = om.sim_red_data(reds, gain_scatter=.05, shape=(2,3))
+        # store some baselines conjugated
+        d = {(k if k[0] % 2 else (k[1],k[0],k[2])): (v if k[0] % 2 else v.conj()) for k,v in d.items()}
+        dc = om.ArrayDataContainer(d)
+        rs = info._get_system(dc.keys())
+        np.testing.assert_equal(rs.stack_data(dc), rs.stack_data(d))
+        expected = om.divide_by_gains(d, gains)
+        out = om.divide_by_gains(dc, gains)
+        self.assertTrue(isinstance(out, om.ArrayDataContainer))
+        for k in d.keys():
+            np.testing.assert_almost_equal(out[k], expected[k], 12)
+        block = dc.block('xx')
+        self.assertTrue(om.multiply_by_gains(out, gains, inplace=True) is out)
+        self.assertTrue(om.divide_by_gains(dc, gains, out=out) is out)
+        self.assertTrue(dc.block('xx') is block)
+        for k in d.keys():
+            np.testing.assert_almost_equal(out[k], expected[k], 12)
+        for backend in ['linsolve', 'array']:
+            sol0 = info.logcal(dc, backend=backend)
+            meta, sol = info.lincal(dc, sol0, backend=backend)
+            sol0_d = info.logcal(d, backend=backend)
+            meta_d, sol_d = info.lincal(d, sol0_d, backend=backend)
+            for k in sol.keys():
+                np.testing.assert_almost_equal(sol[k], sol_d[k], 10)
+
+    def test_lazy_data_container(self):
+        antpos = build_hex_array(3)
+        reds = om.get_reds(antpos, pols=['xx'], pol_mode='1pol')
+        gains, true_vis, d = om.sim_red_data(reds, gain_scatter=.05, shape=(2,12))
+        outdir = os.path.join(DATA_PATH, 'test_output', 'lazy_redcal')
+        try:
+            write_blocks(om.DataContainer(d), outdir)
+            lazy = LazyDataContainer(outdir, cache_bytes=2 * 4 * 16 * len(d))
+            self.assertEqual(lazy.nbytes(), 2 * 12 * 16 * len(d))
+            info = om.RedundantCalibrator(reds)
+            sol0 = info.logcal(d, backend='array')
+            meta0, sol1 = info.lincal(d, sol0, backend='array')
+            with warnings.catch_warnings(record=True) as w:
+                warnings.simplefilter('always')
+                sol = info.logcal(lazy, backend='array')
+                self.assertEqual(len(w), 1)
+            rc = om.RedundantCalibrator(reds, chunk_size=4)
+            with warnings.catch_warnings(record=True) as w:
+                warnings.simplefilter('always')
+                sol = rc.logcal(lazy, backend='array')
+                meta, sol = rc.lincal(lazy, sol, backend='array')
+                self.assertEqual(len(w), 0)
+            for k in sol1.keys():
+                np.testing.assert_almost_equal(sol[k], sol1[k], 10)
+            chunk = lazy.select_freqs(4, 8)
+            self.assertEqual(chunk.nbytes(), lazy.nbytes() / 3)
+            for k in d.keys():
+                np.testing.assert_equal(chunk[k], d[k][:, 4:8])
+                np.testing.assert_equal(chunk.select_freqs(1, 3)[k], d[k][:, 5:7])
+        finally:
+            if os.path.isdir(outdir):
+                shutil.rmtree(outdir)
+
+    def test_warm_lincal(self):
+        antpos = build_hex_array(3)
+        reds = om.get_reds(antpos, pols=['xx'], pol_mode='1pol')
+        info = om.RedundantCalibrator(reds)
+        gains, true_vis, d = om.sim_red_data(reds, gain_scatter=.05, shape=(1,4))
+        # repeated integrations, so a warm start begins at the converged solution
+        d = {k: np.repeat(v + 1e-3 * om.noise(v.shape), 6, axis=0) for k,v in d.items()}
+        for backend in ['linsolve', 'array']:
+            info.warm_sol = None
+            meta, sol = info.warm_lincal(d, backend=backend)
+            self.assertEqual(meta['iter'].shape, (6,4))
+            np.testing.assert_equal(meta['cold_start'], [True] + [False] * 5)
+            self.assertTrue(np.all(meta['iter_saved'][1:] > 0))
+            for t in range(6):
+                d_t = {k: v[t:t+1] for k,v in d.items()}
+                meta_t, sol_t = info.lincal(d_t, info.logcal(d_t), backend=backend)
+                np.testing.assert_almost_equal(meta['chisq'][t:t+1], meta_t['chisq'], 6)
+            for bls in reds:
+                for bl in bls:
+                    mdl = sol[(bl[0],'x')] * sol[(bl[1],'x')].conj() * sol[bls[0]]
+                    np.testing.assert_almost_equal(d[bl], mdl, 2)
+            # the next file picks up from the last integration
+            meta, sol = info.warm_lincal(d, backend=backend)
+            self.assertFalse(np.any(meta['cold_start']))
+            # a zero tolerance rejects every warm start
+            meta, sol = info.warm_lincal(d, chisq_jump=0, backend=backend)
+            self.assertTrue(np.all(meta['cold_start']))
+            self.assertTrue(np.all(meta['iter_saved'] < 0))
+
+        # a warm start seeded by the user, before any cold start
+        for backend in ['linsolve', 'array']:
+            seeded = om.RedundantCalibrator(reds)
+            seeded.warm_sol = {k: v[-1:] for k,v in sol.items()}
+            meta, sol_s = seeded.warm_lincal(d, chisq_jump=0, backend=backend)
+            self.assertFalse(np.any(meta['cold_start']))
+            np.testing.assert_equal(meta['iter_saved'], 0)
+            for k in sol.keys():
+                np.testing.assert_almost_equal(sol_s[k], sol[k], 6)
+
     def test_lincal_hex_end_to_end_1pol_with_remove_degen_and_firstcal(self):
 
         antpos = build_hex_array(3)
@@ -0,0 +1,102 @@
+'''Tests for simulate.py'''
+
+import unittest
+import os
+import shutil
+import numpy as np
+from pyuvdata import UVData
+import hera_cal.simulate as sim
+import hera_cal.redcal as om
+from hera_cal.data import DATA_PATH
+
+
+class TestMethods(unittest.TestCase):
+
+    def test_hex_array(self):
+        for nants in [19, 37, 127, 350]:
+            antpos = sim.hex_array(nants)
+            self.assertEqual(len(antpos), nants)
+            self.assertEqual(sorted(antpos.keys()), range(nants))
+            np.testing.assert_equal(antpos[0], [0, 0, 0])
+        antpos = sim.hex_array(19, sep=10.)
+        reds = om.get_pos_reds(antpos)
+        self.assertEqual(len(reds), 30)
+        self.assertEqual(sum([len(bls) for bls in reds]), 19 * 18 / 2)
+        np.testing.assert_almost_equal(np.linalg.norm(antpos[1]), 10.)
+
+
+class TestRedundantSimulator(unittest.TestCase):
+
+    def test_iter_chunks(self):
+        s = sim.RedundantSimulator(sim.hex_array(19), pols=['xx', 'yy'], ntimes=3, nfreqs=16)
+        self.assertEqual(s.pol_mode, '2pol')
+        self.assertEqual(len(s.ants), 38)
+        gains = s.true_gains()
+        chunks = list(s.iter_chunks(chunk_size=50))
+        self.assertEqual(len(chunks), int(np.ceil(len(s.bls) / 50.)))
+        data = {}
+        for d, f in chunks:
+            for bl in d.keys():
+                self.assertFalse(bl in data)
+                self.assertEqual(d[bl].dtype, np.complex64)
+                self.assertFalse(np.any(f[bl]))
+                data[bl] = d[bl]
+        self.assertEqual(sorted(data.keys()), sorted(s.bls))
+        for bls in s.reds:
+            for i, j, pol in bls:
+                mdl = gains[(i, pol[0])] * gains[(j, pol[1])].conj() * s.true_vis(bls[0])
+                np.testing.assert_allclose(data[(i, j, pol)], mdl, rtol=1e-6)
+        # the same baselines come out however the chunks are cut
+        for d, f in s.iter_chunks(chunk_size=7, pols=['yy']):
+            for bl in d.keys():
+                self.assertEqual(bl[2], 'yy')
+                np.testing.assert_equal(d[bl], data[bl])
+
+    def test_noise_flags_rfi(self):
+        s = sim.RedundantSimulator(sim.hex_array(7), ntimes=20, nfreqs=100, noise_amp=.1,
+                                   flag_frac=.2, rfi_frac=.05, seed=3)
+        self.assertEqual(len(s.rfi_chans), 5)
+        d, f = next(s.iter_chunks(chunk_size=len(s.bls)))
+        flags = np.array([f[bl] for bl in s.bls])
+        self.assertTrue(np.all(flags[:, :, s.rfi_chans]))
+        self.assertAlmostEqual(flags.mean(), .05 + .95 * .2, 1)
+        good = np.setdiff1d(np.arange(100), s.rfi_chans)
+        bl = s.bls[0]
+        resid = d[bl] - s.gain((bl[0], 'x')) * s.gain((bl[1], 'x')).conj() * s.true_vis(bl)
+        self.assertAlmostEqual(np.std(resid[:, good]), .1, 1)
+        self.assertTrue(np.std(resid[:, s.rfi_chans]) > 10)
+
+    def test_redcal(self):
+        s = sim.RedundantSimulator(sim.hex_array(19), ntimes=2, nfreqs=8, delay_scatter=0.)
+        d, f = next(s.iter_chunks(chunk_size=len(s.bls)))
+        rc = om.RedundantCalibrator(s.reds)
+        sol0 = rc.logcal(d, backend='array')
+        meta, sol = rc.lincal(d, sol0, backend='array')
+        np.testing.assert_almost_equal(meta['chisq'], 0, 6)
+        self.assertEqual(sol[(0, 'x')].dtype, np.complex64)
+
+    def test_write(self):
+        outdir = os.path.join(DATA_PATH, 'test_output', 'simulate')
+        if os.path.exists(outdir):
+            shutil.rmtree(outdir)
+        os.mkdir(outdir)
+        s = sim.RedundantSimulator(sim.hex_array(7), pols=['xx', 'yy'], ntimes=3, nfreqs=16, flag_frac=.1)
+        fns = s.write(outdir, chunk_size=5)
+        self.assertEqual([os.path.basename(fn) for fn in fns],
+                         ['zen.2458000.50000.xx.HH.uv', 'zen.2458000.50000.yy.HH.uv'])
+        self.assertRaises(IOError, s.write, outdir)
+        uvd = UVData()
+        uvd.read_miriad(fns[1])
+        self.assertEqual(uvd.Nbls, len(s.bls) / 2)
+        self.assertEqual(uvd.Ntimes, 3)
+        d, f = next(s.iter_chunks(chunk_size=len(s.bls), pols=['yy']))
+        data = uvd.data_array.reshape(uvd.Ntimes, uvd.Nbls, uvd.Nfreqs)
+        flags = uvd.flag_array.reshape(uvd.Ntimes, uvd.Nbls, uvd.Nfreqs)
+        for n, (i, j) in enumerate(map(uvd.baseline_to_antnums, uvd.baseline_array[:uvd.Nbls])):
+            np.testing.assert_allclose(data[:, n], d[(i, j, 'yy')], rtol=1e-6)
+            np.testing.assert_equal(flags[:, n], f[(i, j, 'yy')])
+        shutil.rmtree(outdir)
+
+
+if __name__ == '__main__':
+    unittest.main()